@@ -1,15 +1,24 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory, Response, stream_with_context, make_response
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, Response, stream_with_context
 import subprocess
 import os
 import json
-from pathlib import Path
+import codecs
+import re
 import datetime
 import threading
 import time
-import shutil
-import signal
-import select
-import requests
+import functools
+import sqlite3
+import uuid
+import urllib.parse
+import zlib
+from collections import deque
+from werkzeug.http import parse_accept_header
+from werkzeug.utils import safe_join
+from asset_store import AssetStore, PublishedDirectory
+from gpte_runner import kill_process_group, process_group_alive, process_start_time, start_gpte_run
+from log_broadcaster import EventHub, LogBroadcasterRegistry, SubscriptionGroup
+from log_events import OPENAI_API_ERROR_PATTERN, LogEventParser, latest_phase_only
 
 app = Flask(__name__, static_folder='static')
 
@@ -21,6 +30,1528 @@ os.makedirs(BASE_PROJECT_DIR, exist_ok=True)
 project_assets_dir = os.path.join(app.static_folder, 'project_assets')
 os.makedirs(project_assets_dir, exist_ok=True)
 
+# Published game files are hardlinks into this content-addressed store, which
+# has to be on the static folder's filesystem (and, in broker mode, shared
+# with the workers like the static folder is)
+ASSET_STORE_DIR = os.environ.get('ASSET_STORE_DIR', os.path.join(app.root_path, 'asset_store'))
+asset_store = AssetStore(ASSET_STORE_DIR)
+
+# Each project's static/project_assets/<project> is a symlink to one complete
+# version of its game under here, swapped whole when the game is republished
+PROJECT_VERSIONS_DIR = os.path.join(app.static_folder, 'project_versions')
+
+# Seconds browsers may keep a file from a versioned game URL, which never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Directories in a project that hold gpt-engineer's own state rather than the
+# game, and are never walked looking for game files
+GAME_SOURCE_SKIP_DIRS = ('.gpteng', 'preprompts', 'memory', 'logs', '.git', 'node_modules', '__pycache__')
+
+# Generation job queue configuration
+# GPTE_MAX_WORKERS bounds how many gpt-engineer runs execute at once and
+# GPTE_MAX_QUEUE_DEPTH bounds how many more may wait for a free worker.
+GPTE_MAX_WORKERS = int(os.environ.get('GPTE_MAX_WORKERS', '2'))
+GPTE_MAX_QUEUE_DEPTH = int(os.environ.get('GPTE_MAX_QUEUE_DEPTH', '20'))
+# How long finished jobs stay queryable through /job_status
+GPTE_JOB_RETENTION_SECONDS = 3600
+# Fork runs from a zygote that already has gpt-engineer imported instead of
+# starting a new interpreter per job (set to 0 to always use a subprocess)
+GPTE_WARM_RUNNER = os.environ.get('GPTE_WARM_RUNNER', '1') != '0'
+
+# Job priority classes, highest first. Chat tweaks from /update_game are
+# interactive, fresh generations are batch work and regenerations background.
+JOB_PRIORITY_CLASSES = ('interactive', 'batch', 'background')
+JOB_KIND_PRIORITY = {'improve': 'interactive', 'generate': 'batch', 'regenerate': 'background'}
+# Per-class cap on running jobs. Batch and background work leave one worker
+# free by default so a chat tweak never waits for a long generation to end.
+GPTE_CLASS_CONCURRENCY = {
+    'interactive': int(os.environ.get('GPTE_MAX_INTERACTIVE_JOBS', GPTE_MAX_WORKERS)),
+    'batch': int(os.environ.get('GPTE_MAX_BATCH_JOBS', max(1, GPTE_MAX_WORKERS - 1))),
+    'background': int(os.environ.get('GPTE_MAX_BACKGROUND_JOBS', max(1, GPTE_MAX_WORKERS - 1)))
+}
+# Starvation protection: a waiting job is promoted by one priority class for
+# every GPTE_PRIORITY_AGING_SECONDS it has spent in the queue
+GPTE_PRIORITY_AGING_SECONDS = int(os.environ.get('GPTE_PRIORITY_AGING_SECONDS', '120'))
+
+# Hard time limits per job phase, in seconds (0 disables a limit). A job left
+# waiting longer than GPTE_QUEUE_TIMEOUT is dropped, and a gpt-engineer run
+# going past the limit for its kind has its whole process group killed.
+GPTE_QUEUE_TIMEOUT = int(os.environ.get('GPTE_QUEUE_TIMEOUT', '1800'))
+GPTE_RUN_TIMEOUTS = {
+    'generate': int(os.environ.get('GPTE_GENERATE_TIMEOUT', '1800')),
+    'regenerate': int(os.environ.get('GPTE_REGENERATE_TIMEOUT', '1800')),
+    'improve': int(os.environ.get('GPTE_IMPROVE_TIMEOUT', '600'))
+}
+# How often the watchdog checks jobs against their time limits
+GPTE_WATCHDOG_INTERVAL = 5
+
+# Durable job state (replacing the old .gpte_done marker files)
+GPTE_JOB_DB = os.environ.get('GPTE_JOB_DB', os.path.join(BASE_PROJECT_DIR, '.gpte_jobs.sqlite3'))
+ACTIVE_JOB_STATES = ('queued', 'running')
+# Jobs still waiting when the server stopped are always queued again on
+# startup; set this to also rerun jobs that were interrupted mid-run
+GPTE_REQUEUE_INTERRUPTED = os.environ.get('GPTE_REQUEUE_INTERRUPTED', '0') == '1'
+# WAL only works when every process using the database is on one machine;
+# use DELETE when workers on other machines share it over a network filesystem
+GPTE_JOB_DB_JOURNAL_MODE = os.environ.get('GPTE_JOB_DB_JOURNAL_MODE', 'WAL')
+
+# 'local' runs gpt-engineer on this server's worker threads; 'broker' only
+# records jobs in the job store for worker.py processes (possibly on other
+# machines sharing the project, static and job store paths) to claim
+GPTE_DISPATCH = os.environ.get('GPTE_DISPATCH', 'local')
+
+# OpenAI quota shared by the runs this process starts. Jobs are admitted
+# while the tokens and requests they are expected to use fit in the last
+# minute's budget; 0 disables a limit.
+GPTE_OPENAI_TPM = int(os.environ.get('GPTE_OPENAI_TPM', '0'))
+GPTE_OPENAI_RPM = int(os.environ.get('GPTE_OPENAI_RPM', '0'))
+# Admissions pause for this long (doubling with each further error, up to
+# the max) when a run reports an OpenAI API error
+GPTE_OPENAI_BACKOFF_SECONDS = int(os.environ.get('GPTE_OPENAI_BACKOFF_SECONDS', '30'))
+GPTE_OPENAI_MAX_BACKOFF_SECONDS = int(os.environ.get('GPTE_OPENAI_MAX_BACKOFF_SECONDS', '600'))
+# Rough number of API calls each kind of run makes, each resending the prompt
+JOB_KIND_REQUESTS = {'generate': 3, 'regenerate': 3, 'improve': 2}
+# Completion tokens assumed for a kind of job until it has some history
+GPTE_DEFAULT_COMPLETION_TOKENS = int(os.environ.get('GPTE_DEFAULT_COMPLETION_TOKENS', '4000'))
+# SSE stream lifecycle: a comment is sent after this many quiet seconds so
+# dead connections are noticed, and streams are closed after going this long
+# without log output or in total. Browsers then reconnect and resume from
+# their last event id.
+SSE_HEARTBEAT_SECONDS = int(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_IDLE_TIMEOUT = int(os.environ.get('SSE_IDLE_TIMEOUT', '600'))
+SSE_MAX_LIFETIME = int(os.environ.get('SSE_MAX_LIFETIME', '3600'))
+# Milliseconds browsers are told to wait before reconnecting
+SSE_RETRY_MS = 3000
+# Gzip the SSE streams for clients that accept it
+SSE_GZIP = os.environ.get('SSE_GZIP', '1') == '1'
+
+# Most log bytes /read_log and /check_project_status return per incremental request
+LOG_READ_MAX_BYTES = int(os.environ.get('LOG_READ_MAX_BYTES', str(256 * 1024)))
+LOG_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class JobStore:
+    """SQLite table recording the state, phase, exit code, timings and output of every job"""
+
+    COLUMNS = ('id', 'project', 'kind', 'priority', 'state', 'phase', 'exit_code', 'error',
+               'created_at', 'started_at', 'finished_at', 'manifest', 'key', 'params', 'pid', 'pid_started', 'worker',
+               'tokens_estimate', 'completion_tokens')
+    # Columns added after the table was first created, with their types
+    ADDED_COLUMNS = {'key': 'TEXT', 'params': 'TEXT', 'pid': 'INTEGER', 'pid_started': 'INTEGER',
+                     'worker': 'TEXT', 'cancel_requested': 'INTEGER NOT NULL DEFAULT 0',
+                     'tokens_estimate': 'INTEGER', 'completion_tokens': 'INTEGER', 'pending_input': 'TEXT'}
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    project TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    priority TEXT,
+                    state TEXT NOT NULL,
+                    phase TEXT,
+                    exit_code INTEGER,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    manifest TEXT
+                )
+            """)
+            existing = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in self.ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_project ON jobs (project, created_at)")
+
+    def _connect(self):
+        # One connection per thread; WAL lets status polls read while jobs write
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={GPTE_JOB_DB_JOURNAL_MODE}")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_dict(self, row):
+        if row is None:
+            return None
+        record = dict(row)
+        record['manifest'] = json.loads(record['manifest']) if record['manifest'] else None
+        record['params'] = json.loads(record['params']) if record['params'] else {}
+        return record
+
+    def record(self, job):
+        """Insert or update the row for an in-memory GenerationJob"""
+        values = (job.id, job.project_name, job.kind, job.priority, job.state, job.phase, job.exit_code,
+                  job.error, job.created_at, job.started_at, job.finished_at,
+                  json.dumps(job.manifest) if job.manifest is not None else None,
+                  job.key, json.dumps(job.params), job.pid, job.pid_started, job.worker,
+                  job.tokens_estimate, job.completion_tokens)
+        # An upsert leaves cancel_requested alone, which other processes may set at any time
+        updates = ', '.join(f"{column} = excluded.{column}" for column in self.COLUMNS[1:])
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))}) "
+                f"ON CONFLICT(id) DO UPDATE SET {updates}",
+                values
+            )
+
+    def record_manual(self, project_name, kind, state='completed', error=None):
+        """Record a finished job for work done outside the queue (sample games, forced loads)"""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, project, kind, state, phase, error, created_at, started_at, finished_at) "
+                "VALUES (?, ?, ?, ?, 'finished', ?, ?, ?, ?)",
+                (job_id, project_name, kind, state, error, now, now, now)
+            )
+        return job_id
+
+    def finish(self, job_id, state, error=None):
+        """Mark a stored job finished without an in-memory GenerationJob"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, phase = 'finished', error = ?, finished_at = ? WHERE id = ?",
+                (state, error, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row)
+
+    def recent_completion_tokens(self, kind, limit=20):
+        """Completion tokens used by the latest completed jobs of a kind"""
+        rows = self._connect().execute(
+            "SELECT completion_tokens FROM jobs WHERE kind = ? AND state = 'completed' AND completion_tokens IS NOT NULL "
+            "ORDER BY finished_at DESC LIMIT ?",
+            (kind, limit)
+        ).fetchall()
+        return [row['completion_tokens'] for row in rows]
+
+    def _active_rows(self, where='', params=()):
+        query = f"SELECT * FROM jobs WHERE state IN ({', '.join('?' * len(ACTIVE_JOB_STATES))})"
+        if where:
+            query += f" AND {where}"
+        rows = self._connect().execute(query + " ORDER BY created_at", ACTIVE_JOB_STATES + tuple(params)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def unfinished(self, worker=None):
+        """Jobs left queued or running by this server (or by the named worker), oldest first"""
+        return self._active_rows("worker IS ?", (worker,))
+
+    def active(self, project_name=None):
+        """Queued or running jobs, optionally for one project, oldest first"""
+        if project_name is None:
+            return self._active_rows()
+        return self._active_rows("project = ?", (project_name,))
+
+    def unclaimed(self):
+        """Queued jobs no worker has claimed yet, oldest first"""
+        return self._active_rows("state = 'queued' AND worker IS NULL")
+
+    def claim(self, job_id, worker):
+        """Atomically hand an unclaimed job to a worker unless its project is busy on another one
+
+        Returns the claimed job's record, or None if someone else got there first.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT project FROM jobs WHERE id = ? AND state = 'queued' AND worker IS NULL", (job_id,)).fetchone()
+            busy = row is not None and conn.execute(
+                f"SELECT 1 FROM jobs WHERE project = ? AND worker IS NOT NULL AND state IN ({', '.join('?' * len(ACTIVE_JOB_STATES))})",
+                (row['project'],) + ACTIVE_JOB_STATES
+            ).fetchone()
+            if row is None or busy:
+                conn.rollback()
+                return None
+            conn.execute("UPDATE jobs SET worker = ? WHERE id = ?", (worker, job_id))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return self.get(job_id)
+
+    def release(self, job_id):
+        """Put a claimed job back on the broker for any worker to pick up"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = 'queued', phase = 'queued', worker = NULL, pid = NULL, pid_started = NULL, "
+                "started_at = NULL, cancel_requested = 0 WHERE id = ?",
+                (job_id,)
+            )
+
+    def cancel_unclaimed(self, job_id):
+        """Cancel a job no worker has claimed yet; False if it has already been claimed"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'cancelled', phase = 'finished', finished_at = ? "
+                "WHERE id = ? AND state = 'queued' AND worker IS NULL",
+                (time.time(), job_id)
+            )
+        return cursor.rowcount == 1
+
+    def request_cancel(self, job_id):
+        """Ask whichever worker holds a job to cancel it"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+
+    def cancel_requests(self, worker):
+        """Ids of a worker's active jobs that have been asked to cancel"""
+        return [record['id'] for record in self._active_rows("worker = ? AND cancel_requested = 1", (worker,))]
+
+    def request_input(self, job_id, text):
+        """Queue a line for the stdin of a job running on a worker"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET pending_input = COALESCE(pending_input, '') || ? WHERE id = ?",
+                         (text + '\n', job_id))
+
+    def take_input_requests(self, worker):
+        """(job id, lines) for a worker's running jobs with queued stdin input, clearing it"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, pending_input FROM jobs WHERE worker = ? AND state = 'running' AND pending_input IS NOT NULL",
+                (worker,)
+            ).fetchall()
+            conn.executemany("UPDATE jobs SET pending_input = NULL WHERE id = ?", [(row['id'],) for row in rows])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return [(row['id'], row['pending_input'].splitlines()) for row in rows]
+
+    def expire_unclaimed(self, cutoff, error):
+        """Time out unclaimed jobs queued before the cutoff"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = 'timed_out', phase = 'finished', error = ?, finished_at = ? "
+                "WHERE state = 'queued' AND worker IS NULL AND created_at < ?",
+                (error, time.time(), cutoff)
+            )
+
+    def latest(self, project_name):
+        """Most recent job recorded for a project, or None"""
+        row = self._connect().execute(
+            "SELECT * FROM jobs WHERE project = ? ORDER BY created_at DESC LIMIT 1", (project_name,)
+        ).fetchone()
+        return self._row_to_dict(row)
+
+
+job_store = JobStore(GPTE_JOB_DB)
+
+
+def generated_files_manifest(project_name):
+    """Files a run left in workspace/generated, stored as the job's output manifest"""
+    generated_dir = os.path.join(BASE_PROJECT_DIR, project_name, 'workspace', 'generated')
+    manifest = []
+    for root, _, files in os.walk(generated_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            manifest.append({"path": os.path.relpath(path, generated_dir), "size": stat.st_size, "mtime": stat.st_mtime})
+    return manifest
+
+
+def estimate_job_tokens(job, store):
+    """Tokens a job is expected to use: its prompt once per API call plus typical completions"""
+    project_dir = os.path.join(BASE_PROJECT_DIR, job.project_name)
+    paths = [os.path.join(project_dir, 'prompt')]
+    preprompts_dir = os.path.join(project_dir, 'preprompts')
+    if os.path.isdir(preprompts_dir):
+        paths += [os.path.join(preprompts_dir, name) for name in os.listdir(preprompts_dir)]
+    if job.kind == 'improve':
+        # Improve runs send the existing code along with the request
+        generated_dir = os.path.join(project_dir, 'workspace', 'generated')
+        paths += [os.path.join(generated_dir, entry['path']) for entry in generated_files_manifest(job.project_name)]
+    prompt_chars = 0
+    for path in paths:
+        try:
+            prompt_chars += os.path.getsize(path)
+        except OSError:
+            pass
+    # About four characters per token
+    prompt_tokens = prompt_chars // 4 + len(job.key or '') // 4
+
+    history = store.recent_completion_tokens(job.kind) if store else []
+    completion_tokens = sum(history) // len(history) if history else GPTE_DEFAULT_COMPLETION_TOKENS
+    return JOB_KIND_REQUESTS.get(job.kind, 1) * prompt_tokens + completion_tokens
+
+
+class OpenAIBudget:
+    """Sliding one-minute token and request budget for admitting gpt-engineer runs
+
+    Jobs are charged their estimates when they start. While a run's output
+    shows OpenAI API errors, admissions back off exponentially.
+    """
+
+    WINDOW_SECONDS = 60
+
+    def __init__(self, tpm_limit, rpm_limit, backoff_seconds, max_backoff_seconds):
+        self.tpm_limit = tpm_limit
+        self.rpm_limit = rpm_limit
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._admitted = deque()  # (time, tokens, requests)
+        self._consecutive_errors = 0
+        self._backoff_until = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._admitted and self._admitted[0][0] <= now - self.WINDOW_SECONDS:
+            self._admitted.popleft()
+
+    def _usage(self):
+        return sum(entry[1] for entry in self._admitted), sum(entry[2] for entry in self._admitted)
+
+    def admits(self, job):
+        """True if the job can start now without going over budget"""
+        now = time.time()
+        with self._lock:
+            if now < self._backoff_until:
+                return False
+            self._expire(now)
+            if not self._admitted:
+                # A job larger than the whole budget still runs on its own
+                return True
+            tokens, requests_made = self._usage()
+            if self.tpm_limit and tokens + (job.tokens_estimate or 0) > self.tpm_limit:
+                return False
+            if self.rpm_limit and requests_made + JOB_KIND_REQUESTS.get(job.kind, 1) > self.rpm_limit:
+                return False
+            return True
+
+    def charge(self, job):
+        with self._lock:
+            self._admitted.append((time.time(), job.tokens_estimate or 0, JOB_KIND_REQUESTS.get(job.kind, 1)))
+
+    def retry_after(self):
+        """Seconds until the budget may admit something new, or None if it isn't holding anything back"""
+        now = time.time()
+        with self._lock:
+            if now < self._backoff_until:
+                return self._backoff_until - now
+            self._expire(now)
+            if not self._admitted:
+                return None
+            return max(0.5, self._admitted[0][0] + self.WINDOW_SECONDS - now)
+
+    def note_api_error(self):
+        with self._lock:
+            delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** self._consecutive_errors)
+            self._consecutive_errors += 1
+            self._backoff_until = max(self._backoff_until, time.time() + delay)
+        print(f"OpenAI API error reported, pausing new gpt-engineer runs for {delay}s")
+
+    def note_success(self):
+        with self._lock:
+            self._consecutive_errors = 0
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            tokens, requests_made = self._usage()
+            return {
+                "tokens_last_minute": tokens,
+                "requests_last_minute": requests_made,
+                "tpm_limit": self.tpm_limit,
+                "rpm_limit": self.rpm_limit,
+                "backoff_seconds": max(0, round(self._backoff_until - now, 1))
+            }
+
+
+openai_budget = OpenAIBudget(GPTE_OPENAI_TPM, GPTE_OPENAI_RPM, GPTE_OPENAI_BACKOFF_SECONDS, GPTE_OPENAI_MAX_BACKOFF_SECONDS)
+
+
+class QueueFullError(Exception):
+    """Raised when the generation queue cannot accept another job"""
+
+
+class GenerationJob:
+    """A single gpt-engineer run waiting for, or occupying, a worker slot"""
+
+    def __init__(self, kind, project_name, target, key=None, priority=None, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.project_name = project_name
+        self.target = target
+        self.priority = priority or JOB_KIND_PRIORITY.get(kind, 'batch')
+        # queued -> running -> publishing -> finished
+        self.phase = 'queued'
+        # Set to 'cancelled' or 'timeout' once the job has been asked to stop
+        self.stop_reason = None
+        self.run = None
+        # Process group of the run, kept so a restarted server can reap it
+        self.pid = None
+        self.pid_started = None
+        # Name of the worker.py process running the job (None when run in-process)
+        self.worker = None
+        self.budget = None
+        self.tokens_estimate = None
+        self.completion_tokens = None
+        self.output_chars = 0
+        self.api_errors = 0
+        self.exit_code = None
+        self.manifest = None
+        self.store = None
+        # Requests with the same kind and key on a project can share this job
+        self.key = key
+        # Extra JSON-serialisable arguments for the target
+        self.params = params or {}
+        self.state = 'queued'
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @classmethod
+    def from_record(cls, record, target=None):
+        """Rebuild a job from its job store record"""
+        job = cls(record['kind'], record['project'], target, record['key'], record['priority'], record['params'])
+        job.id = record['id']
+        for field in ('state', 'phase', 'exit_code', 'error', 'created_at', 'started_at', 'finished_at',
+                      'manifest', 'pid', 'pid_started', 'worker', 'tokens_estimate', 'completion_tokens'):
+            setattr(job, field, record[field])
+        if record.get('cancel_requested'):
+            job.stop_reason = 'cancelled'
+        return job
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    @property
+    def stopped(self):
+        return self.stop_reason is not None
+
+    @property
+    def stop_description(self):
+        return 'timed out' if self.stop_reason == 'timeout' else 'cancelled'
+
+    def save(self):
+        """Write the job's current state through to the job store"""
+        if self.store is None:
+            return
+        try:
+            self.store.record(self)
+        except sqlite3.Error as e:
+            print(f"Error recording job {self.id}: {e}")
+        # Streams following the project learn of state changes without polling for them
+        project_events.publish(self.project_name, ('status', self.state, ''))
+
+    def set_phase(self, phase):
+        self.phase = phase
+        self.save()
+
+    def attach_run(self, run):
+        """Record the job's gpt-engineer run so cancellation and timeouts can kill it"""
+        self.run = run
+        self.pid = run.pid
+        self.pid_started = process_start_time(run.pid)
+        self.save()
+        if self.stopped:
+            run.kill()
+
+    def send_input(self, text):
+        """Write a line to the stdin of the job's gpt-engineer run; False if it isn't running"""
+        run = self.run
+        return run is not None and not self.stopped and run.write_input(text)
+
+    def track_output(self, lines):
+        """Pass a run's output through, measuring it and reporting OpenAI API errors to the budget"""
+        for line in lines:
+            self.output_chars += len(line)
+            if OPENAI_API_ERROR_PATTERN.search(line):
+                self.api_errors += 1
+                if self.budget is not None:
+                    self.budget.note_api_error()
+            yield line
+
+    def stop(self, reason, error=None):
+        """Ask the job to stop, killing its gpt-engineer process group if one is running"""
+        if self.stop_reason is None:
+            self.stop_reason = reason
+            self.error = error or self.error
+        if self.run is not None:
+            self.run.kill()
+
+    def effective_rank(self, now):
+        """Priority class index (lower runs first), reduced the longer the job waits"""
+        rank = JOB_PRIORITY_CLASSES.index(self.priority)
+        if GPTE_PRIORITY_AGING_SECONDS > 0:
+            rank -= (now - self.created_at) / GPTE_PRIORITY_AGING_SECONDS
+        return rank
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "project": self.project_name,
+            "state": self.state,
+            "phase": self.phase,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "manifest": self.manifest,
+            "worker": self.worker,
+            "tokens_estimate": self.tokens_estimate,
+            "completion_tokens": self.completion_tokens
+        }
+
+
+class GenerationJobQueue:
+    """Central queue feeding gpt-engineer runs to a fixed pool of worker threads
+
+    Waiting jobs are started in priority-class order (with aging so low
+    classes can't starve), subject to a cap on running jobs per class. At
+    most one job runs per project at a time; later jobs for a busy project
+    wait in the queue while other projects' jobs are picked up.
+    """
+
+    def __init__(self, max_workers, max_depth, class_limits=None, store=None, budget=None):
+        self.max_workers = max(1, max_workers)
+        self.max_depth = max(0, max_depth)
+        self.class_limits = class_limits or {}
+        self.store = store
+        self.budget = budget
+        self._pending = deque()
+        self._jobs = {}
+        self._running = 0
+        self._running_by_class = {priority: 0 for priority in JOB_PRIORITY_CLASSES}
+        self._busy_projects = set()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._watchdog = None
+
+    def _ensure_workers(self):
+        # Workers are started lazily so importing the app (or the debug
+        # reloader's parent process) doesn't leave idle threads behind
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, name=f"gpte-worker-{len(self._workers) + 1}")
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watchdog_loop, name="gpte-watchdog")
+            self._watchdog.daemon = True
+            self._watchdog.start()
+
+    def submit(self, kind, project_name, target, join_kinds=(), key=None, priority=None, params=None):
+        """Queue a job, or join an in-flight one on the same project
+
+        An active job on the project whose kind is in join_kinds (and whose
+        key matches, when one is given) is returned instead of starting a
+        duplicate run. Returns a (job, joined) tuple and raises
+        QueueFullError if a new job is needed but the queue is saturated.
+        """
+        with self._cond:
+            existing = self.active_job(project_name, join_kinds)
+            if existing and (key is None or existing.key == key):
+                print(f"Joining in-flight {existing.kind} job {existing.id} for project {project_name}")
+                return existing, True
+            if self.is_full():
+                raise QueueFullError(f"Generation queue is full ({len(self._pending)} jobs waiting)")
+            job = GenerationJob(kind, project_name, target, key, priority, params)
+            job.store = self.store
+            job.budget = self.budget
+            job.tokens_estimate = estimate_job_tokens(job, self.store)
+            job.save()
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._ensure_workers()
+            self._cond.notify_all()
+            print(f"Queued {kind} job {job.id} for project {project_name} (position {self.position(job)})")
+            return job, False
+
+    def restore(self, record, target):
+        """Queue a job recorded in the job store again under its original id"""
+        with self._cond:
+            job = GenerationJob(record['kind'], record['project'], target, record['key'], record['priority'], record['params'])
+            job.id = record['id']
+            job.worker = record['worker']
+            job.store = self.store
+            job.budget = self.budget
+            job.tokens_estimate = estimate_job_tokens(job, self.store)
+            job.save()
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._ensure_workers()
+            self._cond.notify_all()
+            print(f"Requeued {job.kind} job {job.id} for project {job.project_name}")
+            return job
+
+    def active_job(self, project_name, kinds=None):
+        """Most recent queued or running job for a project, optionally limited to some kinds"""
+        with self._cond:
+            for job in reversed(list(self._jobs.values())):
+                if job.project_name == project_name and job.active and (kinds is None or job.kind in kinds):
+                    return job
+            return None
+
+    def cancel(self, job_id):
+        """Cancel a job: waiting jobs are dropped, running ones have their process group killed"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or not job.active:
+                return job
+            if job.state == 'queued':
+                self._pending.remove(job)
+                job.stop('cancelled')
+                self._finish_unstarted(job)
+                return job
+        print(f"Cancelling running job {job.id} for project {job.project_name}")
+        job.stop('cancelled')
+        return job
+
+    def send_input(self, job_id, text):
+        """Answer a prompt from a running job's gpt-engineer through its stdin"""
+        job = self._jobs.get(job_id)
+        return job is not None and job.send_input(text)
+
+    def is_full(self):
+        """True when the waiting list is at its limit"""
+        # Workers can be free while jobs wait (class caps, the per-project
+        # hold, the budget), so only the waiting jobs are counted
+        return len(self._pending) >= self.max_depth
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def idle_slots(self):
+        """Workers that neither run nor have a job lined up for them"""
+        with self._cond:
+            return max(0, self.max_workers - self._running - len(self._pending))
+
+    def position(self, job):
+        """1-based position of a waiting job in scheduling order, or 0 once it has a worker"""
+        with self._cond:
+            try:
+                return self._scheduling_order().index(job) + 1
+            except ValueError:
+                return 0
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queued": len(self._pending),
+                "max_queue_depth": self.max_depth,
+                "running_by_class": dict(self._running_by_class),
+                "class_limits": dict(self.class_limits)
+            }
+        if self.budget is not None:
+            stats["openai_budget"] = self.budget.stats()
+        return stats
+
+    def _scheduling_order(self):
+        now = time.time()
+        return sorted(self._pending, key=lambda job: (job.effective_rank(now), job.created_at))
+
+    def _finish_unstarted(self, job):
+        # Caller holds the lock; the job never reached a worker
+        job.state = 'cancelled' if job.stop_reason == 'cancelled' else 'timed_out'
+        job.phase = 'finished'
+        job.finished_at = time.time()
+        job.save()
+        self._cond.notify_all()
+        log_broadcasters.notify(os.path.join(BASE_PROJECT_DIR, job.project_name))
+
+    def _watchdog_loop(self):
+        while True:
+            time.sleep(GPTE_WATCHDOG_INTERVAL)
+            now = time.time()
+            with self._cond:
+                if GPTE_QUEUE_TIMEOUT:
+                    for job in [j for j in self._pending if now - j.created_at > GPTE_QUEUE_TIMEOUT]:
+                        print(f"Job {job.id} timed out after waiting {GPTE_QUEUE_TIMEOUT}s for a worker")
+                        self._pending.remove(job)
+                        job.stop('timeout', f"Timed out waiting {GPTE_QUEUE_TIMEOUT} seconds for a worker")
+                        self._finish_unstarted(job)
+                running = [j for j in self._jobs.values() if j.state == 'running' and not j.stopped]
+            for job in running:
+                limit = GPTE_RUN_TIMEOUTS.get(job.kind)
+                if limit and now - job.started_at > limit:
+                    print(f"Job {job.id} exceeded its {limit}s time limit, killing gpt-engineer")
+                    job.stop('timeout', f"gpt-engineer timed out after {limit} seconds")
+
+    def _prune(self):
+        cutoff = time.time() - GPTE_JOB_RETENTION_SECONDS
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _next_runnable(self):
+        # Highest priority waiting job whose class is under its cap and whose
+        # project doesn't already have a run in flight, provided the OpenAI
+        # budget has room for it (smaller jobs don't jump ahead of it)
+        for job in self._scheduling_order():
+            limit = self.class_limits.get(job.priority, self.max_workers)
+            if self._running_by_class[job.priority] >= limit:
+                continue
+            if job.project_name not in self._busy_projects:
+                if self.budget is not None and not self.budget.admits(job):
+                    return None
+                return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_runnable()
+                while job is None:
+                    # Wake up when the budget frees up even if nothing else changes
+                    self._cond.wait(self.budget.retry_after() if self.budget is not None else None)
+                    job = self._next_runnable()
+                if self.budget is not None:
+                    self.budget.charge(job)
+                self._pending.remove(job)
+                job.state = 'running'
+                job.phase = 'running'
+                job.started_at = time.time()
+                self._running += 1
+                self._running_by_class[job.priority] += 1
+                self._busy_projects.add(job.project_name)
+            job.save()
+
+            print(f"Starting {job.kind} job {job.id} ({job.priority}) for project {job.project_name}")
+            try:
+                job.target(job)
+                state = 'completed'
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                state = 'failed'
+                job.error = job.error or str(e)
+            finally:
+                if job.stop_reason == 'cancelled':
+                    state = 'cancelled'
+                elif job.stop_reason == 'timeout':
+                    state = 'timed_out'
+                if state == 'completed':
+                    job.manifest = generated_files_manifest(job.project_name)
+                    if self.budget is not None and not job.api_errors:
+                        self.budget.note_success()
+                if job.output_chars:
+                    job.completion_tokens = job.output_chars // 4
+                with self._cond:
+                    job.state = state
+                    job.phase = 'finished'
+                    job.finished_at = time.time()
+                    job.save()
+                    self._running -= 1
+                    self._running_by_class[job.priority] -= 1
+                    self._busy_projects.discard(job.project_name)
+                    self._prune()
+                    # Jobs held back behind this project or class can run now
+                    self._cond.notify_all()
+                # Let log streams on the project see the job is over straight away
+                log_broadcasters.notify(os.path.join(BASE_PROJECT_DIR, job.project_name))
+
+
+class BrokerJobQueue:
+    """Job queue for web nodes whose gpt-engineer runs happen in worker.py processes
+
+    Jobs are only written to the job store, which acts as the broker:
+    workers claim them, run them and write their progress back, so
+    everything here is answered from the store. Offers the same interface
+    as GenerationJobQueue.
+    """
+
+    def __init__(self, store, max_depth, class_limits=None):
+        self.store = store
+        self.max_depth = max(0, max_depth)
+        self.class_limits = class_limits or {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, project_name, target, join_kinds=(), key=None, priority=None, params=None):
+        """Record a job for the workers, or join an in-flight one on the same project"""
+        with self._lock:
+            existing = self.active_job(project_name, join_kinds)
+            if existing and (key is None or existing.key == key):
+                print(f"Joining in-flight {existing.kind} job {existing.id} for project {project_name}")
+                return existing, True
+            if self.is_full():
+                raise QueueFullError(f"Generation queue is full ({len(self.store.unclaimed())} jobs waiting)")
+            # Workers pick the target for the job's kind from JOB_RUNNERS
+            job = GenerationJob(kind, project_name, None, key, priority, params)
+            job.store = self.store
+            job.save()
+            print(f"Queued {kind} job {job.id} for project {project_name} on the broker (position {self.position(job)})")
+            return job, False
+
+    def active_job(self, project_name, kinds=None):
+        for record in reversed(self.store.active(project_name)):
+            if kinds is None or record['kind'] in kinds:
+                return GenerationJob.from_record(record)
+        return None
+
+    def cancel(self, job_id):
+        """Cancel a job: unclaimed jobs are dropped, claimed ones are flagged for their worker"""
+        record = self.store.get(job_id)
+        if record is None:
+            return None
+        job = GenerationJob.from_record(record)
+        if not job.active:
+            return job
+        if self.store.cancel_unclaimed(job_id):
+            job = GenerationJob.from_record(self.store.get(job_id))
+            job.stop_reason = 'cancelled'
+            return job
+        job.stop_reason = 'cancelled'
+        print(f"Asking worker {job.worker} to cancel job {job.id} for project {job.project_name}")
+        self.store.request_cancel(job_id)
+        return job
+
+    def send_input(self, job_id, text):
+        """Pass a line for a running job's stdin to the worker that runs it"""
+        record = self.store.get(job_id)
+        if record is None or record['state'] != 'running':
+            return False
+        self.store.request_input(job_id, text)
+        return True
+
+    def is_full(self):
+        return len(self.store.unclaimed()) >= self.max_depth
+
+    def get(self, job_id):
+        record = self.store.get(job_id)
+        return GenerationJob.from_record(record) if record else None
+
+    def position(self, job):
+        """1-based position of an unclaimed job in scheduling order, or 0 once a worker has it"""
+        order = [j.id for j in self._scheduling_order()]
+        return order.index(job.id) + 1 if job.id in order else 0
+
+    def stats(self):
+        active = self.store.active()
+        running_by_class = {priority: 0 for priority in JOB_PRIORITY_CLASSES}
+        for record in active:
+            if record['state'] == 'running':
+                running_by_class[record['priority']] += 1
+        return {
+            "dispatch": "broker",
+            "workers": len({record['worker'] for record in active if record['worker']}),
+            "running": sum(running_by_class.values()),
+            "queued": len([record for record in active if record['state'] == 'queued']),
+            "max_queue_depth": self.max_depth,
+            "running_by_class": running_by_class,
+            "class_limits": dict(self.class_limits)
+        }
+
+    def _scheduling_order(self):
+        now = time.time()
+        jobs = [GenerationJob.from_record(record) for record in self.store.unclaimed()]
+        return sorted(jobs, key=lambda job: (job.effective_rank(now), job.created_at))
+
+
+if GPTE_DISPATCH == 'broker':
+    job_queue = BrokerJobQueue(job_store, GPTE_MAX_QUEUE_DEPTH, GPTE_CLASS_CONCURRENCY)
+else:
+    job_queue = GenerationJobQueue(GPTE_MAX_WORKERS, GPTE_MAX_QUEUE_DEPTH, GPTE_CLASS_CONCURRENCY, job_store, openai_budget)
+
+# Fresh generations and regenerations of a project are interchangeable, so a
+# second request for either joins whichever one is already in flight
+REGENERATION_JOB_KINDS = ('generate', 'regenerate')
+
+_project_locks = {}
+_project_locks_guard = threading.Lock()
+
+
+def project_job_state(project_name):
+    """State of a project's latest job (None if it never had one), read from memory before the job store"""
+    job = job_queue.active_job(project_name)
+    if job:
+        return job.state
+    record = job_store.latest(project_name)
+    return record['state'] if record else None
+
+
+def project_generation_finished(project_name):
+    """True once no job for the project is queued or running"""
+    return project_job_state(project_name) not in ACTIVE_JOB_STATES
+
+
+def project_finished_state(project_name):
+    """None while a project's job is queued or running, else how it ended ('completed' if it never had one)"""
+    state = project_job_state(project_name)
+    if state in ACTIVE_JOB_STATES:
+        return None
+    return state or 'completed'
+
+
+def send_gpte_input(project_name, text, job_id=None):
+    """Write a line to the stdin of a project's running gpt-engineer; the job it went to, or None"""
+    job = job_queue.get(job_id) if job_id else job_queue.active_job(project_name)
+    if job is None or job.project_name != project_name or not job_queue.send_input(job.id, text):
+        return None
+    return job
+
+
+_auto_answered = {}
+_auto_answered_lock = threading.Lock()
+
+
+def auto_answer_prompt(project_name, log_offset):
+    """Answer 'y' to the prompt ending at log_offset, once however many streams saw it"""
+    with _auto_answered_lock:
+        if _auto_answered.get(project_name) == log_offset:
+            return False
+        _auto_answered[project_name] = log_offset
+    return send_gpte_input(project_name, 'y') is not None
+
+
+def auto_answer_live_prompts(project_name, log_events, log_offset, live_from):
+    """Answer the prompts among new (not replayed) log events; the note to show if one was answered"""
+    if log_offset <= live_from or not any(e['type'] == 'prompt' for e in log_events):
+        return ''
+    if auto_answer_prompt(project_name, log_offset):
+        return "\n> [AUTO] Automatically responding 'y' to prompt...\n"
+    return ''
+
+
+def project_status(project_name):
+    """How a project's latest job stands, as sent in /project_events status messages"""
+    job = job_queue.active_job(project_name)
+    record = None if job else job_store.latest(project_name)
+    if job:
+        status = {"status": "generating", "state": job.state, "job_id": job.id,
+                  "message": "Waiting for a free generation slot" if job.state == 'queued' else "Generation in progress"}
+    elif record and record['state'] in ('failed', 'cancelled', 'timed_out'):
+        status = {"status": "failed", "state": record['state'], "job_id": record['id'],
+                  "message": record['error'] or f"Generation {record['state'].replace('_', ' ')}"}
+    elif published_game_assets(project_name):
+        status = {"status": "completed", "state": record['state'] if record else None,
+                  "job_id": record['id'] if record else None, "message": "Game files ready"}
+    else:
+        status = {"status": "idle", "state": record['state'] if record else None,
+                  "job_id": record['id'] if record else None, "message": "No game generated yet"}
+    return {"type": "status", "project": project_name, **status}
+
+
+def published_directory(project_name):
+    """The project's static/project_assets directory, published a version at a time"""
+    return PublishedDirectory(os.path.join(app.static_folder, 'project_assets', project_name),
+                              os.path.join(PROJECT_VERSIONS_DIR, project_name), asset_store)
+
+
+def published_game_assets(project_name):
+    """The game files published to static/project_assets and the URL to play them from, or None"""
+    published = published_directory(project_name)
+    current = published.current()
+    if current:
+        # Played from the version's own directory, so every file the game
+        # loads comes from the same publish even if another lands meanwhile
+        assets_dir = published.version_path(current)
+        base_url = f"/static/project_versions/{project_name}/{current}"
+    else:
+        # Published before versioning and not since
+        assets_dir = published.path
+        base_url = f"/static/project_assets/{project_name}"
+    files = []
+    version = 0
+    for root, _, filenames in os.walk(assets_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            try:
+                version = max(version, os.stat(path).st_mtime_ns)
+            except OSError:
+                continue
+            files.append(os.path.relpath(path, assets_dir).replace(os.sep, '/'))
+    pages = sorted(f for f in files if f.endswith('.html'))
+    if not pages:
+        return None
+    entry = 'index.html' if 'index.html' in pages else pages[0]
+    if current:
+        return {"type": "assets", "project": project_name, "files": sorted(files), "version": current,
+                "url": f"{base_url}/{entry}"}
+    # The version changes with every publish, so the page knows to reload the game
+    return {"type": "assets", "project": project_name, "files": sorted(files), "version": str(version),
+            "url": f"{base_url}/{entry}?v={version}"}
+
+
+def game_file_locations(project_name):
+    """Where /play/<project>/ looks for a file, highest priority first"""
+    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
+    return [
+        # Where we copy generated files
+        os.path.join(app.static_folder, 'project_assets', project_name),
+        # Where gpt-engineer puts files
+        os.path.join(project_dir, 'workspace', 'generated'),
+        # Alternative location
+        os.path.join(project_dir, 'workspace'),
+        # Where our template was
+        project_dir,
+    ]
+
+
+class GameFileTable:
+    """Which file each /play/<project>/ path is served from, resolved once per publish
+
+    A project's table maps every file in game_file_locations() to the one
+    that wins the locations' priority order, so serving a game asset is a
+    lookup rather than a probe of each location. A table is rebuilt after
+    invalidate(), which publishing calls, and when the project's published
+    version changes, which also catches publishes by other processes.
+    Paths not in the table are left to the caller to probe for, since files
+    can appear in the project between publishes, and so are paths whose file
+    has gone since, which also drops the table.
+    """
+
+    def __init__(self):
+        # project -> (published version, {path: absolute path})
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, project_name, file_path):
+        """Absolute path of the file served at file_path, or None if the table doesn't know it"""
+        version = published_directory(project_name).current()
+        with self._lock:
+            table = self._tables.get(project_name)
+        if table is None or table[0] != version:
+            table = (version, self._build(project_name))
+            # Not kept for projects without files, e.g. a mistyped name
+            if table[1]:
+                with self._lock:
+                    self._tables[project_name] = table
+        path = table[1].get(file_path)
+        # Workspace files can be deleted between publishes; the table is
+        # rebuilt next time and the caller probes for the path meanwhile
+        if path and not os.path.isfile(path):
+            self.invalidate(project_name)
+            return None
+        return path
+
+    def invalidate(self, project_name):
+        with self._lock:
+            self._tables.pop(project_name, None)
+
+    def _build(self, project_name):
+        paths = {}
+        # Lowest priority first, so a file in a higher one replaces it
+        for location in reversed(game_file_locations(project_name)):
+            # Resolving the published symlink ties the table to the version
+            location = os.path.realpath(location)
+            for path, rel_path in walk_game_files(location):
+                paths[rel_path.replace(os.sep, '/')] = path
+        return paths
+
+
+game_files = GameFileTable()
+
+
+def send_game_file(path, immutable=False, mimetype=None):
+    """send_file with a strong ETag from the file's content hash, answering conditional GETs with 304
+
+    Files are revalidated on every use, which costs a 304 when they haven't
+    changed, unless immutable says the URL is a versioned one that never
+    changes, which browsers may cache outright.
+    """
+    response = send_file(path, mimetype=mimetype, etag=asset_store.digest(path), conditional=True,
+                         max_age=IMMUTABLE_MAX_AGE if immutable else None)
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+def game_assets_changed(project_name):
+    """Tell viewers and the /play/ path table that a project's game was (re)published"""
+    game_files.invalidate(project_name)
+    project_events.publish(project_name, ('assets', None, ''))
+
+
+# One tailer per followed log file, shared by every SSE stream watching it.
+# Local jobs wake their project's tailers when they finish, so the job state
+# only needs an occasional safety re-check; jobs run by workers don't, so it
+# is polled more often in broker mode.
+LOG_STATE_POLL_INTERVAL = 2 if GPTE_DISPATCH == 'broker' else 30
+log_broadcasters = LogBroadcasterRegistry(LOG_STATE_POLL_INTERVAL)
+# Job status changes and newly published game files, by project, for /project_events
+project_events = EventHub()
+
+
+def sse_resume_offset(last_event_id=None):
+    """Log offset a reconnecting EventSource last saw (its Last-Event-ID), or None for a new stream
+
+    Reads the current Flask request unless the id is passed in.
+    """
+    if last_event_id is None:
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(last_event_id) if last_event_id else None
+    except ValueError:
+        return None
+
+
+def project_lock(project_name):
+    """Re-entrant lock serializing publishing/copying for a single project"""
+    with _project_locks_guard:
+        lock = _project_locks.get(project_name)
+        if lock is None:
+            lock = _project_locks[project_name] = threading.RLock()
+        return lock
+
+
+def walk_game_files(base_dir):
+    """(path, relative path) of each file under base_dir, skipping GAME_SOURCE_SKIP_DIRS"""
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = [name for name in dirs if name not in GAME_SOURCE_SKIP_DIRS]
+        for filename in files:
+            path = os.path.join(root, filename)
+            yield path, os.path.relpath(path, base_dir)
+
+
+def queue_full_response(project_name):
+    """Standard 429 response for when the generation queue is saturated"""
+    stats = job_queue.stats()
+    response = jsonify({
+        "status": "error",
+        "message": f"The generation queue is full ({stats['queued']} jobs waiting). Please try again shortly.",
+        "project": project_name,
+        "queue": stats
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = '30'
+    return response
+
+
+def job_response_fields(job, joined=False):
+    """Job id and queue position fields added to every job-starting response"""
+    position = job_queue.position(job)
+    return {
+        "job_id": job.id,
+        "queue_position": position,
+        "queued": position > 0,
+        "joined": joined
+    }
+
+
+def read_gpte_api_key(gpte_repo):
+    """OPENAI_API_KEY from the gpt-engineer repo's .env file, or None"""
+    env_path = os.path.join(gpte_repo, '.env')
+    if not os.path.exists(env_path):
+        return None
+    try:
+        with open(env_path, 'r') as f:
+            for line in f:
+                if line.strip().startswith('OPENAI_API_KEY='):
+                    return line.strip().split('=', 1)[1]
+    except Exception as e:
+        print(f"Error reading .env file: {e}")
+    return None
+
+
+# Queue targets. They only rely on the job (project, key and params) so a
+# job recorded in the job store can be run again after a restart.
+
+def run_generate_job(job):
+    """Run gpt-engineer on a project created by /create_project"""
+    project_name = job.project_name
+    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
+    gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
+    api_key = read_gpte_api_key(gpte_repo)
+    if not api_key:
+        raise RuntimeError("OpenAI API key not found")
+    
+    # Get log file path
+    log_file_path = os.path.join(project_dir, 'gpt_engineer.log')
+    print(f"Log file will be written to: {log_file_path}")
+
+    # Open the log file for appending
+    with open(log_file_path, 'a') as log_file:
+        # Create the command with environment variables properly exported
+        cmd = f"cd {gpte_repo} && OPENAI_API_KEY='{api_key}' python -m gpt_engineer.applications.cli.main \"{project_dir}\" --temperature 0.7 --verbose"
+        log_file.write(f"Executing command: {cmd}\n")
+        print(f"Executing command: {cmd}")
+
+        try:
+            # First log the API key check for debugging (without exposing the full key)
+            key_prefix = api_key[:4] if api_key else "None"
+            log_file.write(f"API Key check: {key_prefix}...\n")
+            print(f"API Key check: {key_prefix}...")
+
+            # Verify the project directory exists
+            if not os.path.exists(project_dir):
+                error_msg = f"Project directory does not exist: {project_dir}"
+                log_file.write(f"ERROR: {error_msg}\n")
+                print(f"ERROR: {error_msg}")
+            else:
+                log_file.write(f"Project directory exists: {project_dir}\n")
+                print(f"Project directory exists: {project_dir}")
+
+            # Verify GPT Engineer repo exists
+            if not os.path.exists(gpte_repo):
+                error_msg = f"GPT Engineer repo does not exist: {gpte_repo}"
+                log_file.write(f"ERROR: {error_msg}\n")
+                print(f"ERROR: {error_msg}")
+            else:
+                log_file.write(f"GPT Engineer repo exists: {gpte_repo}\n")
+                print(f"GPT Engineer repo exists: {gpte_repo}")
+
+            # Set up the environment with the API key
+            env = os.environ.copy()
+            env['OPENAI_API_KEY'] = api_key
+
+            # Run gpt-engineer with the environment variables and capture output in real-time
+            process = start_gpte_run(gpte_repo, project_dir, ['--temperature', '0.7', '--verbose'], env, warm=GPTE_WARM_RUNNER)
+            job.attach_run(process)
+
+            # Read output line by line as it happens
+            for line in job.track_output(process.output_lines()):
+                line = line.rstrip()
+                print(f"GPT Engineer output: {line}")
+                log_file.write(f"{line}\n")
+                log_file.flush()  # Ensure content is written immediately
+
+            # Wait for process to complete
+            return_code = process.wait()
+            job.exit_code = return_code
+
+            if job.stopped:
+                print(f"GPT Engineer process {job.stop_description}")
+                log_file.write(f"\n⛔ Game generation {job.stop_description}\n")
+            elif return_code == 0:
+                print("GPT Engineer process completed successfully")
+                log_file.write("\n✅ Game generation complete!\n")
+
+                # Copy generated files to static
+                job.set_phase('publishing')
+                copy_generated_files_to_static(project_name, project_dir)
+            else:
+                raise RuntimeError(f"GPT Engineer process failed with return code {return_code}")
+
+        except Exception as e:
+            print(f"Error running GPT Engineer: {e}")
+            log_file.write(f"\nError: {str(e)}\n")
+            # Let the queue record the job as failed
+            raise
+
+
+def run_regenerate_job(job):
+    """Regenerate a project's game from its prompt file for /run_gpte"""
+    project_name = job.project_name
+    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
+    gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
+    api_key = read_gpte_api_key(gpte_repo)
+    if not api_key:
+        raise RuntimeError("OpenAI API key not found")
+    log_file = os.path.join(project_dir, 'gpt_engineer.log')
+
+    # Update the prompt file if /run_gpte was given a new prompt
+    prompt = job.params.get('prompt')
+    if prompt:
+        print(f"[GPT ENGINEER] Updating prompt file with new prompt: {prompt}")
+        
+        # Enhanced prompt with very specific instructions for Three.js
+        enhanced_prompt = f"Create a 3D game using Three.js with the following specifications:\n\n{prompt}\n\nREQUIREMENTS:\n- Use Three.js library\n- Create a web-based 3D game that runs in the browser\n- Include index.html as the main entry point\n- Use JavaScript for game logic\n- Make sure the game initializes properly without errors\n- Add clear user controls/instructions\n- Include proper lighting and camera setup"
+        with open(os.path.join(project_dir, 'prompt'), 'w') as f:
+            f.write(enhanced_prompt)
+    
+    # Start the project log afresh for this run
+    with open(log_file, 'w') as f:
+        f.write(f"Starting GPT Engineer for project: {project_name}\n")
+        f.write(f"Start time: {datetime.datetime.now()}\n")
+        f.write("Initializing game generation...\n")
+    
+    try:
+        # Set up environment with API key
+        env_vars = os.environ.copy()
+        env_vars['OPENAI_API_KEY'] = api_key
+
+        # Log the command we're about to run (without API key)
+        print(f"Running command: cd {gpte_repo} && python -m gpt_engineer.applications.cli.main \"{project_dir}\" --temperature 0.7")
+
+        # Start gpt-engineer with real-time output capture
+        process = start_gpte_run(gpte_repo, project_dir, ['--temperature', '0.7'], env_vars, warm=GPTE_WARM_RUNNER)
+        job.attach_run(process)
+
+        # Capture and log output in real-time
+        with open(log_file, 'a') as log_f:
+            for output in job.track_output(process.output_lines()):
+                log_f.write(output)
+                log_f.flush()
+                print(output.strip())
+        job.exit_code = process.wait()
+
+        if job.stopped:
+            # Don't publish whatever half-written files the run left behind
+            with open(log_file, 'a') as log_f:
+                log_f.write(f"\n⛔ Game regeneration {job.stop_description}\n")
+            print(f"GPT Engineer process {job.stop_description}")
+            return
+
+        if job.exit_code != 0:
+            raise RuntimeError(f"GPT Engineer process failed with return code {job.exit_code}")
+
+        # Copy generated files to the static directory for serving
+        job.set_phase('publishing')
+        copy_generated_files_to_static(project_name, project_dir)
+        print("GPT Engineer process completed successfully")
+
+    except Exception as e:
+        print(f"Error running GPT Engineer: {e}")
+        with open(log_file, 'a') as f:
+            f.write(f"\nError: {str(e)}\n")
+        raise
+
+
+def run_improve_job(job):
+    """Apply an /update_game modification (the job key) with gpt-engineer -i"""
+    project_name = job.project_name
+    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
+    modification = job.key
+    gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
+    api_key = read_gpte_api_key(gpte_repo)
+    if not api_key:
+        raise RuntimeError("OpenAI API key not found")
+    env_vars = os.environ.copy()
+    env_vars['OPENAI_API_KEY'] = api_key
+    log_file = job.params['log_file']
+    main_log_file = os.path.join(project_dir, 'gpt_engineer.log')
+    
+    print(f"Starting gpt-engineer for project: {project_name}")
+    print(f"Modification: {modification}")
+
+    # Written here rather than by /update_game, so each run (including one
+    # requeued after a restart) reads its own modification
+    prompt_path = os.path.join(project_dir, "prompt")
+    current_prompt = ""
+    if os.path.exists(prompt_path):
+        with open(prompt_path, 'r') as f:
+            current_prompt = f.read()
+    
+    # Create a new prompt file that incorporates the modification request
+    new_prompt = f"{current_prompt}\n\nMODIFICATION REQUEST: {modification}\n"
+    new_prompt += "Please modify the existing game code based on this request. Keep all existing functionality intact unless specifically asked to change it."
+    with open(prompt_path, 'w') as f:
+        f.write(new_prompt)
+    
+    # Log command details (without API key)
+    safe_cmd = f"cd {gpte_repo} && OPENAI_API_KEY='***' python -m gpt_engineer.applications.cli.main \"{project_dir}\" -i --temperature 0.7 --verbose"
+    print(f"Running gpt-engineer to modify game: {safe_cmd}")
+    
+    # Write a header to the log file to make it easier to parse
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    with open(log_file, 'w') as f:
+        f.write("===== GPT ENGINEER MODIFICATION LOG START =====\n")
+        f.write(f"Running command: {safe_cmd}\n")
+        f.write(f"Start time: {datetime.datetime.now()}\n")
+        f.write(f"Modification request: {modification}\n")
+        f.write(f"API key found: Yes, length={len(api_key)}\n")
+        f.write(f"Project directory: {project_dir} (exists: {os.path.exists(project_dir)})\n")
+        f.write(f"gpt-engineer repo: {gpte_repo} (exists: {os.path.exists(gpte_repo)})\n")
+        f.write("===== COMMAND OUTPUT =====\n")
+    
+    # The project log is what /stream_logs and /read_log follow, so the
+    # modification run is announced (and later mirrored) there as well
+    with open(main_log_file, 'a') as f:
+        f.write(f"\n===== Modification started at {datetime.datetime.now()} =====\n")
+        f.write(f"Modification request: {modification}\n")
+    
+    # Create a pre-selected file configuration to bypass file selection
+    toml_dir = os.path.join(project_dir, '.gpteng')
+    os.makedirs(toml_dir, exist_ok=True)
+    with open(os.path.join(toml_dir, 'file_selection.toml'), 'w') as f:
+        f.write("selected = ['*']")  # Select all files by default
+    
+    # Create or update the improve.txt file to be read by our modified gpt-engineer
+    with open(os.path.join(project_dir, 'improve.txt'), 'w') as improve_file:
+        improve_file.write(modification)
+
+    # No need for printf with our modified source code
+    process = start_gpte_run(gpte_repo, project_dir, ['-i', '--temperature', '0.7', '--verbose'], env_vars, warm=GPTE_WARM_RUNNER)
+    # The queue watchdog kills the run if it goes past the improve time limit
+    job.attach_run(process)
+
+    # Process output in real-time while writing to both log files
+    with open(log_file, 'a') as update_log, open(main_log_file, 'a') as main_log:
+        try:
+            for output in job.track_output(process.output_lines()):
+                update_log.write(output)
+                update_log.flush()
+                main_log.write(output)
+                main_log.flush()
+                print(output.strip())
+        except IOError as e:
+            print(f"Error processing output: {e}")
+            update_log.write(f"\nError processing output: {e}\n")
+
+        return_code = process.wait()
+        job.exit_code = return_code
+        if job.stopped:
+            main_log.write(f"\n⛔ Modification {job.stop_description}\n")
+        update_log.write(f"\n===== Process exited with code: {return_code} =====\n")
+        main_log.write(f"\n===== Modification process exited with code: {return_code} =====\n")
+
+    process_completed = return_code == 0 and not job.stopped
+    if job.stopped:
+        print(f"gpt-engineer modification {job.stop_description}")
+        return
+
+    # Copy generated files to the static directory for serving; a failure
+    # fails the job rather than leaving it completed with nothing published
+    job.set_phase('publishing')
+    copy_generated_files_to_static(project_name, project_dir)
+
+    if not process_completed:
+        raise RuntimeError(f"gpt-engineer exited with code {return_code}")
+
+
+JOB_RUNNERS = {
+    'generate': run_generate_job,
+    'regenerate': run_regenerate_job,
+    'improve': run_improve_job
+}
+
+
+def reap_interrupted_run(record):
+    """Kill what is left of a stored job's gpt-engineer process group"""
+    pid = record['pid']
+    if not pid or not process_group_alive(pid):
+        return False
+    # A different start time means the pid now belongs to an unrelated process
+    if record['pid_started'] is not None and process_start_time(pid) not in (None, record['pid_started']):
+        return False
+    # Its output pipe went with the old server, so the run can't be followed any more
+    print(f"Killing orphaned gpt-engineer process group {pid} of job {record['id']}")
+    return kill_process_group(pid)
+
+
+def reconcile_interrupted_jobs(worker=None):
+    """Settle jobs a previous server (or worker.py process of this name) left queued or running
+
+    Waiting jobs are queued again. Interrupted runs have any surviving
+    process group killed and are marked failed, or rerun when
+    GPTE_REQUEUE_INTERRUPTED is set. A worker hands jobs it reruns back to
+    the broker rather than keeping them.
+    """
+    for record in job_store.unfinished(worker):
+        was_running = record['state'] == 'running'
+        if was_running:
+            reap_interrupted_run(record)
+        target = JOB_RUNNERS.get(record['kind'])
+        if target and (not was_running or GPTE_REQUEUE_INTERRUPTED):
+            if worker:
+                job_store.release(record['id'])
+            else:
+                job_queue.restore(record, target)
+        else:
+            print(f"Marking interrupted {record['kind']} job {record['id']} for project {record['project']} as failed")
+            job_store.finish(record['id'], 'failed', "Interrupted by a server restart")
+
+
 @app.route('/')
 def index():
     # Get list of existing projects
@@ -40,6 +1571,20 @@ def create_project():
     if not project_name or not prompt:
         return jsonify({"status": "error", "message": "Project name and prompt are required"}), 400
     
+    # A project that is already being worked on is joined rather than wiped
+    active_job = job_queue.active_job(project_name)
+    if active_job:
+        return jsonify({
+            "status": "success",
+            "message": "Game generation is already in progress for this project",
+            "project": project_name,
+            **job_response_fields(active_job, joined=True)
+        })
+    
+    # Refuse early when saturated so we don't wipe a project we can't regenerate
+    if job_queue.is_full():
+        return queue_full_response(project_name)
+    
     # Create project directory
     project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
     
@@ -122,10 +1667,6 @@ The game should run directly in a browser without requiring a build step or serv
     # Create a basic working Three.js template directly in the project directory
     create_basic_threejs_template(project_dir, prompt)
     
-    # Create a static assets directory for this project
-    static_project_dir = os.path.join(app.static_folder, 'project_assets', project_name)
-    os.makedirs(static_project_dir, exist_ok=True)
-    
     # Create an empty log file for the GPT Engineer process to write to
     log_file = os.path.join(project_dir, 'gpt_engineer.log')
     with open(log_file, 'w') as f:
@@ -135,118 +1676,33 @@ The game should run directly in a browser without requiring a build step or serv
         
 
     
-    # Copy the basic template to the static directory so it's immediately accessible
-    copy_generated_files_to_static(project_name, project_dir)
-    
-    # Get the OpenAI API key from the gpt-engineer .env file
-    api_key = None
-    gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
-    env_path = os.path.join(gpte_repo, '.env')
-    if os.path.exists(env_path):
-        try:
-            with open(env_path, 'r') as f:
-                for line in f:
-                    if line.strip().startswith('OPENAI_API_KEY='):
-                        api_key = line.strip().split('=', 1)[1]
-                        break
-        except Exception as e:
-            print(f"Error reading .env file: {e}")
+    # Copy the basic template to the static directory so it's immediately
+    # accessible; the run publishes the real game anyway, so a failure here
+    # doesn't stop the project being created
+    try:
+        copy_generated_files_to_static(project_name, project_dir)
+    except Exception as e:
+        print(f"Error publishing the template for {project_name}: {e}")
     
-    if not api_key:
+    # The run reads the key from the gpt-engineer .env file; check there is one
+    if not read_gpte_api_key(gpte_repo):
         return jsonify({"status": "error", "message": "OpenAI API key not found"}), 500
 
     # Directly start gpt-engineer process in the foreground to ensure it runs
     print(f"Starting GPT Engineer for project: {project_name}")
     
-    # Create a background thread that will actually run the process
-    def run_gpte_background():
-        # Get log file path
-        log_file_path = os.path.join(project_dir, 'gpt_engineer.log')
-        print(f"Log file will be written to: {log_file_path}")
-        
-        # Open the log file for appending
-        with open(log_file_path, 'a') as log_file:
-            # Create the command with environment variables properly exported
-            cmd = f"cd {gpte_repo} && OPENAI_API_KEY='{api_key}' python -m gpt_engineer.applications.cli.main \"{project_dir}\" --temperature 0.7 --verbose"
-            log_file.write(f"Executing command: {cmd}\n")
-            print(f"Executing command: {cmd}")
-            
-            try:
-                # First log the API key check for debugging (without exposing the full key)
-                key_prefix = api_key[:4] if api_key else "None"
-                log_file.write(f"API Key check: {key_prefix}...\n")
-                print(f"API Key check: {key_prefix}...")
-                
-                # Verify the project directory exists
-                if not os.path.exists(project_dir):
-                    error_msg = f"Project directory does not exist: {project_dir}"
-                    log_file.write(f"ERROR: {error_msg}\n")
-                    print(f"ERROR: {error_msg}")
-                else:
-                    log_file.write(f"Project directory exists: {project_dir}\n")
-                    print(f"Project directory exists: {project_dir}")
-                
-                # Verify GPT Engineer repo exists
-                if not os.path.exists(gpte_repo):
-                    error_msg = f"GPT Engineer repo does not exist: {gpte_repo}"
-                    log_file.write(f"ERROR: {error_msg}\n")
-                    print(f"ERROR: {error_msg}")
-                else:
-                    log_file.write(f"GPT Engineer repo exists: {gpte_repo}\n")
-                    print(f"GPT Engineer repo exists: {gpte_repo}")
-                
-                # Set up the environment with the API key
-                env = os.environ.copy()
-                env['OPENAI_API_KEY'] = api_key
-                
-                # Run the process with the environment variables and capture output in real-time
-                process = subprocess.Popen(
-                    f"cd {gpte_repo} && python -m gpt_engineer.applications.cli.main \"{project_dir}\" --temperature 0.7 --verbose",
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,  # Line buffered
-                    universal_newlines=True,
-                    env=env
-                )
-                
-                # Read output line by line as it happens
-                for line in process.stdout:
-                    line = line.rstrip()
-                    print(f"GPT Engineer output: {line}")
-                    log_file.write(f"{line}\n")
-                    log_file.flush()  # Ensure content is written immediately
-                
-                # Wait for process to complete
-                return_code = process.wait()
-                
-                if return_code == 0:
-                    print("GPT Engineer process completed successfully")
-                    log_file.write("\n✅ Game generation complete!\n")
-                    
-                    # Create a completion marker file
-                    with open(os.path.join(project_dir, ".gpte_done"), "w") as f:
-                        f.write(f"Process completed at {datetime.datetime.now()}")
-                    
-                    # Copy generated files to static
-                    copy_generated_files_to_static(project_name, project_dir)
-                else:
-                    error_msg = f"GPT Engineer process failed with return code {return_code}"
-                    print(error_msg)
-                    log_file.write(f"\nError: {error_msg}\n")
-            
-            except Exception as e:
-                print(f"Error running GPT Engineer: {e}")
-                log_file.write(f"\nError: {str(e)}\n")
+    # Hand the run to the generation queue
+    try:
+        job, joined = job_queue.submit('generate', project_name, run_generate_job, join_kinds=REGENERATION_JOB_KINDS)
+    except QueueFullError:
+        return queue_full_response(project_name)
     
-    # Start the background thread
-    thread = threading.Thread(target=run_gpte_background)
-    thread.daemon = True
-    thread.start()
+    message = "Game project created and gpt-engineer started"
+    if job_queue.position(job):
+        message = f"Game project created and queued at position {job_queue.position(job)}"
     
     # When redirecting to the play page, add a parameter to indicate it's a new project
-    return jsonify({"status": "success", "message": "Game project created and gpt-engineer started", "project": project_name})
+    return jsonify({"status": "success", "message": message, "project": project_name, **job_response_fields(job, joined)})
 
 def create_basic_threejs_template(project_dir, prompt):
     """Create a basic working Three.js template in the workspace/generated directory"""
@@ -334,16 +1790,21 @@ def run_gpte():
         print(f"Project directory: {project_dir}")
         if not os.path.exists(project_dir):
             return jsonify({"status": "error", "message": "Project not found"}), 404
+        
+        # Join an in-flight regeneration instead of starting a duplicate run
+        active_job = job_queue.active_job(project_name, REGENERATION_JOB_KINDS)
+        if active_job:
+            return jsonify({
+                "status": "started",
+                "message": "Game regeneration is already in progress",
+                "project": project_name,
+                "log_file": "gpt_engineer.log",
+                **job_response_fields(active_job, joined=True)
+            })
+        
+        if job_queue.is_full():
+            return queue_full_response(project_name)
     
-        # Remove the completion marker file if it exists
-        done_file = os.path.join(project_dir, ".gpte_done")
-        if os.path.exists(done_file):
-            try:
-                os.remove(done_file)
-                print(f"Removed completion marker file: {done_file}")
-            except Exception as e:
-                print(f"Error removing completion marker file: {e}")
-            
         # Get the gpt-engineer path and environment
         gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
         if not os.path.exists(gpte_repo):
@@ -351,125 +1812,29 @@ def run_gpte():
             print(f"Using original path: {gpte_repo}")
         print(f"GPT Engineer repo path: {gpte_repo}")
         
-        # Get OpenAI API key from gpt-engineer .env file
-        api_key = None
-        env_path = os.path.join(gpte_repo, '.env')
-        print(f"Checking for .env file at: {env_path}")
-        if os.path.exists(env_path):
-            try:
-                with open(env_path, 'r') as f:
-                    for line in f:
-                        if line.strip().startswith('OPENAI_API_KEY='):
-                            api_key = line.strip().split('=', 1)[1]
-                            print("Found API key in .env file")
-                            break
-            except Exception as e:
-                print(f"Error reading .env file: {e}")
-                return jsonify({"status": "error", "message": f"Error reading API key: {e}"}), 500
-        
-        if not api_key:
+        # The run reads the key itself; this only checks that there is one
+        if not read_gpte_api_key(gpte_repo):
             return jsonify({"status": "error", "message": "OpenAI API key not found. Please set it in ~/Desktop/gpt-engineer/.env"}), 500
         
-        # Set up environment variables
-        env_vars = os.environ.copy()
-        env_vars['OPENAI_API_KEY'] = api_key
-        print(f"Set up environment variables")
-        
-        # Create logs directory if it doesn't exist
-        logs_dir = os.path.join(project_dir, "workspace", "logs")
+        # The prompt file and project log are rewritten by the run once it
+        # owns the project, not here under a job that may still be running
+        # Queue the run on the generation worker pool
         try:
-            os.makedirs(logs_dir, exist_ok=True)
-            print(f"Created logs directory: {logs_dir}")
-        except Exception as e:
-            print(f"Error creating logs directory: {e}")
-            return jsonify({"status": "error", "message": f"Error creating logs directory: {e}"}), 500
-        
-        # Create a log file for this run
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_file = os.path.join(logs_dir, f"gpte_run_{timestamp}.log")
-        print(f"Log file path: {log_file}")
+            job, joined = job_queue.submit('regenerate', project_name, run_regenerate_job, join_kinds=REGENERATION_JOB_KINDS,
+                                           params={'prompt': prompt} if prompt else None)
+        except QueueFullError:
+            return queue_full_response(project_name)
         
-        # Much simpler approach to run GPT Engineer
-        # Create a log file for this run
-        log_file = os.path.join(project_dir, 'gpt_engineer.log')
-        
-        # Update or create prompt file if we received a prompt
-        prompt_file = os.path.join(project_dir, 'prompt')
-        if prompt:
-            print(f"[GPT ENGINEER] Updating prompt file with new prompt: {prompt}")
-            
-            # Enhanced prompt with very specific instructions for Three.js
-            enhanced_prompt = f"Create a 3D game using Three.js with the following specifications:\n\n{prompt}\n\nREQUIREMENTS:\n- Use Three.js library\n- Create a web-based 3D game that runs in the browser\n- Include index.html as the main entry point\n- Use JavaScript for game logic\n- Make sure the game initializes properly without errors\n- Add clear user controls/instructions\n- Include proper lighting and camera setup"
-            
-            # Write the updated prompt file with enhanced instructions
-            with open(prompt_file, 'w') as f:
-                f.write(enhanced_prompt)
-                
-            print(f"[GPT ENGINEER] Wrote enhanced prompt to {prompt_file}")
-        
-        # Write initial info to the log file
-        with open(log_file, 'w') as f:
-            f.write(f"Starting GPT Engineer for project: {project_name}\n")
-            f.write(f"Start time: {datetime.datetime.now()}\n")
-            f.write("Initializing game generation...\n")
-        
-        # Define a function to run in a separate thread
-        def run_gpte_thread():
-            try:
-                # Simple, direct command execution
-                cmd = f"cd {gpte_repo} && python -m gpt_engineer.applications.cli.main \"{project_dir}\" --temperature 0.7"
-                
-                # Set up environment with API key
-                env_vars = os.environ.copy()
-                env_vars['OPENAI_API_KEY'] = api_key
-                
-                # Log the command we're about to run (without API key)
-                print(f"Running command: cd {gpte_repo} && python -m gpt_engineer.applications.cli.main \"{project_dir}\" --temperature 0.7")
-                
-                # Execute the command directly with real-time output capture
-                process = subprocess.Popen(
-                    cmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    env=env_vars
-                )
-                
-                # Capture and log output in real-time
-                with open(log_file, 'a') as log_f:
-                    while True:
-                        output = process.stdout.readline()
-                        if output == '' and process.poll() is not None:
-                            break
-                        if output:
-                            log_f.write(output)
-                            log_f.flush()
-                            print(output.strip())
-                
-                # Create a marker file to indicate completion
-                with open(done_file, "w") as f:
-                    f.write(f"Process completed at {datetime.datetime.now()}")
-                
-                # Copy generated files to the static directory for serving
-                copy_generated_files_to_static(project_name, project_dir)
-                print("GPT Engineer process completed successfully")
-                
-            except Exception as e:
-                print(f"Error running GPT Engineer: {e}")
-                with open(log_file, 'a') as f:
-                    f.write(f"\nError: {str(e)}\n")
-        
-        # Start the thread to run GPT Engineer
-        thread = threading.Thread(target=run_gpte_thread)
-        thread.daemon = True
-        thread.start()
+        message = "Game regeneration started using gpt-engineer"
+        if job_queue.position(job):
+            message = f"Game regeneration queued at position {job_queue.position(job)}"
         
         return jsonify({
             "status": "started", 
-            "message": "Game regeneration started using gpt-engineer",
+            "message": message,
             "project": project_name,
-            "log_file": os.path.basename(log_file)
+            "log_file": "gpt_engineer.log",
+            **job_response_fields(job, joined)
         })
     except Exception as e:
         return jsonify({"status": "error", "message": f"Error regenerating game: {str(e)}"}), 500
@@ -745,9 +2110,8 @@ def skip_gpte():
         with open(os.path.join(generated_dir, "game.js"), "w") as f:
             f.write(game_js)
             
-        # Create the completion marker file
-        with open(os.path.join(project_dir, ".gpte_done"), "w") as f:
-            f.write(f"Process completed at {datetime.datetime.now()}")
+        # Record the sample as a finished generation so status checks see it
+        job_store.record_manual(project_name, 'sample')
             
         return jsonify({
             "status": "success", 
@@ -764,58 +2128,6 @@ def skip_gpte():
         return jsonify({"status": "error", "message": error_message}), 500
 
 
-def try_run_gpte_background(project_dir):
-    """Try to run gpt-engineer/gpt-engineer in the background as a fallback"""
-    try:
-        # Get OpenAI API key from gpt-engineer or gpt-engineer .env file
-        api_key = None
-        env_path = os.path.expanduser('~/Desktop/gpt-engineer/.env')
-        if not os.path.exists(env_path):
-            env_path = os.path.expanduser('~/Desktop/gpt-engineer/.env')
-            print(f"Using original .env path: {env_path}")
-        if os.path.exists(env_path):
-            with open(env_path, 'r') as f:
-                for line in f:
-                    if line.strip().startswith('OPENAI_API_KEY='):
-                        api_key = line.strip().split('=', 1)[1]
-                        break
-        
-        if not api_key:
-            return False
-        
-        # Get the path to the gpt-engineer/gpt-engineer repository
-        gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
-        if not os.path.exists(gpte_repo):
-            gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
-            print(f"Using original repository path: {gpte_repo}")
-        
-        # Ensure we're using the correct Python environment with gpt-engineer installed
-        gpte_bin = os.path.join(gpte_repo, 'venv/bin/python') if os.path.exists(os.path.join(gpte_repo, 'venv/bin/python')) else 'python'
-        
-        # Set up the environment variables
-        env_vars = os.environ.copy()
-        env_vars['OPENAI_API_KEY'] = api_key
-        env_vars['PYTHONPATH'] = gpte_repo + ':' + env_vars.get('PYTHONPATH', '')
-        
-        # We need to run from the gpt-engineer directory to access all modules correctly
-        cmd = f"cd {gpte_repo} && {gpte_bin} -m gpt_engineer.cli.main {project_dir} --model gpt-4o --temperature 0.7 --use-custom-preprompts --verbose"
-        
-        # Run the command in a subprocess
-        process = subprocess.Popen(
-            cmd,
-            shell=True,
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True,
-            env=env_vars
-        )
-        
-        return True
-    except Exception as e:
-        print(f"Error running gpt-engineer in background: {e}")
-        return False
-
-
 def create_direct_playable_game(project_dir, game_type, prompt):
     """Create a directly playable Three.js game in the workspace/generated directory"""
     # Ensure workspace/generated directory exists
@@ -1371,40 +2683,37 @@ def game_builder(project_name):
 @app.route('/project_assets/<project_name>/<path:file_path>')
 def serve_project_assets(project_name, file_path):
     """Serves static files from the static/project_assets directory"""
-    project_assets_dir = os.path.join('static', 'project_assets', project_name)
-    if os.path.exists(os.path.join(project_assets_dir, file_path)):
-        return send_from_directory(project_assets_dir, file_path)
-    else:
-        # Fallback to original directory if not found in static/project_assets
-        project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
-        return send_from_directory(project_dir, file_path)
+    # Fallback to original directory if not found in static/project_assets
+    for location in (os.path.join(app.static_folder, 'project_assets', project_name),
+                     os.path.join(BASE_PROJECT_DIR, project_name)):
+        path = safe_join(location, file_path)
+        if path and os.path.isfile(path):
+            return send_game_file(path)
+    return f"File {file_path} not found", 404
+
+@app.route('/static/project_versions/<project_name>/<version>/<path:file_path>')
+def serve_published_version(project_name, version, file_path):
+    """Serves a file from one published version of a game, which never changes"""
+    path = safe_join(PROJECT_VERSIONS_DIR, project_name, version, file_path)
+    if not path or not os.path.isfile(path):
+        return f"File {file_path} not found", 404
+    return send_game_file(path, immutable=True)
 
 @app.route('/play/<project_name>/<path:file_path>')
 def serve_game_files(project_name, file_path):
     """Serves game files, looking in multiple possible locations"""
-    # First try in static/project_assets directory (where we copy generated files)
-    project_assets_dir = os.path.join('static', 'project_assets', project_name)
-    if os.path.exists(os.path.join(project_assets_dir, file_path)):
-        return send_from_directory(project_assets_dir, file_path)
-        
-    # Then look in gpt-projects locations
-    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
+    # Files known since the last publish are looked up rather than searched for
+    resolved = game_files.resolve(project_name, file_path)
+    if resolved:
+        return send_game_file(resolved)
     
-    # Look in multiple possible locations in the following priority order:
-    # 1. workspace/generated - where gpt-engineer puts files
-    # 2. workspace - alternative location
-    # 3. Project root - where our template was
-    possible_locations = [
-        os.path.join(project_dir, 'workspace', 'generated'),
-        os.path.join(project_dir, 'workspace'),
-        project_dir
-    ]
-    
-    # Try to find the file in each location
-    for location in possible_locations:
-        file_path_full = os.path.join(location, file_path)
-        if os.path.exists(file_path_full):
-            return send_from_directory(location, file_path)
+    # Otherwise look in each location in priority order: static/project_assets
+    # (where we copy generated files), workspace/generated (where gpt-engineer
+    # puts files), workspace, then the project root (where our template was)
+    for location in game_file_locations(project_name):
+        file_path_full = safe_join(location, file_path)
+        if file_path_full and os.path.isfile(file_path_full):
+            return send_game_file(file_path_full)
     
     # If we didn't find the file, return a 404
     return f"File {file_path} not found", 404
@@ -1412,24 +2721,16 @@ def serve_game_files(project_name, file_path):
 # Add a route to handle direct access to play game assets
 @app.route('/play/<project_name>/', defaults={'file_path': 'index.html'})
 @app.route('/play/<project_name>')
-def play_game_root(project_name):
+def play_game_root(project_name, file_path='index.html'):
     """Serve the index.html file by default when accessing /play/<project_name>/"""
-    # First try in static/project_assets directory
-    project_assets_dir = os.path.join('static', 'project_assets', project_name)
-    if os.path.exists(os.path.join(project_assets_dir, 'index.html')):
-        return send_from_directory(project_assets_dir, 'index.html')
-        
-    # If not found in static, look in the original locations
-    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
-    possible_locations = [
-        os.path.join(project_dir, 'workspace', 'generated'),
-        os.path.join(project_dir, 'workspace'),
-        project_dir
-    ]
-    
-    for location in possible_locations:
-        if os.path.exists(os.path.join(location, 'index.html')):
-            return send_from_directory(location, 'index.html')
+    resolved = game_files.resolve(project_name, 'index.html')
+    if resolved:
+        return send_game_file(resolved)
+        
+    # If the table doesn't know it, look in each location
+    for location in game_file_locations(project_name):
+        if os.path.isfile(os.path.join(location, 'index.html')):
+            return send_game_file(os.path.join(location, 'index.html'))
     
     # If no index.html is found, fall back to the template
     return render_template('play_game.html', project_name=project_name)
@@ -1448,164 +2749,35 @@ def update_game():
     if not os.path.exists(project_dir):
         return jsonify({"status": "error", "message": "Project not found"}), 404
     
-    # Remove the completion marker file if it exists
-    done_file = os.path.join(project_dir, ".gpte_done")
-    if os.path.exists(done_file):
-        os.remove(done_file)
+    # A repeated submission of the same modification joins the queued/running one
+    active_job = job_queue.active_job(project_name, ('improve',))
+    if active_job and active_job.key == modification:
+        return jsonify({
+            "status": "started",
+            "message": f"Already working on your request to '{modification}'.",
+            **job_response_fields(active_job, joined=True)
+        })
+    
+    if job_queue.is_full():
+        return queue_full_response(project_name)
     
     # Process the natural language modification using gpt-engineer
     try:
-        # Extract current prompt
-        current_prompt = ""
-        
-        # Check for prompt in prompt file
-        prompt_path = os.path.join(project_dir, "prompt")
-        if os.path.exists(prompt_path):
-            with open(prompt_path, 'r') as f:
-                current_prompt = f.read()
-        
-        # Create a new prompt file that incorporates the modification request
-        new_prompt = f"{current_prompt}\n\nMODIFICATION REQUEST: {modification}\n"
-        new_prompt += "Please modify the existing game code based on this request. Keep all existing functionality intact unless specifically asked to change it."
-        
-        with open(prompt_path, 'w') as f:
-            f.write(new_prompt)
-        
         # Get the gpt-engineer path and environment
         gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
-        if not os.path.exists(gpte_repo):
-            gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
-            print(f"Using original path: {gpte_repo}")
-        
-        # Get OpenAI API key from gpt-engineer .env file
-        api_key = None
-        env_path = os.path.join(gpte_repo, '.env')
-        if os.path.exists(env_path):
-            with open(env_path, 'r') as f:
-                for line in f:
-                    if line.strip().startswith('OPENAI_API_KEY='):
-                        api_key = line.strip().split('=', 1)[1]
-                        break
-        
-        if not api_key:
+        if not read_gpte_api_key(gpte_repo):
             return jsonify({"status": "error", "message": "OpenAI API key not found. Please set it in ~/Desktop/gpt-engineer/.env"}), 500
         
-        # Create logs directory if it doesn't exist
-        logs_dir = os.path.join(project_dir, "workspace", "logs")
-        os.makedirs(logs_dir, exist_ok=True)
-        
-        # Create a log file for this run
+        # A log file for this run. The run writes it, along with the prompt,
+        # improve.txt and the file selection, once it owns the project, so a
+        # request queued behind another can't change the files that one reads
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_file = os.path.join(logs_dir, f"gpte_update_{timestamp}.log")
-        
-        # Set up environment variables
-        env_vars = os.environ.copy()
-        env_vars['OPENAI_API_KEY'] = api_key
-        
-        # Use -i flag for improve mode to modify existing code
-        # Construct a more robust command that ensures the API key is properly set
-        # Updated to use the correct module path (applications.cli.main instead of cli.main)
-        # Quote the project path to handle spaces in directory names
-        cmd = f"cd {gpte_repo} && OPENAI_API_KEY='{api_key}' python -m gpt_engineer.applications.cli.main \"{project_dir}\" -i --temperature 0.7 --verbose"
-        
-        # Log command details (without API key)
-        safe_cmd = f"cd {gpte_repo} && OPENAI_API_KEY='***' python -m gpt_engineer.applications.cli.main \"{project_dir}\" -i --temperature 0.7 --verbose"
-        print(f"Running gpt-engineer to modify game: {safe_cmd}")
-        
-        # Run the command in a subprocess and redirect output to log file
-        with open(log_file, 'w') as f:
-            # Write a header to the log file to make it easier to parse
-            f.write("===== GPT ENGINEER MODIFICATION LOG START =====\n")
-            f.write(f"Running command: {safe_cmd}\n")
-            f.write(f"Start time: {datetime.datetime.now()}\n")
-            f.write(f"Modification request: {modification}\n")
-            f.write(f"API key found: {'Yes, length='+str(len(api_key)) if api_key else 'No'}\n")
-            f.write(f"Project directory: {project_dir} (exists: {os.path.exists(project_dir)})\n")
-            f.write(f"gpt-engineer repo: {gpte_repo} (exists: {os.path.exists(gpte_repo)})\n")
-            f.write("===== COMMAND OUTPUT =====\n")
-            f.flush()
-            
-            # Also print to console for easier debugging
-            print(f"Starting gpt-engineer for project: {project_name}")
-            print(f"Modification: {modification}")
-            print(f"Project directory: {project_dir} (exists: {os.path.exists(project_dir)})")
-            print(f"gpt-engineer repo: {gpte_repo} (exists: {os.path.exists(gpte_repo)})")
-            print(f"API key found: {'Yes' if api_key else 'No'}")
-            
-            # Create a pre-selected file configuration to bypass file selection
-            # First create a simple toml file that selects all files
-            toml_dir = os.path.join(project_dir, '.gpteng')
-            os.makedirs(toml_dir, exist_ok=True)
-            with open(os.path.join(toml_dir, 'file_selection.toml'), 'w') as f:
-                f.write("selected = ['*']")  # Select all files by default
-                
-            # Create or update the improve.txt file to be read by our modified gpt-engineer
-            with open(os.path.join(project_dir, 'improve.txt'), 'w') as improve_file:
-                improve_file.write(modification)
-                
-            # Then run gpt-engineer with -i flag - no need for printf with our modified source code
-            noninteractive_cmd = f"cd {gpte_repo} && OPENAI_API_KEY='{api_key}' python -m gpt_engineer.applications.cli.main \"{project_dir}\" -i --temperature 0.7 --verbose"
-            
-            process = subprocess.Popen(
-                noninteractive_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                env=env_vars
-            )
-            
-            # Process output in real-time while writing to log file
-            try:
-                while True:
-                    output = process.stdout.readline()
-                    if output == '' and process.poll() is not None:
-                        break
-                    if output:
-                        f.write(output)
-                        f.flush()
-                        print(output.strip())
-            except IOError as e:
-                print(f"Error processing output: {e}")
-                f.write(f"\nError processing output: {e}\n")
-                f.flush()
-            
-            # Get the return code
-            return_code = process.poll()
-            f.write(f"\n===== Process exited with code: {return_code} =====\n")
-        
-        # Start a thread to check when the process is done
-        def monitor_process():
-            process_completed = False
-            try:
-                # Wait for process with a timeout to prevent hanging
-                process.wait(timeout=600)  # 10 minute timeout
-                process_completed = True
-            except subprocess.TimeoutExpired:
-                print(f"gpt-engineer process timed out after 10 minutes")
-                try:
-                    process.kill()
-                except Exception as e:
-                    print(f"Error terminating process: {e}")
-            except Exception as e:
-                print(f"Error in process monitoring: {e}")
-                
-            try:
-                # Create a marker file to indicate completion
-                with open(done_file, "w") as done_marker:
-                    done_marker.write(f"Process completed at {datetime.datetime.now()} - {'Success' if process_completed else 'Timeout or Error'}")
-            except Exception as e:
-                print(f"Error creating done file: {e}")
-                
-            try:
-                # Copy generated files to the static directory for serving
-                copy_generated_files_to_static(project_name, project_dir)
-            except Exception as e:
-                print(f"Error copying generated files: {e}")
+        log_file = os.path.join(project_dir, "workspace", "logs", f"gpte_update_{timestamp}.log")
         
-        thread = threading.Thread(target=monitor_process)
-        thread.daemon = True
-        thread.start()
+        try:
+            job, joined = job_queue.submit('improve', project_name, run_improve_job, join_kinds=('improve',), key=modification, params={'log_file': log_file})
+        except QueueFullError:
+            return queue_full_response(project_name)
         
         # Create a meaningful response message for immediate return
         response_message = f"Working on your request to '{modification}'. You'll see updates in real-time as the code is being generated."
@@ -1613,7 +2785,8 @@ def update_game():
         return jsonify({
             "status": "started", 
             "message": response_message,
-            "log_file": os.path.basename(log_file)
+            "log_file": os.path.basename(log_file),
+            **job_response_fields(job, joined)
         })
     except Exception as e:
         return jsonify({"status": "error", "message": f"Error starting game update: {str(e)}"}), 500
@@ -1849,260 +3022,543 @@ def extract_value_from_js(js_content, search_prefix):
         return value_str  # Return as string if not a number
 
 
-@app.route('/stream_gpt_engineer_output')
-def stream_gpt_engineer_output():
-    """Stream gpt-engineer output in real-time using Server-Sent Events"""
-    project_name = request.args.get('project_name')
-    
-    if not project_name:
-        return jsonify({"status": "error", "message": "Project name is required"}), 400
-    
-    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
-    if not os.path.exists(project_dir):
-        return jsonify({"status": "error", "message": "Project not found"}), 404
-    
-    def generate():
-        # Initial message
-        yield f"data: {json.dumps({'type': 'log', 'title': '🔄 Setting up gpt-engineer environment...'})}"
-        
-        # Create a pipe file for gpt-engineer to write its output to
-        pipe_file = os.path.join(project_dir, "gpte_output.pipe")
-        
-        # Set up environment for gpt-engineer
-        yield f"data: {json.dumps({'type': 'log', 'title': '🔄 Initializing gpt-engineer...'})}"
+GPTE_EVENT_TITLES = {
+    'model': '🤖 Model Information',
+    'api_error': '❌ OpenAI API Error',
+    'file_written': '📝 File Update',
+    'prompt': '❓ gpt-engineer is waiting for input',
+    'output': '🔄 gpt-engineer',
+}
+
+
+def gpte_output_messages(log_event):
+    """Messages the builder's output stream sends for one parsed log event
+
+    Every message keeps the stream's original shape ('log' with a title and
+    content, 'progress' with a value) and carries the parsed event itself
+    under 'event' for clients that want the structured form.
+    """
+    kind = log_event['type']
+    if kind == 'phase':
+        messages = [{'type': 'progress', 'value': log_event['progress'], 'phase': log_event['phase'], 'event': log_event}]
+        if log_event['phase'] != 'complete':
+            # Completion gets its own message below
+            messages.append({'type': 'log', 'title': f"🔄 {log_event['label']}", 'event': log_event})
+        return messages
+    if kind == 'complete':
+        if log_event['state'] in ('failed', 'cancelled', 'timed_out'):
+            return [{'type': 'log', 'title': '❌ gpt-engineer process failed', 'content': log_event['state'].replace('_', ' '), 'event': log_event}]
+        return [{'type': 'progress', 'value': 100, 'phase': 'complete', 'event': log_event},
+                {'type': 'log', 'title': '✅ gpt-engineer process complete!', 'event': log_event}]
+    content = {'model': log_event.get('model'), 'output': log_event.get('text')}.get(kind, log_event.get('line'))
+    return [{'type': 'log', 'title': GPTE_EVENT_TITLES[kind], 'content': content, 'event': log_event}]
+
+
+def sse_message(data, event_id=None):
+    """One SSE message; dicts are sent as JSON and an event_id becomes the message's id"""
+    payload = data if isinstance(data, str) else json.dumps(data)
+    return (f"id: {event_id}\n" if event_id is not None else "") + f"data: {payload}\n\n"
+
+
+SSE_HEARTBEAT = ": heartbeat\n\n"
+
+
+class SSEStreamStats:
+    """Counts of open SSE streams per endpoint, and of closed ones by how they ended"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = {}
+        self._opened = 0
+        self._closed = {}
+
+    def opened(self, name):
+        with self._lock:
+            self._open[name] = self._open.get(name, 0) + 1
+            self._opened += 1
+
+    def closed(self, name, reason):
+        with self._lock:
+            self._open[name] -= 1
+            self._closed[reason] = self._closed.get(reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {"open": dict(self._open), "open_total": sum(self._open.values()),
+                    "opened_total": self._opened, "closed_by_reason": dict(self._closed)}
+
+
+sse_stream_stats = SSEStreamStats()
+
+
+class SSEStream:
+    """The messages of one SSE response, independent of the server sending them
+
+    A driver (sse_response() here, or the ASGI app in asgi.py) calls start(),
+    sends opening(), then feeds every event from subscribe() (by default, a
+    subscription to log_file) into on_event() until the stream is done,
+    sending SSE_HEARTBEAT whenever wait_timeout() passes without one and
+    giving up once expired() names a reason. A finished stream then sends
+    closing(). Paced streams, by default those with no log_file, send
+    paced_messages() instead, as (message, delay) pairs. Either way the
+    driver calls close() with how the stream ended.
+    """
+
+    name = 'stream'
+
+    def __init__(self, project_name, resume_offset=None):
+        self.project_name = project_name
+        self.resume_offset = resume_offset
+        self.log_file = None
+        # Set by the driver to the log's end when it subscribed; data events
+        # ending at or before it are replayed output
+        self.live_from = 0
+        self.parser = LogEventParser()
+        self.done = False
+        self.started_at = self.last_output_at = None
+
+    def finished_state(self):
+        return project_finished_state(self.project_name)
+
+    @property
+    def paced(self):
+        return self.log_file is None
+
+    def subscribe(self, loop=None):
+        """Subscribe to the log, from a worker thread when a loop is passed for the ASGI driver"""
+        # Starts at the end of the file, or replays whatever a reconnecting stream missed
+        subscription = log_broadcasters.subscribe(self.log_file, self.finished_state, self.resume_offset, loop)
+        self.live_from = subscription.offset
+        return subscription
+
+    def start(self):
+        self.started_at = self.last_output_at = time.monotonic()
+        sse_stream_stats.opened(self.name)
+        # Tell the browser how soon to come back when we close the stream on it
+        return f"retry: {SSE_RETRY_MS}\n\n"
+
+    def expired(self):
+        """'lifetime' or 'idle' once the stream has hit one of its caps, else None"""
+        now = time.monotonic()
+        if SSE_MAX_LIFETIME and now - self.started_at >= SSE_MAX_LIFETIME:
+            return 'lifetime'
+        if SSE_IDLE_TIMEOUT and now - self.last_output_at >= SSE_IDLE_TIMEOUT:
+            return 'idle'
+        return None
+
+    def wait_timeout(self):
+        """Seconds to wait for the next event before a heartbeat or a cap is due"""
+        now = time.monotonic()
+        timeout = SSE_HEARTBEAT_SECONDS
+        if SSE_MAX_LIFETIME:
+            timeout = min(timeout, self.started_at + SSE_MAX_LIFETIME - now)
+        if SSE_IDLE_TIMEOUT:
+            timeout = min(timeout, self.last_output_at + SSE_IDLE_TIMEOUT - now)
+        return max(timeout, 0)
+
+    def handle_event(self, event):
+        """on_event() for an event from the subscription, noting that the log is alive"""
+        if event[0] == 'data':
+            self.last_output_at = time.monotonic()
+        return self.on_event(event)
+
+    def close(self, reason):
+        sse_stream_stats.closed(self.name, reason)
+
+    def opening(self):
+        return []
+
+    def on_event(self, event):
+        return []
+
+    def closing(self):
+        return []
+
+    def paced_messages(self):
+        return []
+
+
+class ProjectLogStream(SSEStream):
+    """/stream_logs: the raw gpt_engineer.log, with parsed events alongside"""
+
+    name = 'stream_logs'
+
+    def __init__(self, project_name, resume_offset=None):
+        super().__init__(project_name, resume_offset)
+        self.log_file = os.path.join(BASE_PROJECT_DIR, project_name, 'gpt_engineer.log')
+
+    def opening(self):
+        # Send an initial message, unless this is a reconnect picking up where it left off
+        if self.resume_offset is not None:
+            return []
+        return [sse_message({"status": "started", "message": f"Starting log stream for {self.project_name}",
+                             "content": f"> Starting GPT Engineer process for {self.project_name}...\n"})]
+
+    def on_event(self, event):
+        kind, value, new_content = event
+        if kind == 'data':
+            # A client that fell behind gets its backlog as one batch, and only its latest progress
+            log_events = latest_phase_only(self.parser.feed(new_content))
+            # Answer prompts as they appear (replayed prompts were already answered)
+            new_content += auto_answer_live_prompts(self.project_name, log_events, value, self.live_from)
+            
+            # The id is the log offset to resume from after a reconnect; the parsed
+            # events ride along with the raw text so clients don't re-parse it
+            return [sse_message({"status": "running", "content": new_content, "progress": self.parser.progress,
+                                 "phase": self.parser.phase, "events": log_events}, value)]
+        if kind == 'reset':
+            self.parser.reset()
+            return []
+        if kind == 'finished':
+            # Generation is complete
+            self.done = True
+            log_events = self.parser.finish(value)
+            if value in ('failed', 'cancelled', 'timed_out'):
+                state_label = value.replace('_', ' ')
+                message = {"status": "failed", "message": f"Generation {state_label}",
+                           "content": f"\n> ❌ Game generation {state_label}\n"}
+            else:
+                message = {"status": "completed", "message": "Generation completed",
+                           "content": "\n> ✅ Game generation complete!\n"}
+            message.update(progress=self.parser.progress, phase=self.parser.phase, events=log_events)
+            return [sse_message(message)]
+        return []
+
+
+SIMULATED_GPTE_STEPS = [
+    "Analyzing the project prompt...",
+    "Planning the game architecture...",
+    "Designing game mechanics...",
+    "Writing game code...",
+    "Implementing player controls...",
+    "Setting up game environment...",
+    "Creating visual elements...",
+    "Testing gameplay functionality...",
+    "Finalizing the implementation..."
+]
+
+
+class GpteOutputStream(SSEStream):
+    """/stream_gpt_engineer_output: the newest workspace log as builder messages, then the generated code"""
+
+    name = 'stream_gpt_engineer_output'
+
+    def __init__(self, project_name, resume_offset=None):
+        super().__init__(project_name, resume_offset)
+        self.project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
+
+    def opening(self):
+        messages = []
+        # Initial messages, which a reconnecting stream has already shown
+        if self.resume_offset is None:
+            messages.append(sse_message({'type': 'log', 'title': '🔄 Setting up gpt-engineer environment...'}))
+            messages.append(sse_message({'type': 'log', 'title': '🔄 Initializing gpt-engineer...'}))
         
         # Check for workspace/logs directory
-        logs_dir = os.path.join(project_dir, "workspace", "logs")
-        os.makedirs(logs_dir, exist_ok=True)
+        logs_dir = os.path.join(self.project_dir, "workspace", "logs")
         
         # Look for any existing logs to track
-        log_files = [os.path.join(logs_dir, f) for f in os.listdir(logs_dir) if f.endswith('.log')]
+        log_files = []
+        if os.path.isdir(logs_dir):
+            log_files = [os.path.join(logs_dir, f) for f in os.listdir(logs_dir) if f.endswith('.log')]
         log_files.sort(key=os.path.getmtime, reverse=True)
         
         if log_files:
             # Use the most recent log file
-            log_file = log_files[0]
-            yield f"data: {json.dumps({'type': 'log', 'title': '🔄 Found gpt-engineer log file, streaming updates...', 'content': f'Using log file: {os.path.basename(log_file)}'})}"
-            
-            # Start at the end of the file
-            with open(log_file, 'r') as f:
-                f.seek(0, 2)  # Go to the end of the file
-                
-                last_position = f.tell()
-                progress = 10
+            self.log_file = log_files[0]
+            if self.resume_offset is None:
+                messages.append(sse_message({'type': 'log', 'title': '🔄 Found gpt-engineer log file, streaming updates...',
+                                             'content': f'Using log file: {os.path.basename(self.log_file)}'}))
+        return messages
+
+    def on_event(self, event):
+        messages = []
+        kind, value, new_content = event
+        if kind == 'data':
+            # Progress within a batch is covered by the progress message that ends it
+            for log_event in self.parser.feed(new_content):
+                messages.extend(sse_message(message) for message in gpte_output_messages(log_event)
+                                if message['type'] != 'progress')
+            # The id is the log offset to resume from after a reconnect
+            messages.append(sse_message({'type': 'progress', 'value': self.parser.progress, 'phase': self.parser.phase}, value))
+        elif kind == 'reset':
+            self.parser.reset()
+        elif kind == 'finished':
+            # The gpt-engineer process is complete
+            self.done = True
+            for log_event in self.parser.finish(value):
+                messages.extend(sse_message(message) for message in gpte_output_messages(log_event))
+        return messages
+
+    def closing(self):
+        project_name = self.project_name
+        project_dir = self.project_dir
+        
+        # Extract and stream the generated code files for display
+        workspace_dir = os.path.join(project_dir, "workspace")
+        generated_dir = os.path.join(workspace_dir, "generated")
+        
+        # First, show all generated JS files to the user
+        if os.path.exists(generated_dir):
+            js_files = [f for f in os.listdir(generated_dir) if f.endswith(('.js', '.html'))]
+            for js_file in js_files:
+                file_path = os.path.join(generated_dir, js_file)
+                with open(file_path, 'r') as f:
+                    code_content = f.read()
                 
-                # Stream updates in real-time
-                while True:
-                    # Check if the file has been updated
-                    current_position = os.path.getsize(log_file)
-                    
-                    if current_position > last_position:
-                        with open(log_file, 'r') as f:
-                            f.seek(last_position)
-                            new_content = f.read(current_position - last_position)
-                                                       # Process new content into more meaningful updates
-                            lines = new_content.strip().split('\n')
-                            for line in lines:
-                                # Skip empty lines
-                                if not line:
-                                    continue
-                                    
-                                # Extract meaningful content from GPT Engineer output
-                                # Filter out prompt-related content to avoid showing that
-                                if 'Using model: ' in line:
-                                    yield f"data: {json.dumps({'type': 'log', 'title': '🤖 Model Information', 'content': line.split('Using model: ')[1]})}"
-                                elif 'OpenAI API' in line and 'error' in line.lower():
-                                    yield f"data: {json.dumps({'type': 'log', 'title': '❌ OpenAI API Error', 'content': line})}"
-                                # Skip prompt lines that might contain user instructions
-                                elif 'prompt' in line.lower() or 'user input' in line.lower() or 'instruction' in line.lower():
-                                    continue
-                                elif 'Step ' in line and ':' in line:
-                                    # This is likely a step in the GPT Engineer process
-                                    parts = line.split(':', 1)
-                                    if len(parts) > 1:
-                                        step_title = parts[0].strip()
-                                        step_content = parts[1].strip()
-                                        # Only show steps related to implementation, not prompt handling
-                                        if 'implementation' in step_content.lower() or 'code' in step_content.lower() or 'file' in step_content.lower():
-                                            yield f"data: {json.dumps({'type': 'log', 'title': f'🔄 {step_title}', 'content': step_content})}"
-                                elif 'Overwriting file' in line or 'Creating file' in line:
-                                    # File creation/modification updates
-                                    yield f"data: {json.dumps({'type': 'log', 'title': '📝 File Update', 'content': line})}"
-                                else:
-                                    # For other content, clean up any timestamps or log level prefixes
-                                    clean_line = line
-                                    if ']' in line:
-                                        clean_line = line.split(']')[-1].strip()
-                                    elif line.startswith('DEBUG') or line.startswith('INFO'):
-                                        # Skip purely debug/info logs
-                                        continue
-                                    
-                                    if clean_line:
-                                        yield f"data: {json.dumps({'type': 'log', 'title': '🔄 gpt-engineer', 'content': clean_line})}"
+                # Extract meaningful sections of the code to display
+                if code_content:
+                    # Skip sections that look like prompts (usually have a lot of natural language)
+                    if 'function' in code_content or 'class' in code_content or '<html' in code_content:
+                        yield f"data: {json.dumps({'type': 'log', 'title': f'📄 Generated file: {js_file}', 'content': f'Showing key parts of the code...'})}\n\n"
                         
-                        last_position = current_position
+                        # Split by newlines and get important code sections
+                        code_lines = code_content.split('\n')
                         
-                        # Adjust progress based on content
-                        if 'Step 1' in new_content:
-                            progress = 20
-                        elif 'Step 2' in new_content:
-                            progress = 40
-                        elif 'Step 3' in new_content:
-                            progress = 60
-                        elif 'Step 4' in new_content:
-                            progress = 80
-                        elif 'Overwriting file' in new_content or 'Creating file' in new_content:
-                            progress = 90
-                        else:
-                            progress = min(progress + 2, 95)
-                            
-                        yield f"data: {json.dumps({'type': 'progress', 'value': progress})}"
-                    
-                    # Check if gpt-engineer process is complete
-                    done_file = os.path.join(project_dir, ".gpte_done")
-                    if os.path.exists(done_file):
-                        yield f"data: {json.dumps({'type': 'progress', 'value': 100})}"
-                        yield f"data: {json.dumps({'type': 'log', 'title': '✅ gpt-engineer process complete!'})}"
-                        break
-                    
-                    time.sleep(1)  # Check for updates every second
-            
-            # Extract and stream the generated code files for display
-            workspace_dir = os.path.join(project_dir, "workspace")
-            generated_dir = os.path.join(workspace_dir, "generated")
-            
-            # First, show all generated JS files to the user
-            if os.path.exists(generated_dir):
-                js_files = [f for f in os.listdir(generated_dir) if f.endswith(('.js', '.html'))]
-                for js_file in js_files:
-                    file_path = os.path.join(generated_dir, js_file)
-                    with open(file_path, 'r') as f:
-                        code_content = f.read()
-                    
-                    # Extract meaningful sections of the code to display
-                    if code_content:
-                        # Skip sections that look like prompts (usually have a lot of natural language)
-                        if 'function' in code_content or 'class' in code_content or '<html' in code_content:
-                            yield f"data: {json.dumps({'type': 'log', 'title': f'📄 Generated file: {js_file}', 'content': f'Showing key parts of the code...'})}"
-                            
-                            # Split by newlines and get important code sections
-                            code_lines = code_content.split('\n')
-                            
-                            # Filter out prompt-like sections (long paragraphs of text)
-                            code_display = '\n'.join([
-                                line for line in code_lines 
-                                if (len(line.strip()) < 100 or '{' in line or '}' in line or 
-                                    'function' in line or 'class' in line or '<' in line or 
-                                    'const' in line or 'let' in line or 'var' in line)
-                            ])
-                            
-                            # If the code is too long, show just a portion
-                            if len(code_display) > 1000:
-                                code_sections = code_display.split('\n\n')
-                                # Take first part, middle part, and last part to give a good overview
-                                if len(code_sections) > 3:
-                                    code_display = '\n\n'.join([
-                                        code_sections[0], 
-                                        '// ... (code omitted for brevity) ...', 
-                                        code_sections[-1]
-                                    ])
-                            
-                            yield f"data: {json.dumps({'type': 'code', 'title': f'🖥️ {js_file}', 'content': code_display})}"
+                        # Filter out prompt-like sections (long paragraphs of text)
+                        code_display = '\n'.join([
+                            line for line in code_lines 
+                            if (len(line.strip()) < 100 or '{' in line or '}' in line or 
+                                'function' in line or 'class' in line or '<' in line or 
+                                'const' in line or 'let' in line or 'var' in line)
+                        ])
+                        
+                        # If the code is too long, show just a portion
+                        if len(code_display) > 1000:
+                            code_sections = code_display.split('\n\n')
+                            # Take first part, middle part, and last part to give a good overview
+                            if len(code_sections) > 3:
+                                code_display = '\n\n'.join([
+                                    code_sections[0], 
+                                    '// ... (code omitted for brevity) ...', 
+                                    code_sections[-1]
+                                ])
+                        
+                        yield f"data: {json.dumps({'type': 'code', 'title': f'🖥️ {js_file}', 'content': code_display})}\n\n"
+        
+        # The job that produced the files published them when it finished;
+        # the stream only reports whether they are there
+        project_assets_dir = os.path.join('static', 'project_assets', project_name)
+        if os.path.exists(project_assets_dir):
+            yield f"data: {json.dumps({'type': 'log', 'title': '✅ Game files prepared for rendering', 'content': 'Files are ready to be viewed in the browser'})}\n\n"
+            yield f"data: {json.dumps({'type': 'action', 'action': 'redirect', 'url': f'/play/{project_name}'})}\n\n"
+        
+        # Final completion message with a link to play the game
+        yield f"data: {json.dumps({'type': 'complete', 'final_code': 'Game generation complete! You will be redirected to play your game.'})}\n\n"
+        play_link = '/play/' + project_name
+        link_content = '<a href="{}" target="_blank">Click here to play your game</a>'.format(play_link)
+        yield f"data: {json.dumps({'type': 'log', 'title': '🎮 Ready to play!', 'content': link_content})}\n\n"
+
+    def paced_messages(self):
+        # No log file found, simulate progress updates
+        for i, step in enumerate(SIMULATED_GPTE_STEPS):
+            progress = int(10 + (i * 10))
+            yield sse_message({'type': 'progress', 'value': progress}), 0
+            yield sse_message({'type': 'log', 'title': f'🔄 {step}'}), 1.5  # Simulate processing time
+        
+        # Final completion message
+        yield sse_message({'type': 'progress', 'value': 100}), 0
+        yield sse_message({'type': 'log', 'title': '✅ gpt-engineer process complete!'}), 0
+        yield sse_message({'type': 'complete', 'final_code': 'Process complete! Check the preview tab to see your game.'}), 0
+
+
+# Most projects one /project_events stream may follow
+PROJECT_EVENTS_MAX_PROJECTS = 20
+
+
+def project_events_resume_offsets(last_event_id):
+    """Per-project log offsets from a /project_events Last-Event-ID ("name=offset&...")"""
+    offsets = {}
+    for project_name, offset in urllib.parse.parse_qsl(last_event_id or ''):
+        if offset.isdigit():
+            offsets[project_name] = int(offset)
+    return offsets
+
+
+class ProjectEventsStream(SSEStream):
+    """/project_events: everything a page needs to know about one or more projects, on one stream
+
+    Every message is JSON with a "type" and a "project":
+
+        status    how the project's latest job stands (see project_status())
+        assets    the published game files and the URL to play them from
+        log       new gpt_engineer.log output, with its parsed non-phase events
+        progress  the generation moving on to a new phase
+
+    A status and (once there is one) an assets message for every project
+    open the stream, and both are sent again whenever they change. The
+    stream stays open across runs; log messages carry every project's log
+    offset in their id, so a reconnect resumes each log where it left off.
+    """
+
+    name = 'project_events'
+    paced = False
+
+    def __init__(self, project_names, resume_offsets=None):
+        super().__init__(None)
+        self.project_names = project_names
+        self.offsets = dict(resume_offsets or {})
+        self.live_from = {}
+        self.parsers = {project_name: LogEventParser() for project_name in project_names}
+        self.sent = {}
+
+    def subscribe(self, loop=None):
+        group = SubscriptionGroup(loop)
+        for project_name in self.project_names:
+            log_file = os.path.join(BASE_PROJECT_DIR, project_name, 'gpt_engineer.log')
+            subscription = group.add(project_name, log_broadcasters.subscribe(
+                log_file, functools.partial(project_finished_state, project_name),
+                self.offsets.get(project_name), loop, group.ready))
+            self.live_from[project_name] = subscription.offset
+            self.offsets.setdefault(project_name, subscription.offset)
+            group.add(project_name, project_events.subscribe(project_name, loop, group.ready))
+        return group
+
+    def event_id(self):
+        return urllib.parse.urlencode(sorted(self.offsets.items()))
+
+    def updates(self, project_name):
+        """Status and assets messages for whatever changed since they were last sent"""
+        messages = []
+        status = project_status(project_name)
+        if status != self.sent.get((project_name, 'status')):
+            previous = self.sent.get((project_name, 'status')) or {}
+            if status['status'] == 'generating' and status['job_id'] != previous.get('job_id'):
+                # A new run: its progress starts over
+                self.parsers[project_name].reset()
+            self.sent[(project_name, 'status')] = status
+            messages.append(sse_message(status))
+        if status['status'] != 'generating':
+            assets = published_game_assets(project_name)
+            if assets and assets != self.sent.get((project_name, 'assets')):
+                self.sent[(project_name, 'assets')] = assets
+                messages.append(sse_message(assets))
+        return messages
+
+    def opening(self):
+        messages = []
+        for project_name in self.project_names:
+            messages.extend(self.updates(project_name))
+        return messages
+
+    def handle_event(self, event):
+        if event[1][0] == 'data':
+            self.last_output_at = time.monotonic()
+        return self.on_event(event)
+
+    def on_event(self, event):
+        project_name, (kind, value, new_content) = event
+        if kind == 'data':
+            # Status first, so a new run's parser starts over before its output is parsed
+            messages = self.updates(project_name)
+            log_events = latest_phase_only(self.parsers[project_name].feed(new_content))
+            new_content += auto_answer_live_prompts(project_name, log_events, value, self.live_from[project_name])
+            self.offsets[project_name] = value
+            messages.extend(
+                sse_message({"type": "progress", "project": project_name, "progress": e['progress'],
+                             "phase": e['phase'], "label": e['label']})
+                for e in log_events if e['type'] == 'phase'
+            )
+            # The id goes last so a reconnect resumes after everything sent for this output
+            messages.append(sse_message({"type": "log", "project": project_name, "content": new_content,
+                                         "events": [e for e in log_events if e['type'] != 'phase']},
+                                        self.event_id()))
+            return messages
+        if kind == 'reset':
+            self.parsers[project_name].reset()
+            self.offsets[project_name] = 0
+            return [sse_message({"type": "log", "project": project_name, "reset": True}, self.event_id())]
+        # 'finished' from the tailer, or a status or assets change from the hub
+        return self.updates(project_name)
+
+
+def sse_gzip_accepted(accept_encoding):
+    """Whether an SSE stream should be gzipped for a request with this Accept-Encoding"""
+    return SSE_GZIP and parse_accept_header(accept_encoding or '')['gzip'] > 0
+
+
+def gzip_sse(messages):
+    """Gzip a stream of SSE messages, flushing after each one so none waits in the compressor"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        for message in messages:
+            yield compressor.compress(message.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        # Closing early (the client went away) has to reach the stream itself
+        messages.close()
+
+
+def sse_response(stream):
+    """Stream an SSEStream from Flask, holding one thread for as long as the browser stays"""
+    def generate():
+        # A client that went away is only noticed when a write fails, which
+        # the heartbeats guarantee happens; Werkzeug then closes this generator
+        end_reason = 'disconnected'
+        retry = stream.start()
+        try:
+            yield retry
+            yield from stream.opening()
+            if stream.paced:
+                for message, delay in stream.paced_messages():
+                    yield message
+                    if delay:
+                        time.sleep(delay)
+                end_reason = 'finished'
+                return
             
-            # Copy the generated files to static/project_assets for serving
-            # This ensures they are accessible via the web server
+            # Follow the log through its shared tailer
+            subscription = stream.subscribe()
+            expired = None
             try:
-                # Create the target directory in static/project_assets
-                project_assets_dir = os.path.join('static', 'project_assets', project_name)
-                os.makedirs(project_assets_dir, exist_ok=True)
-                
-                # Source directory with generated files
-                generated_dir = os.path.join(project_dir, 'workspace', 'generated')
-                
-                if os.path.exists(generated_dir):
-                    print(f"Copying files from {generated_dir} to {project_assets_dir}")
-                    # Copy index.html, main.js, game.js and other JS files
-                    for filename in os.listdir(generated_dir):
-                        if filename.endswith(('.html', '.js', '.css')):
-                            src_path = os.path.join(generated_dir, filename)
-                            dst_path = os.path.join(project_assets_dir, filename)
-                            with open(src_path, 'r') as src_file:
-                                content = src_file.read()
-                            with open(dst_path, 'w') as dst_file:
-                                dst_file.write(content)
-                            print(f"Copied {filename} to {dst_path}")
-                                
-                    # Also check for subdirectories like src, js, lib, assets
-                    for subdir in ['src', 'js', 'lib', 'assets']:
-                        subdir_path = os.path.join(generated_dir, subdir)
-                        if os.path.exists(subdir_path) and os.path.isdir(subdir_path):
-                            dst_subdir = os.path.join(project_assets_dir, subdir)
-                            os.makedirs(dst_subdir, exist_ok=True)
-                            
-                            for filename in os.listdir(subdir_path):
-                                if filename.endswith(('.js', '.css', '.html')):
-                                    src_file_path = os.path.join(subdir_path, filename)
-                                    dst_file_path = os.path.join(dst_subdir, filename)
-                                    with open(src_file_path, 'r') as src_file:
-                                        content = src_file.read()
-                                    with open(dst_file_path, 'w') as dst_file:
-                                        dst_file.write(content)
-                                    print(f"Copied {subdir}/{filename} to {dst_file_path}")
-                else:
-                    print(f"Warning: Generated directory not found at {generated_dir}")
-            except Exception as e:
-                print(f"Error copying generated files: {str(e)}")
-                import traceback
-                traceback.print_exc()
-            
-            # Now check if our copied files are available in the static assets folder
-            project_assets_dir = os.path.join('static', 'project_assets', project_name)
-            if os.path.exists(project_assets_dir):
-                yield f"data: {json.dumps({'type': 'log', 'title': '✅ Game files prepared for rendering', 'content': 'Files are ready to be viewed in the browser'})}"
-                yield f"data: {json.dumps({'type': 'action', 'action': 'redirect', 'url': f'/play/{project_name}'})}"
-            
-            # Final completion message with a link to play the game
-            yield f"data: {json.dumps({'type': 'complete', 'final_code': 'Game generation complete! You will be redirected to play your game.'})}"
-            play_link = '/play/' + project_name
-            link_content = '<a href="{}" target="_blank">Click here to play your game</a>'.format(play_link)
-            yield f"data: {json.dumps({'type': 'log', 'title': '🎮 Ready to play!', 'content': link_content})}"
+                while not stream.done:
+                    expired = stream.expired()
+                    if expired:
+                        break
+                    event = subscription.get(timeout=stream.wait_timeout())
+                    if event is None:
+                        yield SSE_HEARTBEAT
+                    else:
+                        yield from stream.handle_event(event)
+            finally:
+                # Runs when the browser disconnects too, detaching this stream from the tailer
+                subscription.close()
+            if expired:
+                # The browser reconnects and picks up from its last event id
+                end_reason = expired
+                return
+            yield from stream.closing()
+            end_reason = 'finished'
+        except Exception:
+            end_reason = 'error'
+            raise
+        finally:
+            stream.close(end_reason)
+    
+    messages = generate()
+    gzipped = sse_gzip_accepted(request.headers.get('Accept-Encoding'))
+    response = Response(stream_with_context(gzip_sse(messages) if gzipped else messages), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Vary"] = "Accept-Encoding"
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
 
 
-        else:
-            # No log file found, simulate progress updates
-            steps = [
-                "Analyzing the project prompt...",
-                "Planning the game architecture...",
-                "Designing game mechanics...",
-                "Writing game code...",
-                "Implementing player controls...",
-                "Setting up game environment...",
-                "Creating visual elements...",
-                "Testing gameplay functionality...",
-                "Finalizing the implementation..."
-            ]
-            
-            for i, step in enumerate(steps):
-                progress = int(10 + (i * 10))
-                yield f"data: {json.dumps({'type': 'progress', 'value': progress})}"
-                yield f"data: {json.dumps({'type': 'log', 'title': f'🔄 {step}'})}"
-                time.sleep(1.5)  # Simulate processing time
-            
-            # Final completion message
-            yield f"data: {json.dumps({'type': 'progress', 'value': 100})}"
-            yield f"data: {json.dumps({'type': 'log', 'title': '✅ gpt-engineer process complete!'})}"
-            yield f"data: {json.dumps({'type': 'complete', 'final_code': 'Process complete! Check the preview tab to see your game.'})}"
-
-    
-    # Return SSE response
-    return app.response_class(
-        generate(),
-        mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no'
-        }
-    )
+@app.route('/stream_gpt_engineer_output')
+def stream_gpt_engineer_output():
+    """Stream gpt-engineer output in real-time using Server-Sent Events"""
+    project_name = request.args.get('project_name')
+    
+    if not project_name:
+        return jsonify({"status": "error", "message": "Project name is required"}), 400
+    
+    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
+    if not os.path.exists(project_dir):
+        return jsonify({"status": "error", "message": "Project not found"}), 404
+    
+    return sse_response(GpteOutputStream(project_name, sse_resume_offset()))
 
 @app.route('/check_project_status/<project_name>')
 def check_project_status(project_name):
@@ -2120,17 +3576,33 @@ def check_project_status(project_name):
     if os.path.exists(index_path):
         return jsonify({"status": "completed"})
     
-    # Check for log file
+    try:
+        log_range = requested_log_range()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    # Check for log file; with ?since= only the output after that offset is sent
     log_file = os.path.join(project_dir, 'gpt_engineer.log')
     log_content = ""
+    since, max_bytes = (log_range or (0, None, False))[:2]
+    next_offset = max(since, 0)
+    log_reset = False
     if os.path.exists(log_file):
         try:
-            with open(log_file, 'r') as f:
-                log_content = f.read()
+            size = os.path.getsize(log_file)
+            if since < 0:
+                since = max(size + since, 0)
+            elif since > size:
+                # The log was replaced since the caller last read it
+                since, log_reset = 0, True
+            log_content, next_offset = read_log_range(log_file, since, max_bytes)
         except Exception as e:
             print(f"Error reading log file: {e}")
     
-    return jsonify({"status": "generating", "log": log_content})
+    response = {"status": "generating", "log": log_content, "offset": since, "next_offset": next_offset}
+    if log_reset:
+        response["log_reset"] = True
+    return jsonify(response)
 
 @app.route('/check_status/<path:project_name>')
 def check_status(project_name):
@@ -2154,13 +3626,30 @@ def check_status(project_name):
             
         # Construct paths to check if files exist
         project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
-        done_marker = os.path.join(project_dir, ".gpte_done")
         generated_dir = os.path.join(project_dir, "workspace", "generated")
         static_dir = os.path.join(app.static_folder, "project_assets", project_name)
         index_file = os.path.join(static_dir, "index.html")
         
-        # Check for explicit completion marker
-        if os.path.exists(done_marker):
+        # Files in workspace/generated are only published once no run is in flight
+        if job_queue.active_job(project_name):
+            response = jsonify({"status": "generating", "message": "Generation in progress"})
+            response.headers.extend(headers)
+            return response
+        
+        # The latest job recorded for the project says how its last run ended
+        last_job = job_store.latest(project_name)
+        if last_job and last_job['state'] in ('failed', 'cancelled', 'timed_out'):
+            response = jsonify({
+                "status": "failed",
+                "message": last_job['error'] or f"Generation {last_job['state'].replace('_', ' ')}",
+                "job_id": last_job['id'],
+                "state": last_job['state'],
+                "exit_code": last_job['exit_code']
+            })
+            response.headers.extend(headers)
+            return response
+        
+        if last_job and last_job['state'] == 'completed':
             # Ensure we have more than just a placeholder
             # Check if there are JS files in the generated dir, suggesting a complete game
             generated_js_files = []
@@ -2179,10 +3668,10 @@ def check_status(project_name):
                 return response
             
             # If we just have plain HTML and no JS, it's likely just a placeholder
-            # Check how long the GPT-Engineer has been running
-            time_since_modified = time.time() - os.path.getmtime(done_marker)
-            # If it's been more than 30 seconds since the marker was created, consider it complete anyway
-            if time_since_modified > 30:
+            # Check how long ago the job finished
+            time_since_finished = time.time() - (last_job['finished_at'] or 0)
+            # If it's been more than 30 seconds since the job finished, consider it complete anyway
+            if time_since_finished > 30:
                 response = jsonify({"status": "completed", "message": "Generation complete but may be incomplete"})
                 response.headers.extend(headers)
                 return response
@@ -2215,19 +3704,15 @@ def check_status(project_name):
                 response = jsonify({"status": "generating", "message": "Basic files found, waiting for complete game"})
                 response.headers.extend(headers)
                 return response
-            
-        # Check workspace/generated directory
+        
+        # Check workspace/generated directory. Polling doesn't publish them:
+        # jobs publish when they finish, and /play serves these files directly
         if os.path.exists(generated_dir):
             files = os.listdir(generated_dir)
             if len(files) > 0 and any(f.endswith('.html') or f.endswith('.js') for f in files):
-                # Copy files if they exist but haven't been copied yet
-                try:
-                    copy_generated_files_to_static(project_name, project_dir)
-                    response = jsonify({"status": "completed", "message": "Files copied from generated directory"})
-                    response.headers.extend(headers)
-                    return response
-                except Exception as e:
-                    print(f"Error copying files: {e}")
+                response = jsonify({"status": "completed", "message": "Game files found in generated directory"})
+                response.headers.extend(headers)
+                return response
         
         # If we get here, files aren't ready yet
         response = jsonify({"status": "generating", "message": "Generation in progress"})
@@ -2239,6 +3724,52 @@ def check_status(project_name):
         response.headers.extend(headers)
         return response
 
+def read_log_bytes(log_path, start=0, max_bytes=None):
+    """Raw bytes of a log from offset start, up to max_bytes of them"""
+    with open(log_path, 'rb') as f:
+        f.seek(start)
+        return f.read() if max_bytes is None else f.read(max_bytes)
+
+
+def read_log_range(log_path, start=0, max_bytes=None):
+    """Read a log from byte offset start, returning (text, next_offset)
+
+    Reading stops short of a character still split at the end of what was
+    read, so next_offset is always a safe place to resume from.
+    """
+    data = read_log_bytes(log_path, start, max_bytes)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    text = decoder.decode(data)
+    return text, start + len(data) - len(decoder.getstate()[0])
+
+
+def requested_log_range():
+    """Log range a request asks for as (since, max_bytes, from_range_header), or None for the whole log
+
+    The range comes from ?since=&max_bytes= or a `Range: bytes=first-[last]`
+    header, where a suffix range (`bytes=-N`) gives a negative since. Raises
+    ValueError for a malformed range.
+    """
+    range_header = request.headers.get('Range')
+    if range_header:
+        match = LOG_RANGE_PATTERN.match(range_header.strip())
+        if not match or not (match.group(1) or match.group(2)):
+            raise ValueError(f"Unsupported Range header: {range_header}")
+        if not match.group(1):
+            return -int(match.group(2)), LOG_READ_MAX_BYTES, True
+        first, last = int(match.group(1)), match.group(2)
+        if last and int(last) < first:
+            raise ValueError(f"Unsupported Range header: {range_header}")
+        max_bytes = int(last) - first + 1 if last else LOG_READ_MAX_BYTES
+        return first, min(max_bytes, LOG_READ_MAX_BYTES), True
+    if 'since' in request.args or 'max_bytes' in request.args:
+        since = int(request.args.get('since', '0'))
+        max_bytes = int(request.args.get('max_bytes', str(LOG_READ_MAX_BYTES)))
+        if since < 0 or max_bytes <= 0:
+            raise ValueError("since must not be negative and max_bytes must be positive")
+        return since, min(max_bytes, LOG_READ_MAX_BYTES), False
+    return None
+
 @app.route('/read_log/<path:project_name>')
 def read_log(project_name):
     """Read content from a project's log file"""
@@ -2246,7 +3777,8 @@ def read_log(project_name):
     headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET',
-        'Access-Control-Allow-Headers': 'Content-Type',
+        'Access-Control-Allow-Headers': 'Content-Type, Range',
+        'Access-Control-Expose-Headers': 'Content-Range, X-Log-Offset, X-Log-Size, X-Log-Reset',
         'Cache-Control': 'no-cache, no-store, must-revalidate',
         'Pragma': 'no-cache',
         'Expires': '0'
@@ -2305,8 +3837,38 @@ def read_log(project_name):
         
         # Try to read the log file
         if os.path.exists(log_path):
-            with open(log_path, 'r') as f:
-                content = f.read()
+            try:
+                log_range = requested_log_range()
+            except ValueError as e:
+                return str(e), 416 if request.headers.get('Range') else 400, headers
+            
+            size = os.path.getsize(log_path)
+            headers['Accept-Ranges'] = 'bytes'
+            headers['X-Log-Size'] = str(size)
+            if log_range is None:
+                content, next_offset = read_log_range(log_path)
+                headers['X-Log-Offset'] = str(next_offset)
+                return content, 200, headers
+            
+            since, max_bytes, from_range_header = log_range
+            if from_range_header:
+                # Byte ranges are answered with the exact bytes, as HTTP requires
+                if since < 0:
+                    since = max(size + since, 0)
+                if since >= size:
+                    headers['Content-Range'] = f"bytes */{size}"
+                    return '', 416, headers
+                data = read_log_bytes(log_path, since, max_bytes)
+                headers['Content-Range'] = f"bytes {since}-{since + len(data) - 1}/{size}"
+                headers['X-Log-Offset'] = str(since + len(data))
+                return Response(data, 206, headers, mimetype='text/plain')
+            
+            # An offset past the end means the log was replaced, so the caller starts over
+            if since > size:
+                since = 0
+                headers['X-Log-Reset'] = '1'
+            content, next_offset = read_log_range(log_path, since, max_bytes)
+            headers['X-Log-Offset'] = str(next_offset)
             return content, 200, headers
         else:
             # Fallback content if log file wasn't created successfully
@@ -2330,9 +3892,8 @@ def update_index_with_js_link(target_dir):
                 script_tag = '<script src="js/game.js"></script>'
                 content = content.replace("</body>", f"    {script_tag}\n</body>")
                 
-                # Write the updated content
-                with open(index_path, 'w') as f:
-                    f.write(content)
+                # Published files are shared blobs, so the edit is published as a new one
+                asset_store.publish_bytes(content, index_path)
                 print("Updated index.html with JS script tag")
             
             return True
@@ -2341,23 +3902,62 @@ def update_index_with_js_link(target_dir):
         print(f"Error updating index.html: {str(e)}")
         return False
 
+def fix_file_urls(rel_path, source):
+    """Content to publish for a top-level HTML file with file:// URLs, with the URLs fixed; else None"""
+    if os.sep in rel_path or not rel_path.endswith('.html'):
+        return None
+    try:
+        with open(source, 'r') as f:
+            content = f.read()
+    except Exception as e:
+        print(f"Error fixing URLs in {rel_path}: {str(e)}")
+        return None
+    if 'file:///' not in content:
+        return None
+    print(f"Fixed file:// URLs in {rel_path}")
+    return content.replace('file:///', '/')
+
 def copy_generated_files_to_static(project_name, project_dir):
     """Copy generated game files to the static directory for serving"""
+    # Publishing is serialized per project so concurrent copies can't interleave.
+    # The files go into a new version that replaces the served one only once
+    # it is complete, and not at all if copying fails, in which case the
+    # error is raised to the caller (a job fails with it). No version is
+    # staged if the served one already has the generated files.
+    with project_lock(project_name):
+        published = published_directory(project_name)
+        if generated_files_published(project_name, project_dir, published.current_path()):
+            print(f"Published files for {project_name} are up to date")
+        else:
+            with published.publish() as target_dir:
+                _copy_generated_files_to_static(project_name, project_dir, target_dir)
+    game_assets_changed(project_name)
+    return True
+
+def generated_files_published(project_name, project_dir, current_dir):
+    """Whether the served version in current_dir already has everything a copy would publish"""
+    source_dir = os.path.join(project_dir, "workspace", "generated")
+    # Without a generated index.html the copy publishes fallback files, which
+    # it works out against the staged version itself
+    if current_dir is None or not os.path.exists(os.path.join(source_dir, "index.html")):
+        return False
+    if not os.path.exists(os.path.join(current_dir, ".copied_to_static")):
+        return False
+    return asset_store.in_sync(source_dir, current_dir, f"{project_name}.generated")
+
+def _copy_generated_files_to_static(project_name, project_dir, target_dir):
     try:
         source_dir = os.path.join(project_dir, "workspace", "generated")
-        target_dir = os.path.join(app.static_folder, "project_assets", project_name)
-        
-        # Create the target directory if it doesn't exist
-        os.makedirs(target_dir, exist_ok=True)
         
         print(f"Copying files from {source_dir} to {target_dir}")
         
-        # First ensure we have a valid index.html in the target directory
+        # First ensure we have a valid index.html in the target directory,
+        # unless the sync below is about to publish the generated one
         index_path = os.path.join(target_dir, "index.html")
-        if not os.path.exists(index_path) or os.path.getsize(index_path) < 500:
+        has_source_index = os.path.exists(os.path.join(source_dir, "index.html"))
+        if not has_source_index and (not os.path.exists(index_path) or os.path.getsize(index_path) < 500):
             # Create a simple placeholder/loading page that uses Three.js
-            with open(index_path, "w") as f:
-                f.write(f"""
+            asset_store.publish_bytes(f"""
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -2460,48 +4060,22 @@ def copy_generated_files_to_static(project_name, project_dir):
     </script>
 </body>
 </html>
-                """)
+                """, index_path)
         
-        # If the source directory exists, copy its contents
+        # If the source directory exists, publish its contents
         if os.path.exists(source_dir):
             # Create empty js directory if not present to make sure detection works properly
             js_dir = os.path.join(target_dir, "js")
             os.makedirs(js_dir, exist_ok=True)
             
-            # Copy all files from the source directory to the target directory
-            for item in os.listdir(source_dir):
-                source_item = os.path.join(source_dir, item)
-                target_item = os.path.join(target_dir, item)
-                
-                try:
-                    if os.path.isfile(source_item):
-                        # Copy the file
-                        shutil.copy2(source_item, target_item)
-                        print(f"Copied file: {item}")
-                        
-                        # Fix any file:// URLs in HTML files
-                        if item.endswith('.html'):
-                            try:
-                                with open(target_item, 'r') as f:
-                                    content = f.read()
-                                
-                                # Replace any file:// URLs
-                                if 'file:///' in content:
-                                    content = content.replace('file:///', '/')
-                                    with open(target_item, 'w') as f:
-                                        f.write(content)
-                                    print(f"Fixed file:// URLs in {item}")
-                            except Exception as e:
-                                print(f"Error fixing URLs in {item}: {str(e)}")
-                        
-                    elif os.path.isdir(source_item):
-                        # Copy the directory and its contents
-                        if os.path.exists(target_item):
-                            shutil.rmtree(target_item)
-                        shutil.copytree(source_item, target_item)
-                        print(f"Copied directory: {item}")
-                except Exception as e:
-                    print(f"Error copying {item}: {str(e)}")
+            # Sync the target with the source: only files changed since the
+            # last sync are read and linked, and removed ones are deleted
+            changed, removed = asset_store.sync_tree(source_dir, target_dir, f"{project_name}.generated",
+                                                     transform=fix_file_urls)
+            for rel_path in changed:
+                print(f"Copied file: {rel_path}")
+            for rel_path in removed:
+                print(f"Removed file: {rel_path}")
         else:
             print(f"Source directory not found: {source_dir}")
             # Create a default game.js file if no source directory exists
@@ -2510,8 +4084,7 @@ def copy_generated_files_to_static(project_name, project_dir):
             default_js = os.path.join(js_dir, "game.js")
             
             # Write a simple default game.js to make the detector work
-            with open(default_js, "w") as f:
-                f.write("""
+            asset_store.publish_bytes("""
 // Default Three.js game created as a fallback
 console.log('Loading default Three.js game');
 
@@ -2556,145 +4129,19 @@ function animate() {
     renderer.render(scene, camera);
 }
 animate();
-                """)
+                """, default_js)
             
             # Update the index.html to link to the default game.js
             update_index_with_js_link(target_dir)
         
-        # Create a marker file to indicate this game has been copied to static
-        with open(os.path.join(target_dir, ".copied_to_static"), "w") as f:
-            f.write(str(datetime.datetime.now()))
-        
-        return True
+        # Create a marker file to indicate this game has been copied to static.
+        # It records the first copy only, so an unchanged republish is a no-op.
+        marker_path = os.path.join(target_dir, ".copied_to_static")
+        if not os.path.exists(marker_path):
+            asset_store.publish_bytes(str(datetime.datetime.now()), marker_path)
     except Exception as e:
         print(f"Error in copy_generated_files_to_static: {str(e)}")
-        return False
-
-def run_gpte_process(project_name, project_dir):
-    """Helper function to run gpt-engineer on a project directory"""
-    try:
-        print(f"Starting gpt-engineer process for project: {project_name}")
-        
-        # Create a done file to track completion
-        done_file = os.path.join(project_dir, ".gpte_done")
-        if os.path.exists(done_file):
-            try:
-                os.remove(done_file)
-            except Exception as e:
-                print(f"Error removing completion marker file: {e}")
-        
-        # Ensure project directory exists
-        if not os.path.exists(project_dir):
-            print(f"Error: Project directory does not exist: {project_dir}")
-            return False
-            
-        # Get the gpt-engineer path
-        gpte_repo = os.path.expanduser('~/Desktop/gpt-engineer')
-        if not os.path.exists(gpte_repo):
-            print(f"Error: GPT Engineer directory not found at: {gpte_repo}")
-            return False
-            
-        print(f"Using GPT Engineer at: {gpte_repo}")
-        
-        # Get OpenAI API key from gpt-engineer .env file
-        api_key = None
-        env_path = os.path.join(gpte_repo, '.env')
-        if os.path.exists(env_path):
-            try:
-                with open(env_path, 'r') as f:
-                    for line in f:
-                        if line.strip().startswith('OPENAI_API_KEY='):
-                            api_key = line.strip().split('=', 1)[1]
-                            print("Found API key in .env file")
-                            break
-            except Exception as e:
-                print(f"Error reading .env file: {e}")
-                return False
-        
-        if not api_key:
-            print("OpenAI API key not found. Please set it in ~/Desktop/gpt-engineer/.env")
-            return False
-        
-        # Set up environment variables
-        env_vars = os.environ.copy()
-        env_vars['OPENAI_API_KEY'] = api_key
-        
-        # Update the gpt_engineer.log file to indicate we're starting the real process
-        log_path = os.path.join(project_dir, 'gpt_engineer.log')
-        with open(log_path, 'a') as f:
-            f.write("\n🚀 Starting the actual gpt-engineer process...\n")
-            f.write(f"Timestamp: {datetime.datetime.now()}\n\n")
-            f.write("Processing your game requirements with AI...\n")
-        
-        # Use our dedicated script for more reliable execution
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_gpt_engineer.sh')
-        if not os.path.exists(script_path):
-            print(f"Error: Script not found at {script_path}")
-            return False
-            
-        # Make sure script is executable
-        os.chmod(script_path, 0o755)
-        
-        # Log the command for debugging
-        safe_cmd = f"{script_path} \"{project_dir}\""
-        print(f"Running command: {safe_cmd}")
-        
-        with open(log_path, 'a') as f:
-            f.write(f"\nExecuting GPT Engineer at: {datetime.datetime.now()}\n")
-            f.write(f"Using run_gpt_engineer.sh script with project {project_name}\n\n")
-        
-        # Build the command to execute our script
-        noninteractive_cmd = f"{script_path} \"{project_dir}\""
-        
-        # Run the command in a subprocess and capture real-time output
-        process = subprocess.Popen(
-            noninteractive_cmd,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            env=env_vars
-        )
-        
-        # Process output in real-time while writing to the log file
-        while True:
-            output = process.stdout.readline()
-            if output == '' and process.poll() is not None:
-                break
-            if output:
-                print(f"GPT Engineer output: {output.strip()}")
-                # Write to the gpt_engineer.log file for streaming
-                with open(log_path, 'a') as f:
-                    f.write(output)
-                    f.flush()
-                print(output.strip())
-        
-        # Get the return code
-        return_code = process.poll()
-        
-        # Create a marker file to indicate completion
-        with open(done_file, "w") as f:
-            f.write(f"Process completed at {datetime.datetime.now()}")
-        
-        # Append completion message to log
-        with open(log_path, 'a') as f:
-            f.write("\n✅ Game generation complete!\n")
-            f.write(f"Completed at: {datetime.datetime.now()}\n")
-        
-        # Copy generated files to static directory
-        copy_generated_files_to_static(project_name, project_dir)
-        
-        return return_code == 0
-    except Exception as e:
-        print(f"Error running gpt-engineer: {e}")
-        # Log the error
-        try:
-            log_path = os.path.join(project_dir, 'gpt_engineer.log')
-            with open(log_path, 'a') as f:
-                f.write(f"\n❌ Error running gpt-engineer: {str(e)}\n")
-        except:
-            pass
-        return False
+        raise
 
 # Emergency endpoint to copy files to static directory
 @app.route('/copy_files_to_static/<project_name>', methods=['POST'])
@@ -2717,11 +4164,9 @@ def emergency_copy_files(project_name):
         # Call the existing function to copy files
         copy_generated_files_to_static(project_name, project_dir)
         
-        # Create a marker file to indicate completion
-        done_file = os.path.join(project_dir, ".gpte_done")
-        if not os.path.exists(done_file):
-            with open(done_file, "w") as f:
-                f.write(f"Files copied manually at {datetime.datetime.now()}")
+        # Record the manual copy as a finished job unless a real run is still in flight
+        if not job_queue.active_job(project_name):
+            job_store.record_manual(project_name, 'manual_copy')
                 
         return jsonify({
             "status": "success", 
@@ -2732,78 +4177,62 @@ def emergency_copy_files(project_name):
         print(f"Error in emergency copy: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Put back the version of a game published before the current one
+@app.route('/rollback_game/<project_name>', methods=['POST'])
+def rollback_game(project_name):
+    """Serve the previously published version of a game again"""
+    if not os.path.exists(os.path.join(BASE_PROJECT_DIR, project_name)):
+        return jsonify({"status": "error", "message": "Project not found"}), 404
+
+    try:
+        with project_lock(project_name):
+            version = published_directory(project_name).rollback()
+        if version is None:
+            return jsonify({"status": "error", "message": "No earlier version to roll back to"}), 409
+        print(f"Rolled {project_name} back to published version {version}")
+        game_assets_changed(project_name)
+        return jsonify({"status": "success", "message": f"Rolled back to {version}", "version": version})
+    except Exception as e:
+        print(f"Error rolling back {project_name}: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 # Stream generation logs in real-time using Server-Sent Events
 @app.route('/stream_logs/<project_name>', methods=['GET'])
 def stream_logs(project_name):
     """Stream GPT Engineer logs in real-time using Server-Sent Events"""
-    project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
-    log_file = os.path.join(project_dir, 'gpt_engineer.log')
-    done_file = os.path.join(project_dir, '.gpte_done')
-    
-    def generate():
-        # Send an initial message
-        yield f"data: {{\"status\": \"started\", \"message\": \"Starting log stream for {project_name}\", \"content\": \"> Starting GPT Engineer process for {project_name}...\\n\"}}\n\n"
-        
-        # Start with an empty position or at the end of the file if it exists
-        position = os.path.getsize(log_file) if os.path.exists(log_file) else 0
-        
-        # Counter for periodic updates when no new content
-        no_content_counter = 0
-        
-        while True:
-            try:
-                # Check if file exists now (it might be created after we start)
-                if os.path.exists(log_file):
-                    with open(log_file, 'r') as f:
-                        # Seek to the last position we read
-                        f.seek(position)
-                        # Read any new content
-                        new_content = f.read()
-                        # Update position for next time
-                        position = f.tell()
-                    
-                    if new_content:
-                        # Check if there's a prompt requiring input
-                        if "Do you want to execute this code? (Y/n)" in new_content or \
-                           "(Y/n)" in new_content or \
-                           "(y/N)" in new_content or \
-                           "[y/n]" in new_content:
-                            # Auto-respond with 'y'
-                            try:
-                                requests.get(f"http://localhost:5050/auto_respond_to_gpte/{project_name}")
-                                new_content += "\n> [AUTO] Automatically responding 'y' to prompt...\n"
-                            except Exception as e:
-                                print(f"Error auto-responding: {e}")
-                        
-                        # Process content to better highlight code sections
-                        processed_content = new_content
-                        # Escape any special characters in the content for JSON
-                        escaped_content = json.dumps(processed_content)[1:-1]  # Remove outer quotes
-                        yield f"data: {{\"status\": \"running\", \"content\": \"{escaped_content}\"}}\n\n"
-                        no_content_counter = 0
-                    else:
-                        # Periodically send a keep-alive message if no new content
-                        no_content_counter += 1
-                        if no_content_counter >= 10:  # About every 5 seconds
-                            yield f"data: {{\"status\": \"running\", \"content\": \".\"}}\n\n"
-                            no_content_counter = 0
-                
-                # Check if generation is complete
-                if os.path.exists(done_file):
-                    yield f"data: {{\"status\": \"completed\", \"message\": \"Generation completed\", \"content\": \"\\n> ✅ Game generation complete!\\n\"}}\n\n"
-                    break
-                    
-                # Sleep before checking again to reduce CPU usage
-                time.sleep(0.5)
-                
-            except Exception as e:
-                yield f"data: {{\"status\": \"error\", \"message\": \"Error reading log: {str(e)}\", \"content\": \"\\n> ❌ Error: {str(e)}\\n\"}}\n\n"
-                time.sleep(2)  # Sleep longer on error
-    
-    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
-    response.headers["Cache-Control"] = "no-cache"
-    response.headers["X-Accel-Buffering"] = "no"
-    return response
+    return sse_response(ProjectLogStream(project_name, sse_resume_offset()))
+
+def project_events_error(project_names):
+    """(message, status code) when a /project_events request's projects can't be streamed, else None"""
+    if not project_names:
+        return "At least one project is required", 400
+    if len(project_names) > PROJECT_EVENTS_MAX_PROJECTS:
+        return f"At most {PROJECT_EVENTS_MAX_PROJECTS} projects per stream", 400
+    for project_name in project_names:
+        if '..' in project_name or '/' in project_name or not os.path.isdir(os.path.join(BASE_PROJECT_DIR, project_name)):
+            return f"Project not found: {project_name}", 404
+    return None
+
+
+@app.route('/project_events', methods=['GET'])
+def project_events_stream():
+    """Stream log, progress, status and published-assets events for ?project=... (one or more)"""
+    project_names = list(dict.fromkeys(request.args.getlist('project')))
+    error = project_events_error(project_names)
+    if error:
+        return jsonify({"status": "error", "message": error[0]}), error[1]
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return sse_response(ProjectEventsStream(project_names, project_events_resume_offsets(last_event_id)))
+
+
+@app.route('/stream_stats', methods=['GET'])
+def stream_stats():
+    """Report the SSE streams this process has open, and its log tailers' subscriber counts"""
+    return jsonify({
+        "status": "success",
+        "streams": sse_stream_stats.stats(),
+        "log_tailers": log_broadcasters.stats()
+    })
 
 @app.route('/respond_to_gpte', methods=['POST'])
 def respond_to_gpte():
@@ -2821,33 +4250,18 @@ def respond_to_gpte():
         if not os.path.exists(project_dir):
             return jsonify({"status": "error", "message": "Project not found"}), 404
         
+        # Write the response to the running gpt-engineer's stdin
+        job = send_gpte_input(project_name, user_response, data.get('job_id'))
+        if job is None:
+            return jsonify({"status": "error", "message": "No gpt-engineer run is waiting for input"}), 409
+        
         # Log the response to the gpt_engineer.log file
         log_file = os.path.join(project_dir, "gpt_engineer.log")
         with open(log_file, 'a') as f:
             f.write(f"\n[USER RESPONSE]: {user_response}\n")
         
-        # Create a temporary file with the user's response
-        response_file = os.path.join(project_dir, ".user_response")
-        with open(response_file, 'w') as f:
-            f.write(user_response)
-        
-        # Create a pipe file to send the response directly to stdin
-        pipe_path = os.path.join(project_dir, ".pipe")
-        with open(pipe_path, 'w') as f:
-            f.write(f"{user_response}\n")
-        
-        # For compatibility, also try writing to a fifo pipe if it exists
-        fifo_path = os.path.join(project_dir, "input_pipe")
-        if os.path.exists(fifo_path):
-            try:
-                # Try non-blocking write to fifo
-                with open(fifo_path, 'w', blocking=False) as f:
-                    f.write(f"{user_response}\n")
-            except Exception as e:
-                print(f"Failed to write to fifo pipe: {e}")
-        
-        print(f"User response '{user_response}' saved for project {project_name}")
-        return jsonify({"status": "success", "message": "Response submitted successfully"})
+        print(f"User response '{user_response}' sent to job {job.id} for project {project_name}")
+        return jsonify({"status": "success", "message": "Response submitted successfully", "job_id": job.id})
     
     except Exception as e:
         print(f"Error handling user response: {str(e)}")
@@ -2863,49 +4277,16 @@ def auto_respond_to_gpte(project_name):
         if not os.path.exists(project_dir):
             return jsonify({"status": "error", "message": "Project not found"}), 404
         
-        # Send 'y' response through multiple channels to ensure it's caught
+        job = send_gpte_input(project_name, 'y')
+        if job is None:
+            return jsonify({"status": "error", "message": "No gpt-engineer run is waiting for input"}), 409
         
-        # 1. Append to log file
         log_file = os.path.join(project_dir, "gpt_engineer.log")
         with open(log_file, 'a') as f:
             f.write("\n[AUTO RESPONSE]: y\n")
         
-        # 2. Create a response file
-        response_file = os.path.join(project_dir, ".user_response")
-        with open(response_file, 'w') as f:
-            f.write("y")
-        
-        # 3. Try writing to .pipe file
-        pipe_path = os.path.join(project_dir, ".pipe")
-        with open(pipe_path, 'w') as f:
-            f.write("y\n")
-        
-        # 4. Try writing to stdin directly if possible
-        try:
-            # Try to find the gpte process
-            gpte_processes = os.popen(f"ps aux | grep python | grep gpt-engineer | grep {project_name}").read()
-            for line in gpte_processes.splitlines():
-                if project_name in line:
-                    pid = line.split()[1]
-                    try:
-                        with open(f"/proc/{pid}/fd/0", 'w') as f:
-                            f.write("y\n")
-                    except:
-                        pass  # Silently continue if this fails
-        except:
-            pass  # Silently continue if process finding fails
-        
-        # 5. Try a fifo pipe if it exists
-        fifo_path = os.path.join(project_dir, "input_pipe")
-        if os.path.exists(fifo_path):
-            try:
-                with open(fifo_path, 'w', blocking=False) as f:
-                    f.write("y\n")
-            except:
-                pass  # Silently continue if this fails
-        
         print(f"Auto-responded 'y' for project {project_name}")
-        return jsonify({"status": "success", "message": "Auto-responded with 'y'"})
+        return jsonify({"status": "success", "message": "Auto-responded with 'y'", "job_id": job.id})
     
     except Exception as e:
         print(f"Error in auto-response: {str(e)}")
@@ -2920,17 +4301,12 @@ def force_load_game(project_name):
         if not os.path.exists(project_dir):
             return jsonify({"status": "error", "message": "Project not found"}), 404
         
-        # Create a .gpte_done file to mark generation as complete
-        done_file = os.path.join(project_dir, '.gpte_done')
-        with open(done_file, 'w') as f:
-            f.write("forced_completion")
+        # Record a forced completion unless a real run is still in flight
+        if not job_queue.active_job(project_name):
+            job_store.record_manual(project_name, 'forced_completion')
         
         # Check if any HTML files exist
-        html_files = []
-        for root, _, files in os.walk(project_dir):
-            for file in files:
-                if file.endswith('.html'):
-                    html_files.append(os.path.join(root, file))
+        html_files = [path for path, _ in walk_game_files(project_dir) if path.endswith('.html')]
         
         # Try to find index.html
         index_html = None
@@ -2985,26 +4361,31 @@ def force_load_game(project_name):
         
         # Find all files to copy to the static assets directory 
         static_assets_dir = os.path.join('static', 'project_assets', project_name)
-        os.makedirs(static_assets_dir, exist_ok=True)
         
-        # Copy all relevant files
+        # Sync all relevant files into a new version of the published
+        # directory, serialized with other publishes of this project; only
+        # files changed since the last sync are linked again
         file_types = ('.html', '.js', '.css', '.png', '.jpg', '.gif', '.jpeg', '.json', '.mp3', '.wav')
-        for root, _, files in os.walk(project_dir):
-            for file in files:
-                if file.endswith(file_types):
-                    src_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(src_path, project_dir)
-                    dst_path = os.path.join(static_assets_dir, rel_path)
-                    
-                    # Create directories if needed
-                    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-                    
-                    # Copy the file
-                    try:
-                        shutil.copy2(src_path, dst_path)
-                        print(f"Copied file: {rel_path} to {dst_path}")
-                    except Exception as e:
-                        print(f"Error copying file {rel_path}: {e}")
+        include = lambda name: name.endswith(file_types)
+        with project_lock(project_name):
+            try:
+                published = published_directory(project_name)
+                current_dir = published.current_path()
+                # Nothing is staged if the served version is already up to date
+                if current_dir and asset_store.in_sync(project_dir, current_dir, f"{project_name}.project",
+                                                       include=include, skip_dirs=GAME_SOURCE_SKIP_DIRS):
+                    print(f"Published files for {project_name} are up to date")
+                else:
+                    with published.publish() as staging_dir:
+                        changed, removed = asset_store.sync_tree(project_dir, staging_dir, f"{project_name}.project",
+                                                                 include=include, skip_dirs=GAME_SOURCE_SKIP_DIRS)
+                    for rel_path in changed:
+                        print(f"Copied file: {rel_path}")
+                    for rel_path in removed:
+                        print(f"Removed file: {rel_path}")
+            except Exception as e:
+                print(f"Error copying files for {project_name}: {e}")
+        game_assets_changed(project_name)
         
         # Record all the files we found
         found_files = []
@@ -3025,7 +4406,7 @@ def force_load_game(project_name):
 
 @app.route('/locate_game_files/<project_name>', methods=['GET'])
 def locate_game_files(project_name):
-    """Locate the main game files for the project"""
+    """Locate the main game files for the project; read-only, publishing is force_load_game's job"""
     try:
         # Get the project directory
         project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
@@ -3037,18 +4418,14 @@ def locate_game_files(project_name):
         js_files = []
         css_files = []
         
-        for root, _, files in os.walk(project_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, project_dir)
-                
-                if file.endswith('.html'):
-                    # Serve HTML files from special route
-                    html_files.append(f"/play_raw/{project_name}/{rel_path}")
-                elif file.endswith('.js'):
-                    js_files.append(f"/play_raw/{project_name}/{rel_path}")
-                elif file.endswith('.css'):
-                    css_files.append(f"/play_raw/{project_name}/{rel_path}")
+        for _, rel_path in walk_game_files(project_dir):
+            if rel_path.endswith('.html'):
+                # Serve HTML files from special route
+                html_files.append(f"/play_raw/{project_name}/{rel_path}")
+            elif rel_path.endswith('.js'):
+                js_files.append(f"/play_raw/{project_name}/{rel_path}")
+            elif rel_path.endswith('.css'):
+                css_files.append(f"/play_raw/{project_name}/{rel_path}")
         
         # Also check in the static assets directory
         static_assets_dir = os.path.join('static', 'project_assets', project_name)
@@ -3066,28 +4443,6 @@ def locate_game_files(project_name):
                     elif file.endswith('.css'):
                         css_files.append(f"/static/project_assets/{project_name}/{rel_path}")
         
-        # Ensure all directories exist in project assets
-        ensure_project_assets_dir = os.path.join('static', 'project_assets', project_name)
-        os.makedirs(ensure_project_assets_dir, exist_ok=True)
-        
-        # Make sure we copy all project files to static assets
-        for root, _, files in os.walk(project_dir):
-            for file in files:
-                if file.endswith(('.html', '.js', '.css', '.png', '.jpg', '.gif', '.json')):
-                    src_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(src_path, project_dir)
-                    dst_path = os.path.join(ensure_project_assets_dir, rel_path)
-                    
-                    # Create directories if needed
-                    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-                    
-                    # Copy the file
-                    try:
-                        shutil.copy2(src_path, dst_path)
-                        print(f"Copied file: {rel_path} to {dst_path}")
-                    except Exception as e:
-                        print(f"Error copying file {rel_path}: {e}")
-        
         # Return the located files
         return jsonify({
             "status": "success", 
@@ -3111,8 +4466,8 @@ def serve_project_file(project_name, file_path):
             return "Project not found", 404
         
         # Check if the file exists
-        file_path_full = os.path.join(project_dir, file_path)
-        if not os.path.exists(file_path_full) or not os.path.isfile(file_path_full):
+        file_path_full = safe_join(project_dir, file_path)
+        if not file_path_full or not os.path.isfile(file_path_full):
             return "File not found", 404
         
         # Determine content type based on file extension
@@ -3127,21 +4482,49 @@ def serve_project_file(project_name, file_path):
             content_type = 'application/json'
         elif file_path.endswith(('.png', '.jpg', '.jpeg', '.gif')):
             # Let Flask determine content type for images
-            return send_from_directory(project_dir, file_path)
+            content_type = None
         
-        # Read the file
-        with open(file_path_full, 'r') as f:
-            content = f.read()
-        
-        # Return the content with appropriate content type
-        response = make_response(content)
-        response.headers['Content-Type'] = content_type
-        return response
+        # Streamed from disk with validators, so a repeat load is a 304
+        return send_game_file(file_path_full, mimetype=content_type)
     
     except Exception as e:
         print(f"Error serving file {file_path}: {str(e)}")
         return str(e), 500
 
+@app.route('/job_status/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report the state and queue position of a generation job"""
+    job = job_queue.get(job_id)
+    if not job:
+        # Jobs pruned from memory (or from before a restart) live on in the job store
+        record = job_store.get(job_id)
+        if not record:
+            return jsonify({"status": "error", "message": "Job not found"}), 404
+        fields = {"job_id": record['id'], "project": record['project']}
+        for field in ('kind', 'priority', 'state', 'phase', 'exit_code', 'error', 'created_at', 'started_at', 'finished_at',
+                      'manifest', 'worker', 'tokens_estimate', 'completion_tokens'):
+            fields[field] = record[field]
+        return jsonify({"status": "success", **fields, "queue_position": 0, "queue": job_queue.stats()})
+    
+    return jsonify({
+        "status": "success",
+        **job.to_dict(),
+        "queue_position": job_queue.position(job),
+        "queue": job_queue.stats()
+    })
+
+@app.route('/cancel_job/<job_id>', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running generation job"""
+    job = job_queue.cancel(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    
+    if job.stop_reason != 'cancelled':
+        return jsonify({"status": "error", "message": f"Job already {job.state}", **job.to_dict()}), 409
+    
+    return jsonify({"status": "success", "message": "Job cancelled", **job.to_dict()})
+
 @app.route('/rebuild_css', methods=['GET'])
 def rebuild_css():
     """Rebuild Tailwind CSS (development only)"""
@@ -3152,4 +4535,8 @@ def rebuild_css():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 if __name__ == '__main__':
+    # With the debug reloader only the serving child (not the watcher) owns the
+    # jobs; in broker mode workers settle their own jobs when they start
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' and GPTE_DISPATCH == 'local':
+        reconcile_interrupted_jobs()
     app.run(debug=True, port=5050)
@@ -0,0 +1,151 @@
+"""ASGI entry point: the SSE log streams as coroutines, everything else through Flask.
+
+Under the Flask server every open EventSource holds a thread for as long as
+its page is open. Serving the app through ASGI instead:
+
+    pip install -r requirements-asgi.txt
+    uvicorn asgi:application --port 5050
+
+runs /stream_logs, /stream_gpt_engineer_output and /project_events as
+coroutines on one event loop, so an idle viewer costs a little memory rather
+than a thread. Every other route, including the status and log polling
+endpoints, goes to the unchanged Flask app, which handles each of those
+short requests on a worker thread. Run a single uvicorn worker process, as with the Flask server: the
+job queue and log tailers live in the process.
+"""
+
+import asyncio
+import contextlib
+import os
+import zlib
+
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import (BASE_PROJECT_DIR, GPTE_DISPATCH, SSE_HEARTBEAT, GpteOutputStream, ProjectEventsStream, ProjectLogStream,
+                 app as flask_app, project_events_error, project_events_resume_offsets, reconcile_interrupted_jobs,
+                 sse_gzip_accepted, sse_resume_offset)
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'Vary': 'Accept-Encoding'}
+
+
+async def stream_messages(stream):
+    """Drive an SSEStream from the event loop, the async twin of app.sse_response"""
+    loop = asyncio.get_running_loop()
+    # Starlette cancels this generator when the client disconnects, which
+    # ends the stream as 'disconnected'
+    end_reason = 'disconnected'
+    retry = stream.start()
+    try:
+        yield retry
+        # Anything that touches the disk or the job store runs off the loop
+        for message in await asyncio.to_thread(lambda: list(stream.opening())):
+            yield message
+        if stream.paced:
+            for message, delay in stream.paced_messages():
+                yield message
+                if delay:
+                    await asyncio.sleep(delay)
+            end_reason = 'finished'
+            return
+
+        subscription = await asyncio.to_thread(stream.subscribe, loop)
+        expired = None
+        try:
+            while not stream.done:
+                expired = stream.expired()
+                if expired:
+                    break
+                event = await subscription.get(timeout=stream.wait_timeout())
+                if event is None:
+                    yield SSE_HEARTBEAT
+                    continue
+                # Events can mean a job store query, a directory walk or an
+                # auto-answer, none of which should hold up other streams
+                for message in await asyncio.to_thread(lambda: list(stream.handle_event(event))):
+                    yield message
+        finally:
+            subscription.close()
+        if expired:
+            end_reason = expired
+            return
+        for message in await asyncio.to_thread(lambda: list(stream.closing())):
+            yield message
+        end_reason = 'finished'
+    except Exception:
+        end_reason = 'error'
+        raise
+    finally:
+        stream.close(end_reason)
+
+
+async def gzip_messages(messages):
+    """The async twin of app.gzip_sse"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        async for message in messages:
+            yield compressor.compress(message.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        await messages.aclose()
+
+
+def sse_streaming_response(request, stream):
+    # Starlette's GZipMiddleware leaves event streams alone, so they are compressed here
+    messages = stream_messages(stream)
+    if not sse_gzip_accepted(request.headers.get('Accept-Encoding')):
+        return StreamingResponse(messages, media_type='text/event-stream', headers=SSE_HEADERS)
+    return StreamingResponse(gzip_messages(messages), media_type='text/event-stream',
+                             headers={**SSE_HEADERS, 'Content-Encoding': 'gzip'})
+
+
+def resume_offset(request):
+    # An empty id (not None) stops sse_resume_offset looking for a Flask request
+    return sse_resume_offset(request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id') or '')
+
+
+async def stream_logs(request):
+    stream = ProjectLogStream(request.path_params['project_name'], resume_offset(request))
+    return sse_streaming_response(request, stream)
+
+
+async def stream_gpt_engineer_output(request):
+    project_name = request.query_params.get('project_name')
+    if not project_name:
+        return JSONResponse({"status": "error", "message": "Project name is required"}, status_code=400)
+    if not os.path.exists(os.path.join(BASE_PROJECT_DIR, project_name)):
+        return JSONResponse({"status": "error", "message": "Project not found"}, status_code=404)
+
+    stream = GpteOutputStream(project_name, resume_offset(request))
+    return sse_streaming_response(request, stream)
+
+
+async def project_events(request):
+    project_names = list(dict.fromkeys(request.query_params.getlist('project')))
+    error = project_events_error(project_names)
+    if error:
+        return JSONResponse({"status": "error", "message": error[0]}, status_code=error[1])
+    last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    stream = ProjectEventsStream(project_names, project_events_resume_offsets(last_event_id))
+    return sse_streaming_response(request, stream)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # The Flask server settles interrupted jobs in app.py's __main__, which doesn't run here
+    if GPTE_DISPATCH == 'local':
+        await asyncio.to_thread(reconcile_interrupted_jobs)
+    yield
+
+
+application = Starlette(
+    routes=[
+        Route('/stream_logs/{project_name}', stream_logs, methods=['GET']),
+        Route('/stream_gpt_engineer_output', stream_gpt_engineer_output, methods=['GET']),
+        Route('/project_events', project_events, methods=['GET']),
+        Mount('/', app=WsgiToAsgi(flask_app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,431 @@
+"""Content-addressed storage for published game files.
+
+Every file published to static/project_assets is stored once, by the
+SHA-256 of its content, under ASSET_STORE_DIR, and the published path is a
+hardlink to that blob. Games share most of their boilerplate, so identical
+files across projects and across runs of one project take up space once,
+and republishing a file that hasn't changed is a couple of stats: the
+source's size, mtime and inode identify content already hashed, and a
+published path that is already a link to the right blob is left alone.
+
+Published files must therefore never be written in place, since that
+would change the blob under every project linking to it. Anything that
+alters a published file stores the new content as a blob of its own with
+publish_bytes(). Blobs are read-only to help catch writes that don't.
+
+The store has to be on the same filesystem as the static folder for
+hardlinks to work; elsewhere publishing falls back to copying the blob.
+
+Whole directories are published with sync_tree(), which keeps a manifest of
+what it last published from each source under manifests/ in the store. A
+file whose size and mtime match its manifest entry, and whose published copy
+is still the one the sync put there, is not hashed or linked again, and
+files gone from the source since the last sync are removed. in_sync() makes
+the same check without syncing, to tell a no-op publish apart up front.
+
+A project's published directory is a PublishedDirectory: a symlink to one
+complete version of the game, which publishing replaces as a whole. Blobs
+that no version links to any more are removed by sweep() once publishing
+has pruned the versions that used them.
+"""
+
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+
+# A blob stored less than this long ago (seconds) may be about to be linked,
+# so sweep() leaves it alone even if nothing links to it yet
+BLOB_SWEEP_GRACE = 600
+
+
+class AssetStore:
+    """Blobs by content hash, hardlinked into place when published"""
+
+    def __init__(self, root, max_digests=4096):
+        self.root = root
+        # path -> (size, mtime_ns, inode, digest) for sources already hashed,
+        # least recently used first; only the newest max_digests are kept
+        self._digests = collections.OrderedDict()
+        self.max_digests = max_digests
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def digest(self, path):
+        """SHA-256 of a file's content; unchanged files aren't read again"""
+        st = os.stat(path)
+        key = (st.st_size, st.st_mtime_ns, st.st_ino)
+        with self._lock:
+            known = self._digests.get(path)
+            if known and known[:3] == key:
+                self._digests.move_to_end(path)
+                return known[3]
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self._lock:
+            self._digests[path] = key + (digest,)
+            self._digests.move_to_end(path)
+            while len(self._digests) > self.max_digests:
+                self._digests.popitem(last=False)
+        return digest
+
+    def add_file(self, path):
+        """Store a file's content, returning its digest"""
+        digest = self.digest(path)
+        if not os.path.exists(self.blob_path(digest)):
+            self._store(digest, lambda tmp: shutil.copyfile(path, tmp))
+        return digest
+
+    def add_bytes(self, data):
+        """Store content, returning its digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        if not os.path.exists(self.blob_path(digest)):
+            def write(tmp):
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+            self._store(digest, write)
+        return digest
+
+    def _store(self, digest, write):
+        # Written under a temporary name and renamed, so a blob is never seen half-written
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp = f"{blob}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(tmp)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, blob)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def link(self, digest, target):
+        """Point target at a blob; False if it already was"""
+        blob = self.blob_path(digest)
+        try:
+            if os.path.samefile(blob, target):
+                return False
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Swapped in with a rename, which also means a file that was already
+        # there (maybe another blob's link) is replaced rather than written over
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            try:
+                os.link(blob, tmp)
+            except OSError:
+                # A different filesystem, or one without hardlinks
+                shutil.copyfile(blob, tmp)
+            os.replace(tmp, target)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return True
+
+    def publish_file(self, source, target):
+        """Publish a file's content at target; False if target already had it"""
+        return self.link(self.add_file(source), target)
+
+    def publish_bytes(self, data, target):
+        """Publish content at target, e.g. an edited copy of a published file"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return self.link(self.add_bytes(data), target)
+
+    def sweep(self, grace=BLOB_SWEEP_GRACE):
+        """Remove blobs no published file links to any more; returns how many went
+
+        A blob's only link left is the store's own once the versions using it
+        are gone. Where publishing had to copy rather than link, blobs never
+        have other links and are removed too, which only costs storing them
+        again. Blobs whose links changed within grace seconds are kept, since
+        a publish may be about to link them.
+        """
+        cutoff = time.time() - grace
+        removed = 0
+        try:
+            prefixes = os.listdir(self.root)
+        except OSError:
+            return 0
+        for prefix in prefixes:
+            if len(prefix) != 2:
+                continue
+            bucket = os.path.join(self.root, prefix)
+            try:
+                entries = list(os.scandir(bucket))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    if st.st_nlink == 1 and st.st_ctime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _manifest_path(self, name):
+        return os.path.join(self.root, 'manifests', f"{name}.json")
+
+    def _load_manifest(self, name):
+        """rel path -> {"size", "mtime_ns", "digest", "target_ino"} as of the last sync_tree() under this name"""
+        try:
+            with open(self._manifest_path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, name, manifest):
+        path = self._manifest_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(manifest, f, sort_keys=True)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _source_files(self, source_dir, include, skip_dirs):
+        # (rel path, path, stat) for each file sync_tree() publishes from source_dir
+        for root, dirs, files in os.walk(source_dir):
+            dirs[:] = [name for name in dirs if name not in skip_dirs]
+            for filename in files:
+                if include is not None and not include(filename):
+                    continue
+                source = os.path.join(root, filename)
+                try:
+                    st = os.stat(source)
+                except OSError:
+                    continue
+                yield os.path.relpath(source, source_dir), source, st
+
+    @staticmethod
+    def _unchanged(entry, st, target):
+        # Unchanged if the source is and the target is still the file
+        # the sync published, rather than something put there since
+        if not entry or entry['size'] != st.st_size or entry['mtime_ns'] != st.st_mtime_ns:
+            return False
+        try:
+            return os.stat(target).st_ino == entry['target_ino']
+        except OSError:
+            return False
+
+    def in_sync(self, source_dir, target_dir, manifest_name, include=None, skip_dirs=()):
+        """Whether sync_tree() would find nothing to do, judged from its manifest alone
+
+        Nothing is read, hashed or linked, so a caller can tell a republish
+        is a no-op before preparing a target for it. A file that looks
+        changed may still turn out to have the same content.
+        """
+        previous = self._load_manifest(manifest_name)
+        seen = 0
+        for rel_path, _, st in self._source_files(source_dir, include, skip_dirs):
+            if not self._unchanged(previous.get(rel_path), st, os.path.join(target_dir, rel_path)):
+                return False
+            seen += 1
+        # Every source file has an entry, so any other entry is a file to remove
+        return seen == len(previous)
+
+    def sync_tree(self, source_dir, target_dir, manifest_name, include=None, skip_dirs=(), transform=None):
+        """Bring target_dir in line with source_dir, touching only what changed since the last sync
+
+        include(name) picks the files to publish and directories named in
+        skip_dirs aren't walked at all. transform(rel_path, source) may return
+        content to publish in place of a file's own. Callers serialize syncs
+        that share a manifest name. Returns (changed, removed) relative paths.
+        """
+        target_dir = os.path.normpath(target_dir)
+        previous = self._load_manifest(manifest_name)
+        manifest = {}
+        changed = []
+        for rel_path, source, st in self._source_files(source_dir, include, skip_dirs):
+            target = os.path.join(target_dir, rel_path)
+            entry = previous.get(rel_path)
+            if self._unchanged(entry, st, target):
+                manifest[rel_path] = entry
+                continue
+
+            content = transform(rel_path, source) if transform else None
+            if content is None:
+                digest = self.add_file(source)
+            else:
+                digest = self.add_bytes(content.encode('utf-8') if isinstance(content, str) else content)
+            if self.link(digest, target):
+                changed.append(rel_path)
+            manifest[rel_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": digest,
+                                  "target_ino": os.stat(target).st_ino}
+
+        removed = [rel_path for rel_path in previous if rel_path not in manifest]
+        for rel_path in removed:
+            target = os.path.join(target_dir, rel_path)
+            # Left alone if something else has been published there since
+            try:
+                if os.lstat(target).st_ino == previous[rel_path]['target_ino']:
+                    os.remove(target)
+            except OSError:
+                pass
+            # Drop directories the removal left empty, up to target_dir
+            parent = os.path.dirname(target)
+            while parent != target_dir and os.path.isdir(parent) and not os.listdir(parent):
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+
+        if manifest != previous:
+            self._save_manifest(manifest_name, manifest)
+        return changed, removed
+
+
+class PublishedDirectory:
+    """A directory served as a symlink to one of its versions, swapped whole on publish
+
+    publish() builds the next version in a staging directory, starting from
+    links to the current version's files, and only then points the symlink at
+    it with a rename, so a reader sees the old version or the new one and
+    never a mix. The version it replaced is kept for rollback(), and versions
+    are never changed once published.
+    """
+
+    def __init__(self, path, versions_dir, store=None):
+        self.path = path
+        self.versions_dir = versions_dir
+        # The AssetStore the versions' files link into, swept after pruning
+        self.store = store
+
+    def version_path(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def versions(self):
+        """Published versions, oldest first"""
+        try:
+            names = os.listdir(self.versions_dir)
+        except OSError:
+            return []
+        return sorted((name for name in names if name[:1] == 'v' and name[1:].isdigit()), key=lambda name: int(name[1:]))
+
+    def current(self):
+        """The version the directory points at, or None if it isn't versioned (yet)"""
+        if not os.path.islink(self.path):
+            return None
+        return os.path.basename(os.readlink(self.path))
+
+    def current_path(self):
+        """Where the current version's files are, or None if it isn't versioned (yet)"""
+        current = self.current()
+        return self.version_path(current) if current else None
+
+    def _point_at(self, version):
+        tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        os.symlink(os.path.relpath(self.version_path(version), os.path.dirname(self.path)), tmp)
+        try:
+            os.replace(tmp, self.path)
+        except OSError:
+            os.remove(tmp)
+            raise
+
+    def _adopt(self):
+        # A directory published before versioning becomes the first version.
+        # It is briefly missing between the two renames.
+        if os.path.isdir(self.path) and not os.path.islink(self.path):
+            os.makedirs(self.versions_dir, exist_ok=True)
+            version = self._install(self.path)
+            self._point_at(version)
+        return self.current()
+
+    def _install(self, staging):
+        # Takes the next free version name; a rename onto a version another
+        # process just installed fails, and the next number is tried
+        versions = self.versions()
+        number = int(versions[-1][1:]) + 1 if versions else 1
+        while True:
+            version = f"v{number}"
+            try:
+                os.rename(staging, self.version_path(version))
+                return version
+            except OSError:
+                if not os.path.exists(self.version_path(version)):
+                    raise
+                number += 1
+
+    @contextlib.contextmanager
+    def publish(self):
+        """Yield a staging copy of the current version to change; it is swapped in on exit
+
+        Nothing is swapped if the staging copy ends up the same as the
+        current version, or if the block raises.
+        """
+        current = self._adopt()
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = os.path.join(self.versions_dir, f".staging-{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        try:
+            if current:
+                _link_tree(self.version_path(current), staging)
+            yield staging
+            if current and _tree_inodes(staging) == _tree_inodes(self.version_path(current)):
+                shutil.rmtree(staging)
+                return
+            version = self._install(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self._point_at(version)
+        # Keep the version just replaced for rollback, and anything newer that
+        # a concurrent publish may be about to swap in
+        newest = int(version[1:])
+        pruned = False
+        for old in self.versions():
+            if old != current and int(old[1:]) < newest:
+                shutil.rmtree(self.version_path(old), ignore_errors=True)
+                pruned = True
+        if pruned and self.store is not None:
+            self.store.sweep()
+
+    def rollback(self):
+        """Point back at the newest version older than the current one; returns it, or None if there is none"""
+        current = self.current()
+        if current is None:
+            return None
+        older = [version for version in self.versions() if int(version[1:]) < int(current[1:])]
+        if not older:
+            return None
+        self._point_at(older[-1])
+        return older[-1]
+
+
+def _link_tree(source_dir, target_dir):
+    for root, dirs, files in os.walk(source_dir):
+        target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        for name in dirs:
+            os.makedirs(os.path.join(target_root, name), exist_ok=True)
+        for name in files:
+            try:
+                os.link(os.path.join(root, name), os.path.join(target_root, name))
+            except OSError:
+                shutil.copy2(os.path.join(root, name), os.path.join(target_root, name))
+
+
+def _tree_inodes(base_dir):
+    inodes = {}
+    for root, _, files in os.walk(base_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            inodes[os.path.relpath(path, base_dir)] = os.lstat(path).st_ino
+    return inodes
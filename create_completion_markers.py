@@ -2,9 +2,12 @@
 
 import os
 import datetime
-import glob
+
+from asset_store import AssetStore, PublishedDirectory
 
 BASE_PROJECT_DIR = os.path.expanduser("~/Desktop/gpte-projects")
+# The same store the app publishes game files through
+ASSET_STORE_DIR = os.environ.get('ASSET_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'asset_store'))
 
 def create_completion_markers():
     """Create .gpte_done files for any projects that are missing them"""
@@ -12,6 +15,7 @@ def create_completion_markers():
                    if os.path.isdir(os.path.join(BASE_PROJECT_DIR, d))]
     
     print(f"Found {len(project_dirs)} projects")
+    asset_store = AssetStore(ASSET_STORE_DIR)
     
     for project_name in project_dirs:
         project_dir = os.path.join(BASE_PROJECT_DIR, project_name)
@@ -26,24 +30,24 @@ def create_completion_markers():
                 with open(done_file, 'w') as f:
                     f.write(f"Process completed at {datetime.datetime.now()}")
                 
-                # Copy files to static/project_assets
-                project_assets_dir = os.path.join('static', 'project_assets', project_name)
-                os.makedirs(project_assets_dir, exist_ok=True)
+                # Copy files to static/project_assets, as a new version of
+                # the published directory like the app publishes them
+                published = PublishedDirectory(os.path.join('static', 'project_assets', project_name),
+                                               os.path.join('static', 'project_versions', project_name), asset_store)
                 
                 # Copy files from generated directory
                 if os.path.exists(generated_dir):
-                    for filename in os.listdir(generated_dir):
-                        if filename.endswith(('.html', '.js', '.css')):
-                            src_path = os.path.join(generated_dir, filename)
-                            dst_path = os.path.join(project_assets_dir, filename)
-                            try:
-                                with open(src_path, 'r') as src_file:
-                                    content = src_file.read()
-                                with open(dst_path, 'w') as dst_file:
-                                    dst_file.write(content)
-                                print(f"  Copied {filename} to {dst_path}")
-                            except Exception as e:
-                                print(f"  Error copying {filename}: {e}")
+                    with published.publish() as project_assets_dir:
+                        for filename in os.listdir(generated_dir):
+                            if filename.endswith(('.html', '.js', '.css')):
+                                src_path = os.path.join(generated_dir, filename)
+                                dst_path = os.path.join(project_assets_dir, filename)
+                                try:
+                                    # Published files are links to shared blobs, never written in place
+                                    asset_store.publish_file(src_path, dst_path)
+                                    print(f"  Copied {filename}")
+                                except Exception as e:
+                                    print(f"  Error copying {filename}: {e}")
 
 if __name__ == "__main__":
     create_completion_markers()
@@ -0,0 +1,373 @@
+"""Launches gpt-engineer runs for the generation job queue.
+
+Runs either start a fresh `python -m gpt_engineer.applications.cli.main`
+subprocess, or are forked from a warm forkserver (zygote) process that has
+already imported gpt-engineer and its dependencies. Both kinds of run expose
+the same small interface so callers can stream output lines, wait for the
+exit code and kill the run without caring how it was started.
+
+Every run leads its own process group, so killing a run also takes down any
+processes gpt-engineer started on its behalf. Runs also own the child's
+stdin, so answers to gpt-engineer's prompts are written straight to it with
+write_input().
+"""
+
+import codecs
+import io
+import multiprocessing
+import os
+import runpy
+import select
+import signal
+import subprocess
+import sys
+import threading
+
+try:
+    from multiprocessing import context as mp_context, forkserver, popen_forkserver, reduction, spawn, util
+except ImportError:
+    # No forkserver on this platform, so runs always start cold
+    popen_forkserver = None
+
+GPTE_CLI_MODULE = 'gpt_engineer.applications.cli.main'
+# _WarmRunPopen._launch copies the stdlib forkserver launch of these CPython
+# versions; on any other runs start cold rather than with a copy that may no
+# longer match the internals it calls
+WARM_RUN_PYTHON_VERSIONS = ((3, 8), (3, 13))
+# Seconds between SIGTERM and SIGKILL when a run is killed
+GPTE_KILL_GRACE_SECONDS = 5
+# Seconds an unfinished output line (such as a "(Y/n)" prompt) may sit before it is passed on as is
+GPTE_PARTIAL_LINE_SECONDS = 0.5
+
+_warm_context = None
+_warm_context_lock = threading.Lock()
+
+
+def kill_process_group(pid, grace=GPTE_KILL_GRACE_SECONDS):
+    """SIGTERM a run's whole process group, escalating to SIGKILL after a grace period"""
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return False
+    except PermissionError as e:
+        print(f"Cannot signal process group {pid}: {e}")
+        return False
+
+    def escalate():
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    timer = threading.Timer(grace, escalate)
+    timer.daemon = True
+    timer.start()
+    return True
+
+
+def process_group_alive(pgid):
+    """True if any process is still in the given process group"""
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def process_start_time(pid):
+    """Start time of a process in clock ticks since boot, or None where /proc isn't available
+
+    Stored next to a run's pid so a later server can tell the run apart from
+    an unrelated process that was given the same pid.
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces, so count fields after its closing parenthesis
+    fields = stat[stat.rfind(')') + 2:].split()
+    try:
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+def _split_output(read_chunk, wait_for_output):
+    """Yield decoded output lines, plus any unfinished line that stops growing
+
+    read_chunk() returns the next bytes of output (b'' at the end) and
+    wait_for_output(timeout) reports whether any is ready. gpt-engineer's
+    prompts don't end in a newline, so a partial line is passed on after
+    GPTE_PARTIAL_LINE_SECONDS without more output rather than held back
+    until the prompt is answered.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    while True:
+        if pending and not wait_for_output(GPTE_PARTIAL_LINE_SECONDS):
+            yield pending
+            pending = ''
+            continue
+        chunk = read_chunk()
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        while '\n' in pending:
+            line, pending = pending.split('\n', 1)
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+class SubprocessGpteRun:
+    """gpt-engineer running as a fresh Python interpreter"""
+
+    def __init__(self, gpte_repo, project_dir, args, env):
+        self._process = subprocess.Popen(
+            ['python', '-m', GPTE_CLI_MODULE, project_dir] + list(args),
+            cwd=gpte_repo,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env,
+            start_new_session=True
+        )
+        self.pid = self._process.pid
+        self._input_lock = threading.Lock()
+
+    def output_lines(self):
+        """Yield output lines (with line endings) until the run closes its output"""
+        fd = self._process.stdout.fileno()
+        yield from _split_output(lambda: os.read(fd, 65536),
+                                 lambda timeout: bool(select.select([fd], [], [], timeout)[0]))
+
+    def write_input(self, text):
+        """Send a line to the run's stdin; False if it has stopped reading"""
+        with self._input_lock:
+            try:
+                self._process.stdin.write(text.encode('utf-8') + b'\n')
+                self._process.stdin.flush()
+                return True
+            except (BrokenPipeError, ValueError, OSError):
+                return False
+
+    def wait(self):
+        return self._process.wait()
+
+    def kill(self):
+        if not kill_process_group(self.pid):
+            self._process.kill()
+
+
+if popen_forkserver is not None:
+    class _WarmRunPopen(popen_forkserver.Popen):
+        """The forkserver Popen, minus having the child import the parent's __main__
+
+        A forkserver child normally runs the parent's main script (app.py,
+        worker.py) as __mp_main__ before unpickling its target. The target here
+        lives in this module, so that would only repeat the app's module-level
+        setup in every run. This is popen_forkserver.Popen._launch with the main
+        module left out of the preparation data.
+        """
+
+        def _launch(self, process_obj):
+            prep_data = spawn.get_preparation_data(process_obj._name)
+            prep_data.pop('init_main_from_path', None)
+            prep_data.pop('init_main_from_name', None)
+            buf = io.BytesIO()
+            popen_forkserver.set_spawning_popen(self)
+            try:
+                reduction.dump(prep_data, buf)
+                reduction.dump(process_obj, buf)
+            finally:
+                popen_forkserver.set_spawning_popen(None)
+
+            self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+            _parent_w = os.dup(w)
+            self.finalizer = util.Finalize(self, util.close_fds, (_parent_w, self.sentinel))
+            with open(w, 'wb', closefd=True) as f:
+                f.write(buf.getbuffer())
+            self.pid = forkserver.read_signed(self.sentinel)
+
+    class _WarmRunProcess(mp_context.ForkServerProcess):
+        @staticmethod
+        def _Popen(process_obj):
+            return _WarmRunPopen(process_obj)
+
+
+class WarmGpteRun:
+    """gpt-engineer forked from the warm zygote, streaming output over a pipe"""
+
+    def __init__(self, context, gpte_repo, project_dir, args, env):
+        # One connection carries output up and the run's stdin down
+        self._conn, child_conn = context.Pipe(duplex=True)
+        self._process = _WarmRunProcess(
+            target=_warm_gpte_main,
+            args=(child_conn, gpte_repo, project_dir, list(args), env),
+            daemon=True
+        )
+        self._process.start()
+        # Only the child should hold its end, so its exit shows up as EOF here
+        child_conn.close()
+        self.pid = self._process.pid
+        self._returncode = None
+        self._input_lock = threading.Lock()
+
+    def _read_chunk(self):
+        try:
+            kind, payload = self._conn.recv()
+        except (EOFError, OSError):
+            return b''
+        if kind == 'exit':
+            self._returncode = payload
+            return b''
+        return payload
+
+    def output_lines(self):
+        """Yield output lines (with line endings) until the run reports its exit code"""
+        yield from _split_output(self._read_chunk, self._conn.poll)
+
+    def write_input(self, text):
+        """Send a line to the run's stdin; False if it has stopped reading"""
+        with self._input_lock:
+            try:
+                self._conn.send(('in', text + '\n'))
+                return True
+            except (BrokenPipeError, EOFError, OSError):
+                return False
+
+    def wait(self):
+        self._process.join()
+        self._conn.close()
+        if self._returncode is not None:
+            return self._returncode
+        return self._process.exitcode
+
+    def kill(self):
+        # The child may not have called setsid yet, in which case only it can be killed
+        if not kill_process_group(self.pid):
+            self._process.kill()
+
+
+def _warm_gpte_main(conn, gpte_repo, project_dir, args, env):
+    """Entry point of a zygote child: run the gpt-engineer CLI as `python -m` would"""
+    os.setsid()
+
+    # Route everything written to fds 1 and 2, including output from any
+    # subprocesses gpt-engineer starts, through a pipe we relay to the parent
+    read_fd, write_fd = os.pipe()
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
+    sys.stdout = open(1, 'w', buffering=1, encoding='utf-8', errors='replace', closefd=False)
+    sys.stderr = open(2, 'w', buffering=1, encoding='utf-8', errors='replace', closefd=False)
+
+    # ... and feed fd 0 from what the parent sends down the same connection
+    stdin_read_fd, stdin_write_fd = os.pipe()
+    os.dup2(stdin_read_fd, 0)
+    os.close(stdin_read_fd)
+    sys.stdin = open(0, 'r', encoding='utf-8', errors='replace', closefd=False)
+
+    def relay_output():
+        while True:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            conn.send(('out', chunk))
+
+    def relay_input():
+        while True:
+            try:
+                kind, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            if kind == 'in':
+                os.write(stdin_write_fd, payload.encode('utf-8'))
+
+    relay = threading.Thread(target=relay_output, daemon=True)
+    relay.start()
+    threading.Thread(target=relay_input, daemon=True).start()
+
+    os.chdir(gpte_repo)
+    os.environ.clear()
+    os.environ.update(env)
+    if gpte_repo not in sys.path:
+        sys.path.insert(0, gpte_repo)
+    sys.argv = [GPTE_CLI_MODULE, project_dir] + args
+
+    return_code = 0
+    try:
+        # Dropping the preloaded copy lets runpy execute it as __main__ without
+        # a warning; everything it imports is already warm in sys.modules
+        sys.modules.pop(GPTE_CLI_MODULE, None)
+        runpy.run_module(GPTE_CLI_MODULE, run_name='__main__', alter_sys=True)
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            return_code = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            return_code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        return_code = 1
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    relay.join(timeout=5)
+    conn.send(('exit', return_code))
+    conn.close()
+
+
+def _warm_launch_supported():
+    """Whether this Python has the forkserver internals _WarmRunPopen._launch relies on"""
+    if popen_forkserver is None:
+        return False
+    oldest, newest = WARM_RUN_PYTHON_VERSIONS
+    if not oldest <= sys.version_info[:2] <= newest:
+        return False
+    return (all(hasattr(forkserver, name) for name in ('connect_to_new_process', 'read_signed', 'ensure_running'))
+            and all(hasattr(popen_forkserver, name) for name in ('set_spawning_popen', 'Popen'))
+            and hasattr(popen_forkserver.Popen, '_launch')
+            and hasattr(spawn, 'get_preparation_data') and hasattr(reduction, 'dump')
+            and hasattr(util, 'Finalize') and hasattr(util, 'close_fds'))
+
+
+def warm_runner_context(gpte_repo):
+    """Multiprocessing context whose forkserver has gpt-engineer preloaded, or None if unavailable"""
+    global _warm_context
+    if not os.path.isdir(os.path.join(gpte_repo, 'gpt_engineer')):
+        return None
+    if not _warm_launch_supported() or 'forkserver' not in multiprocessing.get_all_start_methods():
+        return None
+
+    with _warm_context_lock:
+        if _warm_context is None:
+            # The forkserver imports its preload list using our sys.path
+            if gpte_repo not in sys.path:
+                sys.path.append(gpte_repo)
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__, GPTE_CLI_MODULE])
+            forkserver.ensure_running()
+            print(f"Warm gpt-engineer runner started from {gpte_repo}")
+            _warm_context = context
+        return _warm_context
+
+
+def start_gpte_run(gpte_repo, project_dir, args, env, warm=True):
+    """Start gpt-engineer on a project, forking from the warm zygote when possible"""
+    if warm:
+        try:
+            context = warm_runner_context(gpte_repo)
+            if context is not None:
+                return WarmGpteRun(context, gpte_repo, project_dir, args, env)
+        except Exception as e:
+            print(f"Warm gpt-engineer runner unavailable, falling back to a subprocess: {e}")
+    return SubprocessGpteRun(gpte_repo, project_dir, args, env)
@@ -0,0 +1,633 @@
+"""Shared log tailing for the SSE log streams.
+
+Every followed log file gets one LogBroadcaster thread that reads new output
+once and pushes it to however many subscribers (browser streams) are
+attached. Subscribers join at the current end of the file, and the thread
+exits as soon as the last subscriber detaches, so a project with no viewers
+costs nothing.
+
+Every batch of output is identified by the byte offset it ends at, which the
+SSE endpoints send as the event id. A reconnecting stream passes back the
+last id it saw and is replayed just the output after it, from a bounded
+buffer of recent output or, failing that, from the file itself.
+
+The tailer never waits on a subscriber. Output a subscriber hasn't taken yet
+is merged into one pending batch, and once that batch outgrows
+LOG_SUBSCRIBER_BUFFER_BYTES it is dropped and just its byte range is kept.
+The subscriber then reads that range back from the file, a chunk at a time,
+when it's ready for more, so a slow client lags and catches up without
+holding output in memory or slowing anyone else.
+
+A SubscriptionGroup reads several subscriptions (say, the logs of a few
+projects plus their EventHub status events) as one stream of keyed events.
+
+On Linux the thread sleeps on inotify until the file is written, so new
+output is forwarded within milliseconds and an idle log costs nothing.
+Elsewhere (or if inotify can't be set up) it falls back to polling.
+"""
+
+import asyncio
+import codecs
+import collections
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+# Seconds between checks of the log file when inotify isn't available
+LOG_POLL_INTERVAL = 0.5
+# Bytes of recent output each broadcaster keeps for replaying to reconnecting streams
+LOG_REPLAY_BUFFER_BYTES = int(os.environ.get('LOG_REPLAY_BUFFER_BYTES', str(256 * 1024)))
+# Bytes of output held for a subscriber that hasn't taken it yet, and the most
+# a lagging subscriber reads back from the file at a time
+LOG_SUBSCRIBER_BUFFER_BYTES = int(os.environ.get('LOG_SUBSCRIBER_BUFFER_BYTES', str(64 * 1024)))
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+# Watching the directory rather than the file also catches the log being
+# created, replaced or deleted
+_LOG_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_libc = None
+_libc_lock = threading.Lock()
+
+
+def _inotify_libc():
+    """libc with the inotify functions, or None where they aren't available"""
+    global _libc
+    with _libc_lock:
+        if _libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                _libc = libc
+            except (OSError, AttributeError):
+                _libc = False
+        return _libc or None
+
+
+class FileChangeWaiter:
+    """Blocks until a file changes or wake() is called
+
+    Uses an inotify watch on the file's directory where possible and
+    otherwise just sleeps for LOG_POLL_INTERVAL, so callers re-check the
+    file after every wait either way.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._name = os.fsencode(os.path.basename(path))
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        self._inotify_fd = self._open_inotify(os.path.dirname(path))
+        self._event = threading.Event() if self._inotify_fd is None else None
+
+    @property
+    def uses_inotify(self):
+        return self._inotify_fd is not None
+
+    def _open_inotify(self, directory):
+        libc = _inotify_libc()
+        if libc is None:
+            return None
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(directory), _LOG_WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _log_changed(self):
+        # Drain the queued events, reporting whether any were for our file
+        changed = False
+        while True:
+            try:
+                data = os.read(self._inotify_fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset + _INOTIFY_EVENT_HEADER.size <= len(data):
+                _, _, _, name_length = _INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+                start = offset + _INOTIFY_EVENT_HEADER.size
+                if data[start:start + name_length].rstrip(b'\0') == self._name:
+                    changed = True
+                offset = start + name_length
+
+    def wait(self, timeout=None):
+        """Wait up to timeout seconds (None for no limit) for a change; True unless it timed out"""
+        if self._inotify_fd is None:
+            # Without inotify any wait may have missed a change, so always report one
+            self._event.wait(LOG_POLL_INTERVAL if timeout is None else min(timeout, LOG_POLL_INTERVAL))
+            self._event.clear()
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready, _, _ = select.select([self._inotify_fd, self._wake_read], [], [], remaining)
+            if not ready:
+                return False
+            if self._wake_read in ready:
+                try:
+                    os.read(self._wake_read, 4096)
+                except BlockingIOError:
+                    pass
+                return True
+            if self._log_changed():
+                return True
+
+    def wake(self):
+        if self._event is not None:
+            self._event.set()
+        else:
+            try:
+                os.write(self._wake_write, b'x')
+            except OSError:
+                pass
+
+    def close(self):
+        for fd in (self._inotify_fd, self._wake_read, self._wake_write):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+
+class LogSubscription:
+    """One subscriber's view of a LogBroadcaster
+
+    Events are ('data', offset, text) for new output ending at byte offset,
+    ('reset', 0, '') when the file was truncated or replaced, and
+    ('finished', state, '') once the project's job is over. Data events
+    ending at or before `offset` are replayed output the subscriber asked
+    for rather than new output.
+
+    Consecutive output waiting to be taken comes out as one data event, and
+    output beyond LOG_SUBSCRIBER_BUFFER_BYTES is read back from the file.
+    """
+
+    def __init__(self, broadcaster, offset, ready=None):
+        self.broadcaster = broadcaster
+        # Byte offset of the end of the log when the subscriber joined
+        self.offset = offset
+        # Waiting events, oldest first: ['data', start, end, text],
+        # ['behind', start, end] for output to read back from the file, and
+        # ['event', event] for anything else
+        self._pending = collections.deque()
+        # Signalled when an event is queued; shared by the members of a SubscriptionGroup
+        self._ready = ready or threading.Condition()
+        # True while the subscriber is being served output from the file
+        self.lagging = False
+        self.closed = False
+
+    def put(self, event, start=None):
+        """Queue an event; data events pass the byte offset their output starts at"""
+        with self._ready:
+            self._queue(event, start)
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrives within the timeout"""
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._pending, timeout):
+                return None
+            entry = self._pending.popleft()
+        if entry[0] != 'behind':
+            return self._event(entry)
+        # The file is read outside the lock so the tailer is never kept waiting
+        event, rest = self._read_behind(entry)
+        with self._ready:
+            if rest:
+                self._pending.appendleft(rest)
+            self.lagging = any(entry[0] == 'behind' for entry in self._pending)
+        return event
+
+    def close(self):
+        """Detach from the broadcaster; safe to call more than once"""
+        if not self.closed:
+            self.closed = True
+            self.broadcaster.unsubscribe(self)
+
+    def _queue(self, event, start):
+        # The broadcaster queues ('behind', end, '') for output to be read from the file
+        last = self._pending[-1] if self._pending else None
+        if event[0] in ('data', 'behind'):
+            kind, end, text = event
+            if last and last[0] in ('data', 'behind') and last[2] == start:
+                # Output following straight on from what is waiting joins it
+                last[2] = end
+                if last[0] == 'data' and kind == 'data':
+                    last[3] += text
+                elif last[0] == 'data':
+                    last[0:] = ['behind', last[1], end]
+            else:
+                last = ['data', start, end, text] if kind == 'data' else ['behind', start, end]
+                self._pending.append(last)
+            if last[0] == 'data' and last[2] - last[1] > LOG_SUBSCRIBER_BUFFER_BYTES:
+                # Too far behind: keep where the output is rather than the output
+                last[0:] = ['behind', last[1], last[2]]
+            self.lagging = self.lagging or last[0] == 'behind'
+            return
+        if event[0] == 'reset':
+            # Unsent output of the replaced file can't be read back any more
+            self._pending = collections.deque(entry for entry in self._pending if entry[0] != 'behind')
+            self.lagging = False
+        self._pending.append(['event', event])
+
+    def _event(self, entry):
+        if entry[0] == 'data':
+            return ('data', entry[2], entry[3])
+        return entry[1]
+
+    def _read_behind(self, entry):
+        # The next chunk of output the subscriber fell behind on, and what is left after it
+        _, start, end = entry
+        try:
+            with open(self.broadcaster.path, 'rb') as f:
+                f.seek(start)
+                data = f.read(min(end - start, LOG_SUBSCRIBER_BUFFER_BYTES))
+        except OSError:
+            data = b''
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        text = decoder.decode(data)
+        # A character cut off by the chunk size is read with the next chunk
+        read_end = start + len(data) - len(decoder.getstate()[0])
+        if not text:
+            # The file shrank under us, and a reset follows
+            return None, None
+        if read_end >= end or len(data) < min(end - start, LOG_SUBSCRIBER_BUFFER_BYTES):
+            return ('data', read_end, text), None
+        return ('data', read_end, text), ['behind', read_end, end]
+
+
+class AsyncLogSubscription(LogSubscription):
+    """A LogSubscription read from an asyncio event loop instead of a thread"""
+
+    def __init__(self, broadcaster, offset, loop, ready=None):
+        super().__init__(broadcaster, offset)
+        self._loop = loop
+        # Only touched from the loop, which is where events are queued
+        self._ready = ready or asyncio.Event()
+
+    def put(self, event, start=None):
+        # Called from the tailer thread, so hand the event over to the loop
+        try:
+            self._loop.call_soon_threadsafe(self._put, event, start)
+        except RuntimeError:
+            pass  # The loop has shut down
+
+    def _put(self, event, start):
+        self._queue(event, start)
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """Next event, or None if nothing arrives within the timeout"""
+        if not self._pending:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        entry = self._pending.popleft()
+        if entry[0] != 'behind':
+            return self._event(entry)
+        event, rest = await asyncio.to_thread(self._read_behind, entry)
+        if rest:
+            self._pending.appendleft(rest)
+        self.lagging = any(entry[0] == 'behind' for entry in self._pending)
+        return event
+
+
+class SubscriptionGroup:
+    """Several subscriptions read as one, each event paired with the key it was added under
+
+    Members must be created with the group's `ready` (and, for an asyncio
+    loop, the same loop). Closing the group closes them all.
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.ready = threading.Condition() if loop is None else asyncio.Event()
+        self._members = []
+        # Members are read round-robin so a busy log can't starve the others
+        self._next = 0
+        self.closed = False
+
+    def add(self, key, subscription):
+        self._members.append((key, subscription))
+        return subscription
+
+    def _pending(self):
+        return any(subscription._pending for _, subscription in self._members)
+
+    def _ready_members(self):
+        count = len(self._members)
+        for i in range(count):
+            key, subscription = self._members[(self._next + i) % count]
+            if subscription._pending:
+                self._next = (self._next + i + 1) % count
+                yield key, subscription
+
+    def get(self, timeout=None):
+        """Next (key, event), or None if nothing arrives within the timeout"""
+        if self.loop is not None:
+            return self._get_async(timeout)
+        with self.ready:
+            if not self.ready.wait_for(self._pending, timeout):
+                return None
+        for key, subscription in self._ready_members():
+            event = subscription.get(0)
+            if event is not None:
+                return key, event
+        return None
+
+    async def _get_async(self, timeout):
+        if not self._pending():
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        for key, subscription in self._ready_members():
+            event = await subscription.get(0)
+            if event is not None:
+                return key, event
+        return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            for _, subscription in self._members:
+                subscription.close()
+
+
+class EventHub:
+    """Fans out events that aren't log output, such as job status changes, to subscribers by key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, key, loop=None, ready=None):
+        if loop is None:
+            subscription = LogSubscription(self, 0, ready)
+        else:
+            subscription = AsyncLogSubscription(self, 0, loop, ready)
+        subscription.key = key
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.key, None)
+
+    def publish(self, key, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class LogBroadcaster:
+    """Tails one log file on a background thread and fans new output out to subscribers"""
+
+    def __init__(self, path, finished_state, on_idle=None, state_poll_interval=None):
+        self.path = path
+        # Callable returning None while the job is running, else its final state
+        self.finished_state = finished_state
+        self.on_idle = on_idle
+        # How often to re-check the job state when nothing wakes the tailer
+        self.state_poll_interval = state_poll_interval
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._waiter = None
+        # Bytes read so far, and the end of the last output sent (the two
+        # differ while a multi-byte character is split across reads)
+        self._offset = self._file_size()
+        self._sent_offset = self._offset
+        self._identity = self._file_identity()
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        # Recent (start, ('data', end, text)) output, oldest first, for replaying
+        self._history = collections.deque()
+        self._history_start = self._offset
+        self._history_bytes = 0
+        self._thread = None
+
+    def _file_size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _file_identity(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino)
+
+    def subscribe(self, since=None, loop=None, ready=None):
+        """Subscribe from the current end of the file, first replaying any output after byte offset since
+
+        Pass an asyncio loop to get an AsyncLogSubscription for use from that
+        loop, and a SubscriptionGroup's ready to add the subscription to it.
+        """
+        with self._lock:
+            if self._thread is None:
+                # Nobody was following the file, so start again from its current end
+                self._offset = self._file_size()
+                self._sent_offset = self._offset
+                self._identity = self._file_identity()
+                self._decoder.reset()
+                self._forget(self._offset)
+            if loop is None:
+                subscription = LogSubscription(self, self._sent_offset, ready)
+            else:
+                subscription = AsyncLogSubscription(self, self._sent_offset, loop, ready)
+            if since is not None:
+                # Queued under the lock so nothing read meanwhile is missed or sent twice
+                for start, event in self._replay(since):
+                    subscription.put(event, start)
+            self._subscribers.append(subscription)
+            if self._thread is None:
+                self._waiter = FileChangeWaiter(self.path)
+                self._thread = threading.Thread(target=self._run, name=f"log-tail-{os.path.basename(os.path.dirname(self.path))}")
+                self._thread.daemon = True
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+            waiter = self._waiter
+        if waiter is not None:
+            waiter.wake()
+
+    def notify(self):
+        """Wake the tailer early, e.g. when the project's job finished"""
+        with self._lock:
+            waiter = self._waiter
+        if waiter is not None:
+            waiter.wake()
+
+    def _replay(self, since):
+        # (start, event) pairs for the output between since and the end of what
+        # was last sent, from the history when it reaches back far enough and
+        # from the file otherwise
+        since = max(since, 0)
+        if since > self._sent_offset:
+            # The id came from an earlier, longer copy of the file
+            yield None, ('reset', 0, '')
+            since = 0
+        if since == self._sent_offset:
+            return
+        if since >= self._history_start:
+            entries = [(start, event) for start, event in self._history if event[1] > since]
+            # Ids are always event ends, so a resumed stream lines up with an event
+            if entries and entries[0][0] == since:
+                yield from entries
+                return
+        # The subscription reads the range back from the file itself, a chunk at a time
+        yield since, ('behind', self._sent_offset, '')
+
+    def _remember(self, start, event):
+        self._history.append((start, event))
+        self._history_bytes += event[1] - start
+        while self._history_bytes > LOG_REPLAY_BUFFER_BYTES and len(self._history) > 1:
+            start, event = self._history.popleft()
+            self._history_bytes -= event[1] - start
+            self._history_start = event[1]
+
+    def _forget(self, offset):
+        self._history.clear()
+        self._history_start = offset
+        self._history_bytes = 0
+
+    def _broadcast(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def _read_new_output(self):
+        # A replaced or truncated file is followed from its start again
+        identity = self._file_identity()
+        if identity is None:
+            return
+        if identity != self._identity or self._file_size() < self._offset:
+            replaced = self._identity is not None
+            with self._lock:
+                self._identity = identity
+                self._offset = 0
+                self._sent_offset = 0
+                self._decoder.reset()
+                self._forget(0)
+            if replaced:
+                self._broadcast(('reset', 0, ''))
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        if not data:
+            return
+        with self._lock:
+            self._offset += len(data)
+            text = self._decoder.decode(data)
+            if not text:
+                return
+            # Bytes of a character still split across reads are sent with the next read
+            start = self._sent_offset
+            self._sent_offset = self._offset - len(self._decoder.getstate()[0])
+            event = ('data', self._sent_offset, text)
+            self._remember(start, event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event, start)
+
+    def _run(self):
+        waiter = self._waiter
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Detach before exiting so a new subscriber starts a fresh thread
+                    self._thread = None
+                    self._waiter = None
+                    break
+            try:
+                # Check the job first so output written just before it finished is still sent
+                state = self.finished_state()
+                self._read_new_output()
+            except Exception as e:
+                print(f"Error tailing {self.path}: {e}")
+                state = None
+            if state is not None:
+                self._broadcast(('finished', state, ''))
+            waiter.wait(self.state_poll_interval)
+        waiter.close()
+        if self.on_idle:
+            self.on_idle(self)
+
+
+class LogBroadcasterRegistry:
+    """One LogBroadcaster per followed log file, dropped once nobody is watching"""
+
+    def __init__(self, state_poll_interval=None):
+        self.state_poll_interval = state_poll_interval
+        self._broadcasters = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, path, finished_state, since=None, loop=None, ready=None):
+        """Subscribe to a log file, starting its broadcaster if needed"""
+        path = os.path.abspath(path)
+        with self._lock:
+            broadcaster = self._broadcasters.get(path)
+            if broadcaster is None:
+                broadcaster = LogBroadcaster(path, finished_state, self._discard, self.state_poll_interval)
+                self._broadcasters[path] = broadcaster
+            return broadcaster.subscribe(since, loop, ready)
+
+    def notify(self, directory):
+        """Wake the broadcasters of every log under a directory"""
+        directory = os.path.abspath(directory) + os.sep
+        with self._lock:
+            broadcasters = [b for path, b in self._broadcasters.items() if path.startswith(directory)]
+        for broadcaster in broadcasters:
+            broadcaster.notify()
+
+    def stats(self):
+        with self._lock:
+            broadcasters = list(self._broadcasters.items())
+        stats = {}
+        for path, broadcaster in broadcasters:
+            with broadcaster._lock:
+                subscribers = list(broadcaster._subscribers)
+            stats[path] = {"subscribers": len(subscribers),
+                           "lagging": sum(subscription.lagging for subscription in subscribers)}
+        return stats
+
+    def _discard(self, broadcaster):
+        with self._lock:
+            # A subscriber that arrived after the thread decided to stop has
+            # already restarted it, in which case the broadcaster stays
+            if self._broadcasters.get(broadcaster.path) is broadcaster and broadcaster._thread is None:
+                del self._broadcasters[broadcaster.path]
@@ -0,0 +1,147 @@
+"""Turns gpt-engineer log output into typed progress events.
+
+LogEventParser is fed the raw text of a log as it arrives, in whatever
+chunks the tailer reads, and classifies each complete line against a table
+of compiled patterns. It produces plain dicts the SSE endpoints send to the
+browser as they are, so clients no longer need to pick through the raw log:
+
+    {'type': 'phase', 'phase': 'step_2', 'label': ..., 'progress': 40}
+    {'type': 'file_written', 'path': 'index.html', 'line': ...}
+    {'type': 'api_error', 'line': ...}
+    {'type': 'prompt', 'line': ...}           gpt-engineer is waiting for input
+    {'type': 'model', 'model': 'gpt-4o'}
+    {'type': 'output', 'text': ...}           anything else worth showing
+    {'type': 'complete', 'state': 'completed', 'progress': 100}
+
+Progress only moves forward and is derived from the phase the run has
+reached, not from how much output it has produced. When a batch of output
+spans several phases, latest_phase_only() keeps just the last of them.
+"""
+
+import re
+
+# OpenAI failures in a run's output, including the client's rate limit errors
+OPENAI_API_ERROR_PATTERN = re.compile(r'OpenAI API.*error|RateLimitError|rate limit', re.IGNORECASE)
+
+# gpt-engineer asking a yes/no question; these lines usually have no newline yet
+PROMPT_PATTERN = re.compile(r'\(Y/n\)|\(y/N\)|\[y/n\]', re.IGNORECASE)
+
+# Lines echoing the user's own instructions aren't shown back to them
+PRIVATE_PATTERN = re.compile(r'prompt|user input|instruction', re.IGNORECASE)
+
+# Line classes in match order; the first pattern that matches a line wins
+LINE_PATTERNS = [
+    ('prompt', PROMPT_PATTERN),
+    ('api_error', OPENAI_API_ERROR_PATTERN),
+    ('model', re.compile(r'Using model:\s*(?P<model>.+)')),
+    ('step', re.compile(r'Step\s+(?P<step>\d+)\s*:\s*(?P<detail>.*)')),
+    ('file_written', re.compile(r'(?:Overwriting|Creating) file:?\s*(?P<path>\S*)')),
+    ('entrypoint', re.compile(r'npx http-server|Running http-server')),
+    ('private', PRIVATE_PATTERN),
+    ('debug', re.compile(r'^(?:DEBUG|INFO)\b(?!.*\])')),
+]
+
+# Leading "[timestamp] LEVEL ]" style prefixes stripped from displayed lines
+LOG_PREFIX_PATTERN = re.compile(r'^.*\]\s*')
+
+PHASE_PROGRESS = {
+    'starting': 10,
+    'step_1': 20,
+    'step_2': 40,
+    'step_3': 60,
+    'step_4': 80,
+    'writing_files': 90,
+    'running_entrypoint': 95,
+    'complete': 100,
+}
+PHASE_LABELS = {
+    'starting': 'Starting gpt-engineer...',
+    'writing_files': 'Writing game files...',
+    'running_entrypoint': 'Starting the game...',
+    'complete': 'Generation complete',
+}
+
+
+def latest_phase_only(events):
+    """events without the phase changes a later one in the same batch supersedes"""
+    phases = [event for event in events if event['type'] == 'phase']
+    return [event for event in events if event['type'] != 'phase' or event is phases[-1]]
+
+
+class LogEventParser:
+    """Incremental classifier for one log, keeping partial lines between chunks"""
+
+    def __init__(self):
+        self.phase = 'starting'
+        self.progress = PHASE_PROGRESS['starting']
+        self._partial = ''
+        # Set once a prompt was reported from an unfinished line, so it isn't reported twice
+        self._partial_prompted = False
+
+    def feed(self, text):
+        """Events for the complete lines in text, plus any prompt left waiting on the last partial line"""
+        events = []
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            events.extend(self._classify(line.rstrip('\r'), self._partial_prompted))
+            self._partial_prompted = False
+        if not self._partial_prompted and PROMPT_PATTERN.search(self._partial):
+            self._partial_prompted = True
+            events.append({'type': 'prompt', 'line': self._partial.strip()})
+        return events
+
+    def finish(self, state):
+        """Events for whatever is left of the log once the job ended in the given state"""
+        events = []
+        if self._partial:
+            events.extend(self._classify(self._partial.rstrip('\r'), self._partial_prompted))
+            self._partial = ''
+            self._partial_prompted = False
+        if state in ('completed', None):
+            events.extend(self._enter_phase('complete'))
+        events.append({'type': 'complete', 'state': state or 'completed', 'progress': self.progress})
+        return events
+
+    def reset(self):
+        """Start over, e.g. after the log file was replaced"""
+        self.__init__()
+
+    def _enter_phase(self, phase, label=None):
+        if phase == self.phase:
+            return []
+        self.phase = phase
+        self.progress = max(self.progress, PHASE_PROGRESS.get(phase, PHASE_PROGRESS['step_4']))
+        return [{'type': 'phase', 'phase': phase, 'label': label or PHASE_LABELS.get(phase, phase), 'progress': self.progress}]
+
+    def _classify(self, line, prompted):
+        text = line.strip()
+        if not text:
+            return []
+        for kind, pattern in LINE_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                break
+        else:
+            kind, match = 'output', None
+
+        if kind == 'prompt':
+            return [] if prompted else [{'type': 'prompt', 'line': text}]
+        if kind == 'api_error':
+            return [{'type': 'api_error', 'line': text}]
+        if kind == 'model':
+            return [{'type': 'model', 'model': match.group('model').strip()}]
+        if kind == 'step':
+            step, detail = match.group('step'), match.group('detail').strip()
+            if PRIVATE_PATTERN.search(detail):
+                detail = ''
+            label = f"Step {step}: {detail}" if detail else f"Step {step}"
+            return self._enter_phase(f'step_{step}', label)
+        if kind == 'file_written':
+            return self._enter_phase('writing_files') + [{'type': 'file_written', 'path': match.group('path'), 'line': text}]
+        if kind == 'entrypoint':
+            return self._enter_phase('running_entrypoint')
+        if kind in ('private', 'debug'):
+            return []
+        text = LOG_PREFIX_PATTERN.sub('', text)
+        return [{'type': 'output', 'text': text}] if text else []
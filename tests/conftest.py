@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# app.py reads its configuration when it is imported, so point its job
+# database and asset store at a scratch directory first
+_scratch = tempfile.mkdtemp(prefix='gpte-tests-')
+os.environ.setdefault('GPTE_JOB_DB', os.path.join(_scratch, 'jobs.sqlite3'))
+os.environ.setdefault('ASSET_STORE_DIR', os.path.join(_scratch, 'asset_store'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,25 @@
+import os
+
+from asset_store import AssetStore, PublishedDirectory
+
+
+def blob_count(store):
+    return sum(len(os.listdir(os.path.join(store.root, prefix))) for prefix in os.listdir(store.root) if len(prefix) == 2)
+
+
+def test_sweep_removes_blobs_only_pruned_versions_used(tmp_path):
+    store = AssetStore(str(tmp_path / 'store'))
+    published = PublishedDirectory(str(tmp_path / 'assets'), str(tmp_path / 'versions'), store)
+    for i in range(4):
+        with published.publish() as staging:
+            store.publish_bytes(f"game {i}", os.path.join(staging, 'game.js'))
+            store.publish_bytes("shared", os.path.join(staging, 'index.html'))
+
+    # Publishing sweeps with a grace period, so the fresh blobs are all still there
+    assert blob_count(store) == 5
+    assert store.sweep(grace=0) == 2
+    # What the current and previous versions link to is kept
+    assert blob_count(store) == 3
+    assert open(tmp_path / 'assets' / 'game.js').read() == "game 3"
+    published.rollback()
+    assert open(tmp_path / 'assets' / 'game.js').read() == "game 2"
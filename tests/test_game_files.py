@@ -0,0 +1,23 @@
+import os
+
+import app
+
+
+def test_deleted_workspace_file_is_not_served_from_a_stale_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'BASE_PROJECT_DIR', str(tmp_path))
+    generated = tmp_path / 'stale-table' / 'workspace' / 'generated'
+    generated.mkdir(parents=True)
+    (generated / 'index.html').write_text('<html></html>')
+    (generated / 'extra.js').write_text('console.log(1);')
+    client = app.app.test_client()
+
+    response = client.get('/play/stale-table/extra.js')
+    assert response.status_code == 200
+    response.close()
+
+    os.remove(generated / 'extra.js')
+    assert client.get('/play/stale-table/extra.js').status_code == 404
+    # The rest of the game is still served once the table has been dropped
+    response = client.get('/play/stale-table/index.html')
+    assert response.status_code == 200
+    response.close()
@@ -0,0 +1,30 @@
+import threading
+import time
+
+import pytest
+
+import app
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_queue_fills_while_a_class_cap_holds_jobs_back():
+    release = threading.Event()
+    target = lambda job: release.wait(5)
+    queue = app.GenerationJobQueue(2, 3, {'batch': 1})
+    try:
+        queue.submit('generate', 'depth-0', target)
+        wait_for(lambda: queue.stats()['running'] == 1)
+        for i in range(1, 4):
+            queue.submit('generate', f"depth-{i}", target)
+        # The batch cap keeps these waiting with a worker still free
+        assert queue.stats()['running'] == 1
+        with pytest.raises(app.QueueFullError):
+            queue.submit('generate', 'depth-overflow', target)
+    finally:
+        release.set()
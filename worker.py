@@ -0,0 +1,78 @@
+"""Generation worker: runs gpt-engineer jobs recorded by web nodes in broker mode.
+
+Start web nodes with GPTE_DISPATCH=broker and run `python worker.py` on each
+generation machine. Web nodes and workers must share BASE_PROJECT_DIR, the
+static folder and the job store (GPTE_JOB_DB); each worker claims jobs from
+the store, runs them on its own pool of GPTE_MAX_WORKERS threads and writes
+their state, logs and published game files back to the shared paths.
+
+Give every worker on a machine a distinct GPTE_WORKER_NAME (default: the
+host name), since a restarted worker settles the jobs left under its name.
+"""
+
+import os
+import socket
+import time
+
+from app import (GPTE_CLASS_CONCURRENCY, GPTE_MAX_WORKERS, GPTE_QUEUE_TIMEOUT, JOB_RUNNERS,
+                 GenerationJob, GenerationJobQueue, job_store, openai_budget, reconcile_interrupted_jobs)
+
+GPTE_WORKER_NAME = os.environ.get('GPTE_WORKER_NAME', socket.gethostname())
+# Seconds between checks of the broker for new jobs, cancellations and prompt answers
+GPTE_WORKER_POLL_INTERVAL = float(os.environ.get('GPTE_WORKER_POLL_INTERVAL', '2'))
+
+
+def claim_next_job(worker_name):
+    """Claim the highest priority unclaimed job this worker can run, or return None"""
+    now = time.time()
+    candidates = sorted(
+        (GenerationJob.from_record(record) for record in job_store.unclaimed()),
+        key=lambda job: (job.effective_rank(now), job.created_at)
+    )
+    for candidate in candidates:
+        if candidate.kind not in JOB_RUNNERS:
+            continue
+        record = job_store.claim(candidate.id, worker_name)
+        if record:
+            return record
+    return None
+
+
+def run_worker(worker_name=GPTE_WORKER_NAME):
+    """Claim and run jobs from the broker until interrupted"""
+    # Claimed jobs only wait for one of this worker's own threads, and the
+    # OpenAI budget covers this worker's runs only
+    queue = GenerationJobQueue(GPTE_MAX_WORKERS, GPTE_MAX_WORKERS, GPTE_CLASS_CONCURRENCY, job_store, openai_budget)
+    reconcile_interrupted_jobs(worker_name)
+    print(f"Worker {worker_name} running up to {GPTE_MAX_WORKERS} gpt-engineer jobs")
+
+    while True:
+        for job_id in job_store.cancel_requests(worker_name):
+            job = queue.get(job_id)
+            if job and not job.stopped:
+                queue.cancel(job_id)
+
+        # Answers to gpt-engineer prompts sent through a web node
+        for job_id, lines in job_store.take_input_requests(worker_name):
+            for line in lines:
+                queue.send_input(job_id, line)
+
+        if GPTE_QUEUE_TIMEOUT:
+            job_store.expire_unclaimed(time.time() - GPTE_QUEUE_TIMEOUT,
+                                       f"Timed out waiting {GPTE_QUEUE_TIMEOUT} seconds for a worker")
+
+        while queue.idle_slots():
+            record = claim_next_job(worker_name)
+            if record is None:
+                break
+            print(f"Worker {worker_name} claimed {record['kind']} job {record['id']} for project {record['project']}")
+            queue.restore(record, JOB_RUNNERS[record['kind']])
+
+        time.sleep(GPTE_WORKER_POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    try:
+        run_worker()
+    except KeyboardInterrupt:
+        print(f"Worker {GPTE_WORKER_NAME} stopped")